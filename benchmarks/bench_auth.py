@@ -0,0 +1,61 @@
+"""Per-request authentication overhead: full HS256 verification vs the verified-token cache.
+
+    python benchmarks/bench_auth.py --iterations 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import load_service, sqlite_url  # noqa: E402
+
+
+def per_call_us(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return round((time.perf_counter() - started) / iterations * 1e6, 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = {}
+    for cache_size in ("0", "10000"):
+        module = load_service("reservation_service", {
+            "DATABASE_URL": sqlite_url("reservation.db"),
+            "SCHEDULE_SERVICE_URL": "http://127.0.0.1:9",
+            "SCHEDULE_RETRIES": "0",
+            "AUTH_CACHE_SIZE": cache_size,
+        })
+        app = module.create_app()
+        auth = app.extensions["token_auth"]
+        token = auth.issue("user", "USER")
+        client = app.test_client()
+        headers = {"Authorization": f"Bearer {token}"}
+        label = "cached" if cache_size != "0" else "uncached"
+
+        if cache_size == "0":
+            secret = app.config["JWT_SECRET"]
+            results["jwt_decode_us"] = per_call_us(
+                lambda: jwt.decode(token, secret, algorithms=["HS256"]), args.iterations
+            )
+        with app.app_context():
+            results[f"verify_{label}_us"] = per_call_us(lambda: auth.verify(token), args.iterations)
+        # An authenticated request that fails fast after auth (unknown id)
+        results[f"request_{label}_us"] = per_call_us(
+            lambda: client.get("/reservations/0", headers=headers), max(1, args.iterations // 10)
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
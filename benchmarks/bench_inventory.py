@@ -0,0 +1,103 @@
+"""Allocations per second on a single hot trip: row-lock path vs inventory engine.
+
+    python benchmarks/bench_inventory.py --threads 32 --requests 4000
+
+Runs the schedule service in-process against a throwaway SQLite file by
+default; pass --database-url to point it at a local MySQL instead.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import load_service  # noqa: E402
+
+
+def run(mode: str, database_url: str, threads: int, total: int) -> dict:
+    # Each run gets a fresh copy of the service modules
+    module = load_service("bus_schedule_service", {
+        "DATABASE_URL": database_url,
+        "SEAT_INVENTORY_ENGINE": "1" if mode == "engine" else "0",
+    })
+    db, Route, Trip = module.db, module.Route, module.Trip
+
+    app = module.create_app()
+    with app.app_context():
+        route = Route.query.first()
+        trip = Trip(
+            route_id=route.id,
+            departure_time=datetime.utcnow() + timedelta(days=1),
+            seats_total=total,
+            seats_available=total,
+        )
+        db.session.add(trip)
+        db.session.commit()
+        trip_id = trip.id
+
+    per_thread = total // threads
+    errors = []
+    barrier = threading.Barrier(threads + 1)
+
+    def worker() -> None:
+        client = app.test_client()
+        barrier.wait()
+        for _ in range(per_thread):
+            resp = client.post(f"/trips/{trip_id}/allocate", json={"count": 1})
+            if resp.status_code != 200:
+                errors.append(resp.status_code)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    inventory = app.extensions.get("seat_inventory")
+    if inventory is not None:
+        inventory.stop()
+    with app.app_context():
+        remaining = db.session.get(Trip, trip_id).seats_available
+        db.engine.dispose()
+
+    done = per_thread * threads
+    return {
+        "mode": mode,
+        "threads": threads,
+        "requests": done,
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "allocations_per_second": round((done - len(errors)) / elapsed, 1),
+        # SQLite ignores FOR UPDATE, so the lock path can lose updates there
+        "consistent": remaining == total - (done - len(errors)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--mode", choices=["lock", "engine", "both"], default="both")
+    args = parser.parse_args()
+
+    results = []
+    for mode in (["lock", "engine"] if args.mode == "both" else [args.mode]):
+        url = args.database_url
+        if url is None:
+            path = os.path.join(tempfile.mkdtemp(prefix="bench-inventory-"), "schedule.db")
+            url = f"sqlite:///{path}?timeout=30"
+        results.append(run(mode, url, args.threads, args.requests))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
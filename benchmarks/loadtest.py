@@ -0,0 +1,423 @@
+"""Load test for the booking flow: search, login, book and cancel.
+
+    # both services in-process on throwaway SQLite files
+    python benchmarks/loadtest.py --mix search=70,login=10,book=15,cancel=5 --concurrency 16 --duration 20
+
+    # reservation service only, schedule service replaced by an in-memory stand-in
+    python benchmarks/loadtest.py --schedule stub --mix login=20,book=60,cancel=20
+
+    # flash sale on one trip with admission control on (429s show up in "statuses")
+    python benchmarks/loadtest.py --schedule stub --mix book=100 --distribution hot --hot-fraction 1 \
+        --concurrency 64 --admission
+
+    # running deployment, hot-trip skew, compare against a saved baseline
+    python benchmarks/loadtest.py --target http --distribution hot --hot-fraction 0.9 \\
+        --output results.json --compare baseline.json
+
+Reports requests/s and p50/p95/p99 latency per operation and saves them as JSON.
+"""
+import argparse
+import bisect
+import importlib
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = os.path.join(ROOT, "services")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standins import InProcessScheduleClient, StubScheduleClient  # noqa: E402
+
+BENCH_ORIGIN = "Bench Origin"
+BENCH_DESTINATION = "Bench Destination"
+USERS = [("user", "User@123"), ("admin", "Admin@123")]
+
+
+# Service loading
+
+
+def _service_modules() -> set:
+    names = set()
+    for service in ("bus_schedule_service", "reservation_service"):
+        for filename in os.listdir(os.path.join(SERVICES, service)):
+            if filename.endswith(".py"):
+                names.add(filename[:-3])
+    return names
+
+
+def load_service(service: str, env: Dict[str, str]) -> Any:
+    # Both services use flat module names (app, models, ...), so each one is
+    # imported in isolation and detached from sys.modules afterwards.
+    names = _service_modules()
+    for name in names:
+        sys.modules.pop(name, None)
+    path = os.path.join(SERVICES, service)
+    os.environ.update(env)
+    sys.path.insert(0, path)
+    try:
+        return importlib.import_module("app")
+    finally:
+        sys.path.remove(path)
+        for name in names:
+            sys.modules.pop(name, None)
+
+
+def sqlite_url(name: str) -> str:
+    return f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='loadtest-'), name)}?timeout=30"
+
+
+# Targets: one call() signature whether the service is in-process or remote
+
+
+class HttpTarget:
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url.rstrip("/")
+        self._local = threading.local()
+
+    def call(self, method: str, path: str, **kwargs: Any) -> Tuple[int, Any]:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        resp = session.request(method, f"{self.base_url}{path}", timeout=30, **kwargs)
+        try:
+            return resp.status_code, resp.json()
+        except ValueError:
+            return resp.status_code, None
+
+
+class AppTarget:
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self._local = threading.local()
+
+    def call(self, method: str, path: str, **kwargs: Any) -> Tuple[int, Any]:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        resp = client.open(
+            path,
+            method=method,
+            query_string=kwargs.get("params"),
+            json=kwargs.get("json"),
+            headers=kwargs.get("headers"),
+        )
+        return resp.status_code, resp.get_json(silent=True)
+
+
+# Key distributions
+
+
+class KeyChooser:
+    def __init__(self, keys: Sequence[Any], distribution: str, hot_fraction: float, hot_keys: int, zipf_s: float) -> None:
+        if not keys:
+            raise SystemExit("no keys to choose from; is the target seeded?")
+        self.keys = list(keys)
+        self.distribution = distribution
+        self.hot_fraction = hot_fraction
+        self.hot_keys = max(1, min(hot_keys, len(self.keys)))
+        weights = [1.0 / (rank ** zipf_s) for rank in range(1, len(self.keys) + 1)]
+        self._cumulative = list(itertools.accumulate(weights))
+
+    def choose(self, rng: random.Random) -> Any:
+        if self.distribution == "hot":
+            if rng.random() < self.hot_fraction:
+                return self.keys[rng.randrange(self.hot_keys)]
+            return self.keys[rng.randrange(len(self.keys))]
+        if self.distribution == "zipf":
+            point = rng.random() * self._cumulative[-1]
+            return self.keys[bisect.bisect_left(self._cumulative, point)]
+        return self.keys[rng.randrange(len(self.keys))]
+
+
+# Scenario state shared by the workers
+
+
+class Workload:
+    def __init__(self, schedule: Any, reservation: Any, args: argparse.Namespace) -> None:
+        self.schedule = schedule
+        self.reservation = reservation
+        self.args = args
+        self.tokens: List[str] = []
+        self.search_keys: List[Tuple[str, str, str]] = []
+        self.trip_ids: List[int] = []
+        self.booked: List[Tuple[str, int]] = []
+        self.booked_lock = threading.Lock()
+
+    def setup(self, stub: Optional[StubScheduleClient]) -> None:
+        today = date.today()
+        if stub is not None:
+            self.trip_ids = list(range(1, self.args.trips + 1))
+            for trip_id in self.trip_ids:
+                stub.add_trip(trip_id, self.args.seats_per_trip)
+        else:
+            status, route = self.schedule.call(
+                "POST", "/routes", json={"origin": BENCH_ORIGIN, "destination": BENCH_DESTINATION}
+            )
+            if status != 201:
+                raise SystemExit(f"could not create benchmark route: {status} {route}")
+            start = datetime.combine(today, datetime.min.time()) + timedelta(hours=1)
+            for i in range(self.args.trips):
+                status, trip = self.schedule.call(
+                    "POST",
+                    "/trips",
+                    json={
+                        "route_id": route["id"],
+                        "departure_time": (start + timedelta(minutes=i)).isoformat(),
+                        "seats_total": self.args.seats_per_trip,
+                    },
+                )
+                self.trip_ids.append(trip["id"])
+            status, routes = self.schedule.call("GET", "/routes")
+            for days in range(self.args.search_days):
+                day = (today + timedelta(days=days)).isoformat()
+                self.search_keys.extend((r["origin"], r["destination"], day) for r in routes or [])
+            # The benchmark route comes first so skewed distributions hit it
+            self.search_keys.insert(0, (BENCH_ORIGIN, BENCH_DESTINATION, today.isoformat()))
+        if self.reservation is not None:
+            for username, password in USERS:
+                status, body = self.reservation.call("POST", "/auth/login", json={"username": username, "password": password})
+                if status == 200:
+                    self.tokens.append(body["token"])
+            if not self.tokens:
+                raise SystemExit("could not log in to the reservation service")
+
+    def operations(self, rng: random.Random) -> Dict[str, Callable[[], int]]:
+        a = self.args
+        trips = KeyChooser(self.trip_ids, a.distribution, a.hot_fraction, a.hot_keys, a.zipf_s) if self.trip_ids else None
+        searches = KeyChooser(self.search_keys, a.distribution, a.hot_fraction, a.hot_keys, a.zipf_s) if self.search_keys else None
+
+        def search() -> int:
+            origin, destination, day = searches.choose(rng)
+            status, _ = self.schedule.call(
+                "GET", "/trips/search", params={"origin": origin, "destination": destination, "date": day}
+            )
+            return status
+
+        def login() -> int:
+            username, password = USERS[rng.randrange(len(USERS))]
+            status, _ = self.reservation.call("POST", "/auth/login", json={"username": username, "password": password})
+            return status
+
+        def book() -> int:
+            token = self.tokens[rng.randrange(len(self.tokens))]
+            status, body = self.reservation.call(
+                "POST",
+                "/reservations",
+                json={"trip_id": trips.choose(rng), "passenger_name": "Load Test", "seats": a.seats},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            if status == 201:
+                with self.booked_lock:
+                    self.booked.append((token, body["id"]))
+            return status
+
+        def cancel() -> int:
+            with self.booked_lock:
+                item = self.booked.pop(rng.randrange(len(self.booked))) if self.booked else None
+            if item is None:
+                return book()
+            token, reservation_id = item
+            status, _ = self.reservation.call(
+                "POST", f"/reservations/{reservation_id}/cancel", headers={"Authorization": f"Bearer {token}"}
+            )
+            return status
+
+        return {"search": search, "login": login, "book": book, "cancel": cancel}
+
+
+# Driver and report
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: List[Tuple[float, int]], elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latency for latency, _status in samples)
+    statuses: Dict[str, int] = {}
+    for _latency, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "4")))
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def run(workload: Workload, mix: Dict[str, int], args: argparse.Namespace) -> Dict[str, Any]:
+    names = list(mix)
+    cumulative = list(itertools.accumulate(mix[name] for name in names))
+    samples: Dict[str, List[Tuple[float, int]]] = {name: [] for name in names}
+    budget = itertools.count()
+    barrier = threading.Barrier(args.concurrency + 1)
+    deadline = [0.0]
+
+    def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        ops = workload.operations(rng)
+        local: Dict[str, List[Tuple[float, int]]] = {name: [] for name in names}
+        barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            if args.requests and next(budget) >= args.requests:
+                break
+            name = names[bisect.bisect_right(cumulative, rng.random() * cumulative[-1])]
+            started = time.perf_counter()
+            try:
+                status = ops[name]()
+            except Exception:
+                status = 599
+            local[name].append((time.perf_counter() - started, status))
+        for name in names:
+            samples[name].extend(local[name])
+
+    threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    deadline[0] = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    barrier.wait()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    report = {name: summarize(samples[name], elapsed) for name in names}
+    report["total"] = summarize([s for name in names for s in samples[name]], elapsed)
+    return report
+
+
+def compare(results: Dict[str, Any], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path) as fh:
+        baseline = json.load(fh)["operations"]
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if before["p95_ms"] and current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+        if before["rps"] and current["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {before['rps']} -> {current['rps']}")
+    return regressions
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("search", "login", "book", "cancel"):
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument("--target", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--schedule", choices=["inprocess", "stub"], default="inprocess",
+                        help="in-process mode: real schedule service or an in-memory stand-in")
+    parser.add_argument("--schedule-url", default="http://localhost:5001")
+    parser.add_argument("--reservation-url", default="http://localhost:5002")
+    parser.add_argument("--schedule-database-url", default=None, help="default: temporary SQLite file")
+    parser.add_argument("--reservation-database-url", default=None, help="default: temporary SQLite file")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("search=70,login=10,book=15,cancel=5"))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0: duration only)")
+    parser.add_argument("--distribution", choices=["uniform", "zipf", "hot"], default="uniform")
+    parser.add_argument("--hot-fraction", type=float, default=0.9, help="hot: share of requests sent to the hot keys")
+    parser.add_argument("--hot-keys", type=int, default=1, help="hot: number of hot keys")
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--trips", type=int, default=20, help="benchmark trips to create")
+    parser.add_argument("--seats-per-trip", type=int, default=100000)
+    parser.add_argument("--seats", type=int, default=1, help="seats per booking")
+    parser.add_argument("--search-days", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--admission", action="store_true",
+                        help="in-process: keep the reservation service's admission control on")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    needs_schedule = "search" in args.mix or args.schedule == "inprocess" or args.target == "http"
+    needs_reservation = any(name in args.mix for name in ("login", "book", "cancel"))
+    stub = None
+    schedule = reservation = None
+
+    if args.target == "http":
+        schedule = HttpTarget(args.schedule_url)
+        reservation = HttpTarget(args.reservation_url) if needs_reservation else None
+    else:
+        if args.schedule == "stub" and "search" in args.mix:
+            parser.error("--schedule stub cannot serve search; drop it from --mix")
+        schedule_client = None
+        if args.schedule == "inprocess" and needs_schedule:
+            module = load_service("bus_schedule_service", {
+                "DATABASE_URL": args.schedule_database_url or sqlite_url("schedule.db"),
+            })
+            schedule_app = module.create_app()
+            schedule = AppTarget(schedule_app)
+            schedule_client = InProcessScheduleClient(schedule_app)
+        else:
+            stub = schedule_client = StubScheduleClient()
+        if needs_reservation:
+            module = load_service("reservation_service", {
+                "DATABASE_URL": args.reservation_database_url or sqlite_url("reservation.db"),
+                # A handful of benchmark users would mostly measure the per-user limit
+                "ADMISSION_CONTROL": "1" if args.admission else "0",
+            })
+            reservation = AppTarget(module.create_app(schedule_client=schedule_client))
+
+    workload = Workload(schedule, reservation, args)
+    workload.setup(stub)
+    operations = run(workload, args.mix, args)
+
+    result = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "operations": operations,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(result, fh, indent=2)
+    if args.compare:
+        regressions = compare(operations, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
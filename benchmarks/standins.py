@@ -0,0 +1,179 @@
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+# Stand-ins for the reservation service's ScheduleClient, so the reservation
+# service can be driven without a schedule service on the network.
+
+
+class StubResponse:
+    def __init__(self, status_code: int, payload: Any) -> None:
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self) -> Any:
+        return self._payload
+
+
+class StubScheduleClient:
+    # Pure in-memory seat counters; answers in microseconds so the numbers
+    # measure the reservation service alone.
+
+    def __init__(self, trips: Optional[Dict[int, int]] = None) -> None:
+        self.trips: Dict[int, List[int]] = {tid: [seats, seats] for tid, seats in (trips or {}).items()}
+        self.holds: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add_trip(self, trip_id: int, seats: int) -> None:
+        with self._lock:
+            self.trips[trip_id] = [seats, seats]
+
+    def search(self, origin: str, destination: str, date: str) -> StubResponse:
+        return StubResponse(200, [])
+
+    def get_trips(self, trip_ids: List[int]) -> StubResponse:
+        with self._lock:
+            held: Dict[int, int] = {}
+            for hold in self.holds.values():
+                if hold["status"] == "HELD":
+                    held[hold["trip_id"]] = held.get(hold["trip_id"], 0) + hold["count"]
+            return StubResponse(200, [
+                {
+                    "id": tid,
+                    "seats_total": self.trips[tid][0],
+                    "seats_available": self.trips[tid][1],
+                    "seats_held": held.get(tid, 0),
+                }
+                for tid in trip_ids
+                if tid in self.trips
+            ])
+
+    # Seat numbers are accepted but not modelled: only counters move
+    def allocate(
+        self, trip_id: int, count: int, seats: Optional[List[int]] = None, adjacent: bool = False
+    ) -> StubResponse:
+        return self.allocate_batch([{"trip_id": trip_id, "count": count}], single=True)
+
+    def release(self, trip_id: int, count: int, seats: Optional[List[int]] = None) -> StubResponse:
+        return self.release_batch([{"trip_id": trip_id, "count": count}], single=True)
+
+    def hold(
+        self, trip_id: int, count: int, ttl_seconds: Optional[int] = None, owner: Optional[str] = None
+    ) -> StubResponse:
+        resp = self.allocate(trip_id, count)
+        if resp.status_code != 200:
+            return resp
+        hold = {"hold_id": uuid.uuid4().hex, "trip_id": trip_id, "count": count, "owner": owner, "status": "HELD"}
+        with self._lock:
+            self.holds[hold["hold_id"]] = dict(hold, expires=time.time() + (ttl_seconds or 300))
+        return StubResponse(201, hold)
+
+    def confirm_hold(self, hold_id: str, owner: Optional[str] = None) -> StubResponse:
+        return self._close_hold(hold_id, "CONFIRMED", owner)
+
+    def release_hold(self, hold_id: str, owner: Optional[str] = None) -> StubResponse:
+        resp = self._close_hold(hold_id, "RELEASED", owner)
+        if resp.status_code == 200:
+            self.release(resp.json()["trip_id"], resp.json()["count"])
+        return resp
+
+    def _close_hold(self, hold_id: str, status: str, owner: Optional[str]) -> StubResponse:
+        # Expiry is checked lazily; nothing sweeps the stub
+        with self._lock:
+            hold = self.holds.get(hold_id)
+            if hold is None or (owner is not None and hold["owner"] != owner):
+                return StubResponse(404, {"error": "hold not found"})
+            if hold["status"] != "HELD" or hold["expires"] <= time.time():
+                return StubResponse(410, {"error": "hold_expired", "hold_id": hold_id})
+            hold["status"] = status
+            return StubResponse(200, {k: v for k, v in hold.items() if k != "expires"})
+
+    def allocate_batch(self, items: List[Dict[str, Any]], single: bool = False) -> StubResponse:
+        with self._lock:
+            for item in items:
+                trip = self.trips.get(item["trip_id"])
+                if trip is None:
+                    return StubResponse(404, {"error": "trip not found", "trip_ids": [item["trip_id"]]})
+                if trip[1] < item["count"]:
+                    return StubResponse(409, {"error": "insufficient_seats", "available": trip[1]})
+            results = []
+            for item in items:
+                trip = self.trips[item["trip_id"]]
+                trip[1] -= item["count"]
+                results.append({"trip_id": item["trip_id"], "allocated": item["count"], "seats_available": trip[1]})
+        return StubResponse(200, results[0] if single else {"results": results})
+
+    def release_batch(self, items: List[Dict[str, Any]], single: bool = False) -> StubResponse:
+        with self._lock:
+            results = []
+            for item in items:
+                trip = self.trips.get(item["trip_id"])
+                if trip is None:
+                    return StubResponse(404, {"error": "trip not found", "trip_ids": [item["trip_id"]]})
+                released = min(item["count"], trip[0] - trip[1])
+                trip[1] += released
+                results.append({"trip_id": item["trip_id"], "released": released, "seats_available": trip[1]})
+        return StubResponse(200, results[0] if single else {"results": results})
+
+    def close(self) -> None:
+        pass
+
+
+class InProcessScheduleClient:
+    # Routes ScheduleClient calls to a schedule service app loaded in the same
+    # process, through Flask's test client.
+
+    def __init__(self, schedule_app: Any) -> None:
+        self.app = schedule_app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, **kwargs: Any) -> StubResponse:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        resp = client.open(path, method=method, query_string=kwargs.get("params"), json=kwargs.get("json"))
+        return StubResponse(resp.status_code, resp.get_json(silent=True))
+
+    def search(self, origin: str, destination: str, date: str) -> StubResponse:
+        return self.request("GET", "/trips/search", params={"origin": origin, "destination": destination, "date": date})
+
+    def get_trips(self, trip_ids: List[int]) -> StubResponse:
+        return self.request("GET", "/trips", params={"ids": ",".join(str(t) for t in trip_ids)})
+
+    def allocate(
+        self, trip_id: int, count: int, seats: Optional[List[int]] = None, adjacent: bool = False
+    ) -> StubResponse:
+        payload: Dict[str, Any] = {"count": count}
+        if seats:
+            payload["seats"] = seats
+        if adjacent:
+            payload["adjacent"] = True
+        return self.request("POST", f"/trips/{trip_id}/allocate", json=payload)
+
+    def release(self, trip_id: int, count: int, seats: Optional[List[int]] = None) -> StubResponse:
+        payload: Dict[str, Any] = {"count": count}
+        if seats:
+            payload["seats"] = seats
+        return self.request("POST", f"/trips/{trip_id}/release", json=payload)
+
+    def hold(
+        self, trip_id: int, count: int, ttl_seconds: Optional[int] = None, owner: Optional[str] = None
+    ) -> StubResponse:
+        payload = {"count": count, "ttl_seconds": ttl_seconds, "owner": owner}
+        return self.request("POST", f"/trips/{trip_id}/hold", json=payload)
+
+    def confirm_hold(self, hold_id: str, owner: Optional[str] = None) -> StubResponse:
+        return self.request("POST", f"/holds/{hold_id}/confirm", json={"owner": owner})
+
+    def release_hold(self, hold_id: str, owner: Optional[str] = None) -> StubResponse:
+        return self.request("POST", f"/holds/{hold_id}/release", json={"owner": owner})
+
+    def allocate_batch(self, items: List[Dict[str, Any]]) -> StubResponse:
+        return self.request("POST", "/trips/allocate-batch", json={"items": items})
+
+    def release_batch(self, items: List[Dict[str, Any]]) -> StubResponse:
+        return self.request("POST", "/trips/release-batch", json={"items": items})
+
+    def close(self) -> None:
+        pass
@@ -16,6 +16,24 @@ import { ApiService } from '../api.service';
       <p class="muted mt-12">All bookings across users</p>
     </div>
 
+    <div class="card" *ngIf="days?.length">
+      <div class="muted mb-8">Last 14 days</div>
+      <table class="table">
+        <thead>
+          <tr><th>Date</th><th>Bookings</th><th>Seats</th><th>Cancellations</th><th>Occupancy</th></tr>
+        </thead>
+        <tbody>
+          <tr *ngFor="let d of days">
+            <td>{{d.day | date:'MMM d'}}</td>
+            <td>{{d.bookings}}</td>
+            <td>{{d.seats_booked}}</td>
+            <td>{{d.cancellations}}</td>
+            <td>{{occupancy[d.day] === undefined ? '-' : (occupancy[d.day] | percent:'1.0-1')}}</td>
+          </tr>
+        </tbody>
+      </table>
+    </div>
+
     <div class="card" *ngIf="reservations?.length">
       <table class="table">
         <thead>
@@ -41,13 +59,36 @@ import { ApiService } from '../api.service';
           </tr>
         </tbody>
       </table>
+      <div class="actions mt-12" *ngIf="nextAfterId">
+        <button class="btn btn-secondary" (click)="loadMore()">Load more</button>
+      </div>
     </div>
   `,
 })
 export class AdminComponent {
   reservations: any[] = [];
+  nextAfterId: number | null = null;
+  pageSize = 100;
+  days: any[] = [];
+  occupancy: Record<string, number> = {};
   constructor(private auth: AuthService, private api: ApiService) { this.refresh(); }
   logout() { this.auth.logout(); location.hash = '#/'; }
-  refresh() { this.api.listReservations().subscribe(res => this.reservations = res || []); }
+  refresh() { this.reservations = []; this.nextAfterId = null; this.loadMore(); this.loadStats(); }
+  // Server-side counters instead of aggregating reservation pages here
+  loadStats() {
+    const to = new Date().toISOString().substring(0, 10);
+    const from = new Date(Date.now() - 13 * 86400000).toISOString().substring(0, 10);
+    this.api.getBookingStats('day', { from, to }).subscribe({ next: (res) => (this.days = (res || []).reverse()) });
+    this.api.getOccupancy(from, to).subscribe({
+      next: (res) => (this.occupancy = Object.fromEntries((res || []).map((o: any) => [o.date, o.occupancy]))),
+    });
+  }
+  loadMore() {
+    this.api.listReservationsPage(this.pageSize, this.nextAfterId).subscribe(res => {
+      this.reservations = this.reservations.concat(res.body || []);
+      const next = res.headers.get('X-Next-After-Id');
+      this.nextAfterId = next ? Number(next) : null;
+    });
+  }
 }
 
@@ -1,5 +1,5 @@
 import { Injectable } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
+import { HttpClient, HttpResponse } from '@angular/common/http';
 import { Observable } from 'rxjs';
 
 @Injectable({ providedIn: 'root' })
@@ -8,6 +8,7 @@ export class ApiService {
   private protocol = window.location.protocol;
   private host = window.location.hostname;
   scheduleBase = `${this.protocol}//${this.host}:5001`;
+  streamBase = `${this.protocol}//${this.host}:5003`;
   reservationBase = `${this.protocol}//${this.host}:5002`;
 
   constructor(private http: HttpClient) {}
@@ -21,12 +22,64 @@ export class ApiService {
     return this.http.get<any[]>(`${this.scheduleBase}/trips/search?${params.toString()}`);
   }
 
+  // Per-day trip and seat totals for an origin/destination pair
+  getCalendar(origin: string, destination: string, from: string, to: string): Observable<any[]> {
+    const params = new URLSearchParams({ origin, destination, from, to });
+    return this.http.get<any[]>(`${this.scheduleBase}/calendar?${params.toString()}`);
+  }
+
   getAvailability(tripId: number): Observable<{ trip_id: number; seats_available: number }> {
     return this.http.get<{ trip_id: number; seats_available: number }>(`${this.scheduleBase}/trips/${tripId}/availability`);
   }
 
-  book(tripId: number, passengerName: string, seats: number): Observable<any> {
-    return this.http.post<any>(`${this.reservationBase}/reservations`, { trip_id: tripId, passenger_name: passengerName, seats });
+  // Live seats_available pushed by the schedule service's stream server
+  // (server-sent events). Falls back to polling when no stream comes up.
+  streamAvailability(tripIds: number[], pollMs = 5000): Observable<{ trip_id: number; seats_available: number }> {
+    return new Observable((observer) => {
+      const source = new EventSource(`${this.streamBase}/trips/stream?ids=${tripIds.join(',')}`);
+      const emit = (event: MessageEvent) => JSON.parse(event.data).forEach((u: any) => observer.next(u));
+      let live = false;
+      let poller: ReturnType<typeof setInterval> | null = null;
+      source.addEventListener('snapshot', ((event: MessageEvent) => {
+        live = true;
+        emit(event);
+      }) as EventListener);
+      source.addEventListener('seats', emit as EventListener);
+      source.onerror = () => {
+        // A stream that was up reconnects by itself
+        if (live || poller) return;
+        source.close();
+        const poll = () =>
+          tripIds.forEach((id) => this.getAvailability(id).subscribe({ next: (u) => observer.next(u), error: () => {} }));
+        poll();
+        poller = setInterval(poll, pollMs);
+      };
+      return () => {
+        source.close();
+        if (poller) clearInterval(poller);
+      };
+    });
+  }
+
+  // Numbered seats already taken on a trip
+  getSeatMap(tripId: number): Observable<{ trip_id: number; seats_total: number; seats_available: number; taken: number[] }> {
+    return this.http.get<{ trip_id: number; seats_total: number; seats_available: number; taken: number[] }>(`${this.scheduleBase}/trips/${tripId}/seatmap`);
+  }
+
+  book(tripId: number, passengerName: string, seats: number, holdId?: string | null, seatNumbers?: number[]): Observable<any> {
+    const body: any = { trip_id: tripId, passenger_name: passengerName, seats };
+    if (holdId) body.hold_id = holdId;
+    if (seatNumbers?.length) body.seat_numbers = seatNumbers;
+    return this.http.post<any>(`${this.reservationBase}/reservations`, body);
+  }
+
+  // Seats stay reserved for the hold's TTL while the passenger fills in details
+  holdSeats(tripId: number, seats: number): Observable<{ hold_id: string; expires_at: string; count: number }> {
+    return this.http.post<{ hold_id: string; expires_at: string; count: number }>(`${this.reservationBase}/holds`, { trip_id: tripId, seats });
+  }
+
+  releaseHold(holdId: string): Observable<any> {
+    return this.http.post<any>(`${this.reservationBase}/holds/${holdId}/release`, {});
   }
 
   cancel(reservationId: number): Observable<any> {
@@ -36,5 +89,24 @@ export class ApiService {
   listReservations(): Observable<any[]> {
     return this.http.get<any[]>(`${this.reservationBase}/reservations`);
   }
+
+  // Booking/cancellation counters (admin), by 'trip' | 'user' | 'day'
+  getBookingStats(by: string, query: Record<string, string> = {}): Observable<any[]> {
+    const params = new URLSearchParams({ by, ...query });
+    return this.http.get<any[]>(`${this.reservationBase}/stats?${params.toString()}`);
+  }
+
+  // Seats taken over seats offered, per day across all routes
+  getOccupancy(from: string, to: string): Observable<any[]> {
+    const params = new URLSearchParams({ from, to });
+    return this.http.get<any[]>(`${this.scheduleBase}/occupancy?${params.toString()}`);
+  }
+
+  // Keyset page; the cursor for the next page comes back in X-Next-After-Id
+  listReservationsPage(limit: number, afterId?: number | null): Observable<HttpResponse<any[]>> {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (afterId) params.set('after_id', String(afterId));
+    return this.http.get<any[]>(`${this.reservationBase}/reservations?${params.toString()}`, { observe: 'response' });
+  }
 }
 
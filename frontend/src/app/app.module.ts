@@ -13,6 +13,7 @@ import { AdminLoginComponent } from './login/admin-login.component';
 import { AdminComponent } from './admin/admin.component';
 import { AuthGuard, AdminGuard } from './auth.guard';
 import { AuthInterceptor } from './auth.interceptor';
+import { PrimaryPinInterceptor } from './primary-pin.interceptor';
 
 const routes: Routes = [
   { path: 'login', component: LoginComponent },
@@ -26,7 +27,10 @@ const routes: Routes = [
 @NgModule({
   declarations: [AppComponent, SearchComponent, BookingComponent, HistoryComponent, LoginComponent, AdminComponent, AdminLoginComponent],
   imports: [BrowserModule, FormsModule, HttpClientModule, RouterModule.forRoot(routes, { useHash: true })],
-  providers: [{ provide: HTTP_INTERCEPTORS, useClass: AuthInterceptor, multi: true }],
+  providers: [
+    { provide: HTTP_INTERCEPTORS, useClass: AuthInterceptor, multi: true },
+    { provide: HTTP_INTERCEPTORS, useClass: PrimaryPinInterceptor, multi: true },
+  ],
   bootstrap: [AppComponent],
 })
 export class AppModule {}
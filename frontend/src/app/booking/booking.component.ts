@@ -1,5 +1,6 @@
-import { Component } from '@angular/core';
+import { Component, OnDestroy } from '@angular/core';
 import { ActivatedRoute, Router } from '@angular/router';
+import { Subscription } from 'rxjs';
 import { ApiService } from '../api.service';
 
 @Component({
@@ -7,8 +8,10 @@ import { ApiService } from '../api.service';
   template: `
     <div class="card">
       <div class="toolbar">
-        <h3>Book Trip #{{tripId}}</h3>
+        <h3>Book Trip #{{tripId}} <span class="muted" *ngIf="seatsLeft !== null">· {{seatsLeft}} seats left</span></h3>
         <div class="actions">
+          <button class="btn" *ngIf="!holdId" (click)="hold()">Hold Seats</button>
+          <button class="btn" *ngIf="holdId" (click)="releaseHold()">Release Hold</button>
           <button class="btn btn-primary" (click)="book()">Confirm Booking</button>
         </div>
       </div>
@@ -19,28 +22,102 @@ import { ApiService } from '../api.service';
         </div>
         <div>
           <label>Seats</label>
-          <input type="number" [(ngModel)]="seats" min="1" />
+          <input type="number" [(ngModel)]="seats" min="1" [disabled]="!!holdId || picked.size > 0" />
         </div>
       </div>
+      <div *ngIf="seatTotal && !holdId" class="mt-12">
+        <label>Seats (optional: pick numbers)</label>
+        <div style="display:grid; grid-template-columns:repeat(4, 56px); gap:6px">
+          <button *ngFor="let n of seatList" class="btn" [class.btn-primary]="picked.has(n)" [class.btn-secondary]="!picked.has(n)"
+                  [disabled]="taken.has(n)" (click)="toggleSeat(n)">{{n}}</button>
+        </div>
+      </div>
+      <div *ngIf="holdId" class="mt-12">{{seats}} seat(s) held until {{holdExpiresAt | date:'shortTime'}}</div>
       <div *ngIf="error" class="mt-12" style="color:#fca5a5">{{error}}</div>
     </div>
   `,
 })
-export class BookingComponent {
+export class BookingComponent implements OnDestroy {
   tripId = 0;
   passenger = '';
   seats = 1;
   error = '';
+  holdId: string | null = null;
+  holdExpiresAt: Date | null = null;
+  seatsLeft: number | null = null;
+  seatTotal = 0;
+  seatList: number[] = [];
+  taken = new Set<number>();
+  picked = new Set<number>();
+  private live?: Subscription;
 
   constructor(private route: ActivatedRoute, private api: ApiService, private router: Router) {
     this.tripId = Number(this.route.snapshot.paramMap.get('tripId'));
+    this.live = this.api.streamAvailability([this.tripId]).subscribe((u) => (this.seatsLeft = u.seats_available));
+    this.loadSeatMap();
+  }
+
+  loadSeatMap() {
+    this.api.getSeatMap(this.tripId).subscribe((map) => {
+      this.seatTotal = map.seats_total;
+      this.seatList = Array.from({ length: map.seats_total }, (_, i) => i + 1);
+      this.taken = new Set(map.taken);
+      this.picked = new Set([...this.picked].filter((n) => !this.taken.has(n)));
+    });
+  }
+
+  toggleSeat(n: number) {
+    if (this.picked.has(n)) this.picked.delete(n);
+    else this.picked.add(n);
+    if (this.picked.size) this.seats = this.picked.size;
+  }
+
+  ngOnDestroy() {
+    this.live?.unsubscribe();
+  }
+
+  hold() {
+    this.error = '';
+    this.api.holdSeats(this.tripId, this.seats).subscribe({
+      next: (hold) => {
+        this.holdId = hold.hold_id;
+        // expires_at is naive UTC
+        this.holdExpiresAt = new Date(hold.expires_at + 'Z');
+      },
+      error: (err) => (this.error = this.busyMessage(err) || err?.error?.error || 'Hold failed'),
+    });
+  }
+
+  releaseHold() {
+    if (!this.holdId) return;
+    this.api.releaseHold(this.holdId).subscribe({ complete: () => this.clearHold(), error: () => this.clearHold() });
   }
 
   book() {
-    this.api.book(this.tripId, this.passenger, this.seats).subscribe({
+    const seatNumbers = this.holdId ? [] : [...this.picked].sort((a, b) => a - b);
+    this.api.book(this.tripId, this.passenger, this.seats, this.holdId, seatNumbers).subscribe({
       next: () => this.router.navigate(['/history']),
-      error: (err) => (this.error = err?.error?.error || 'Booking failed'),
+      error: (err) => {
+        // An expired hold cannot be confirmed; the user can hold again
+        if (err?.status === 410) this.clearHold();
+        // Someone else took a picked seat: show the current map
+        if (err?.error?.error === 'seats_taken') this.loadSeatMap();
+        this.error = this.busyMessage(err) || err?.error?.error || 'Booking failed';
+      },
     });
   }
+
+  // Turned away by admission control during a rush
+  private busyMessage(err: any): string {
+    if (err?.status !== 429) return '';
+    const wait = Math.max(1, Math.ceil(err.error?.retry_after || 1));
+    const position = err.error?.queue_position ? ` (about #${err.error.queue_position} in line)` : '';
+    return `Booking is very busy right now${position}. Please try again in ${wait}s.`;
+  }
+
+  private clearHold() {
+    this.holdId = null;
+    this.holdExpiresAt = null;
+  }
 }
 
@@ -25,7 +25,7 @@ import { ApiService } from '../api.service';
             <td>#{{r.id}}</td>
             <td>{{r.trip_id}}</td>
             <td>{{r.passenger_name}}</td>
-            <td>{{r.seats_booked}}</td>
+            <td>{{r.seats_booked}}<span class="muted" *ngIf="r.seat_numbers"> · seats {{r.seat_numbers.join(', ')}}</span></td>
             <td>
               <span class="badge" [class.success]="r.status==='BOOKED'" [class.warn]="r.status!=='BOOKED'">{{r.status}}</span>
             </td>
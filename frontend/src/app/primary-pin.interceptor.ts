@@ -0,0 +1,30 @@
+import { Injectable } from '@angular/core';
+import { HttpEvent, HttpHandler, HttpInterceptor, HttpRequest, HttpResponse } from '@angular/common/http';
+import { Observable, tap } from 'rxjs';
+
+// Read-your-writes across workers: after a write each service returns
+// X-DB-Primary-Until, and we send it back to that service until it passes,
+// so our next reads skip lagging replicas. Cookies are not an option: the
+// services are called cross-origin without credentials.
+const PIN_HEADER = 'X-DB-Primary-Until';
+
+@Injectable()
+export class PrimaryPinInterceptor implements HttpInterceptor {
+  private pins = new Map<string, number>();
+
+  intercept(req: HttpRequest<any>, next: HttpHandler): Observable<HttpEvent<any>> {
+    const origin = new URL(req.url, window.location.href).origin;
+    const until = this.pins.get(origin);
+    if (until && until > Date.now() / 1000) {
+      req = req.clone({ setHeaders: { [PIN_HEADER]: String(until) } });
+    } else if (until) {
+      this.pins.delete(origin);
+    }
+    return next.handle(req).pipe(
+      tap((event) => {
+        const value = event instanceof HttpResponse ? Number(event.headers.get(PIN_HEADER)) : 0;
+        if (value) this.pins.set(origin, value);
+      })
+    );
+  }
+}
@@ -41,6 +41,12 @@ import { ApiService } from '../api.service';
         </div>
       </div>
       <div *ngIf="error" class="mt-12" style="color:#fca5a5">{{error}}</div>
+      <div *ngIf="days?.length" class="mt-12">
+        <button *ngFor="let d of days" class="btn" [class.btn-primary]="d.date===date"
+                [disabled]="d.seats_available===0" (click)="pickDay(d.date)">
+          {{d.date | date:'MMM d'}} · {{d.seats_available}}
+        </button>
+      </div>
     </div>
 
     <div class="card" *ngIf="trips?.length">
@@ -76,6 +82,7 @@ export class SearchComponent {
   trips: any[] = [];
   error = '';
   routes: any[] = [];
+  days: any[] = [];
 
   constructor(private api: ApiService, private router: Router) { this.loadRoutes(); }
 
@@ -86,12 +93,28 @@ export class SearchComponent {
   search() {
     this.error = '';
     this.trips = [];
+    this.loadCalendar();
     this.api.searchTrips(this.origin, this.destination, this.date).subscribe({
       next: (res) => (this.trips = res || []),
       error: (err) => (this.error = err?.error?.error || 'Search failed'),
     });
   }
 
+  // One request for the next 30 days instead of a search per date
+  loadCalendar() {
+    const from = new Date(this.date);
+    const to = new Date(from.getTime() + 29 * 86400000);
+    this.api.getCalendar(this.origin, this.destination, this.date, to.toISOString().substring(0, 10)).subscribe({
+      next: (res) => (this.days = res || []),
+      error: () => (this.days = []),
+    });
+  }
+
+  pickDay(day: string) {
+    this.date = day;
+    this.search();
+  }
+
   book(tripId: number) {
     this.router.navigate(['/book', tripId]);
   }
@@ -101,6 +124,7 @@ export class SearchComponent {
     this.destination = 'City B';
     this.date = new Date().toISOString().substring(0, 10);
     this.trips = [];
+    this.days = [];
     this.error = '';
   }
 }
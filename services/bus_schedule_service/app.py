@@ -1,53 +1,271 @@
+import json
 import os
 import time
+import uuid
 from datetime import datetime, date, timedelta
-from typing import Any, Dict
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-from sqlalchemy import and_
+from sqlalchemy import and_, func, insert, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, joinedload
 
-from models import db, Route, Trip
+from archive import TripArchiver
+from change_feed import ChangeFeed
+from connections import Leg, RouteGraph
+import seatmap
+from daily_stats import MIN_UNKNOWN, add_trips, day_minimums, move_seats, rebuild
+from holds import HoldSweeper
+from inventory import SeatInventory
+from db_routing import PIN_HEADER, ReadRouter, primary
+from metrics import Metrics
+from models import db, AppliedRelease, Route, RouteDayStats, SeatHold, Trip, TripArchive
+from search_cache import SearchCache
+from startup import Startup, ping
+from timetable import materialize, parse_rule
+from transfer import Importer, export_lines, read_records
 from sqlalchemy import text
 
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
 
-def wait_for_db(retries: int = 30, delay_seconds: float = 2.0) -> None:
-    for attempt in range(1, retries + 1):
+
+def wait_for_db(timeout: float = 60.0, max_delay: float = 5.0) -> None:
+    # Exponential backoff, so a database that is already up costs nothing
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while time.monotonic() + delay < deadline:
         try:
             db.session.execute(text("SELECT 1"))
             return
         except Exception:
-            time.sleep(delay_seconds)
+            db.session.rollback()
+            time.sleep(delay)
+            delay = min(max_delay, delay * 2)
     # last try: raise to let container restart
     db.session.execute(text("SELECT 1"))
 
 
-def create_app() -> Flask:
-    app = Flask(__name__)
+def engine_options(uri: str) -> Dict[str, Any]:
+    # One pool per worker process, sized to the worker's thread count
+    if not uri.startswith("mysql"):
+        return {}
+    threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", str(threads))),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "2")),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "280")),
+        "pool_pre_ping": True,
+    }
+
 
+def configure(app: Flask) -> None:
     db_user = os.environ.get("DB_USER", "schedule_user")
     db_password = os.environ.get("DB_PASSWORD", "schedule_password")
     db_host = os.environ.get("DB_HOST", "127.0.0.1")
     db_port = os.environ.get("DB_PORT", "3306")
     db_name = os.environ.get("DB_NAME", "schedule_db")
 
-    app.config["SQLALCHEMY_DATABASE_URI"] = (
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL") or (
         f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
     )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    # Optional read replicas: full URLs, or hosts sharing the primary's credentials
+    replica_urls = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+    replica_hosts = [h.strip() for h in os.environ.get("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+    app.config["SQLALCHEMY_REPLICA_URIS"] = replica_urls or [
+        f"mysql+pymysql://{db_user}:{db_password}@{host if ':' in host else f'{host}:{db_port}'}/{db_name}"
+        for host in replica_hosts
+    ]
+    app.config["READ_YOUR_WRITES_SECONDS"] = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
+    app.config["SEAT_INVENTORY_ENGINE"] = os.environ.get("SEAT_INVENTORY_ENGINE", "0") == "1"
+    app.config["SEAT_INVENTORY_MAX_BATCH"] = int(os.environ.get("SEAT_INVENTORY_MAX_BATCH", "1000"))
+    app.config["SEARCH_CACHE_SIZE"] = int(os.environ.get("SEARCH_CACHE_SIZE", "4096"))
+    app.config["SEARCH_CACHE_TTL"] = float(os.environ.get("SEARCH_CACHE_TTL", "30"))
+    app.config["METRICS_SLOW_REQUEST_MS"] = float(os.environ.get("METRICS_SLOW_REQUEST_MS", "0"))
+    app.config["HOLD_TTL_SECONDS"] = int(os.environ.get("HOLD_TTL_SECONDS", "300"))
+    app.config["HOLD_MAX_TTL_SECONDS"] = int(os.environ.get("HOLD_MAX_TTL_SECONDS", "1800"))
+    app.config["HOLD_SWEEP_BATCH"] = int(os.environ.get("HOLD_SWEEP_BATCH", "500"))
+    app.config["TIMETABLE_MAX_DAYS"] = int(os.environ.get("TIMETABLE_MAX_DAYS", "400"))
+    app.config["TIMETABLE_CHUNK_SIZE"] = int(os.environ.get("TIMETABLE_CHUNK_SIZE", "1000"))
+    app.config["IMPORT_BATCH_SIZE"] = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+    app.config["ROUTE_DEFAULT_DURATION_MINUTES"] = int(os.environ.get("ROUTE_DEFAULT_DURATION_MINUTES", "240"))
+    app.config["ROUTE_GRAPH_TTL"] = float(os.environ.get("ROUTE_GRAPH_TTL", "60"))
+    app.config["CALENDAR_MAX_DAYS"] = int(os.environ.get("CALENDAR_MAX_DAYS", "366"))
+    # Streams hold their connection open: gunicorn.conf.py turns them off on
+    # the gthread server, and gunicorn.stream.conf.py runs the stream server
+    app.config["STREAMS"] = os.environ.get("STREAMS", "1") == "1"
+    app.config["STREAM_SERVER"] = os.environ.get("STREAM_SERVER", "0") == "1"
+    app.config["STREAM_MAX_TRIPS"] = int(os.environ.get("STREAM_MAX_TRIPS", "200"))
+    app.config["STREAM_MIN_INTERVAL"] = float(os.environ.get("STREAM_MIN_INTERVAL", "1"))
+    app.config["STREAM_KEEPALIVE"] = float(os.environ.get("STREAM_KEEPALIVE", "15"))
+    app.config["STREAM_POLL_INTERVAL"] = float(os.environ.get("STREAM_POLL_INTERVAL", "1"))
+    app.config["CONNECTION_WINDOW_HOURS"] = int(os.environ.get("CONNECTION_WINDOW_HOURS", "48"))
+    app.config["ARCHIVER"] = os.environ.get("ARCHIVER", "1") == "1"
+    app.config["ARCHIVE_AFTER_DAYS"] = int(os.environ.get("ARCHIVE_AFTER_DAYS", "30"))
+    app.config["ARCHIVE_BATCH_SIZE"] = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+    app.config["ARCHIVE_INTERVAL"] = float(os.environ.get("ARCHIVE_INTERVAL", "3600"))
+    app.config["ARCHIVE_PARTITIONING"] = os.environ.get("ARCHIVE_PARTITIONING", "0") == "1"
+    app.config["ARCHIVE_PARTITION_MONTHS_AHEAD"] = int(os.environ.get("ARCHIVE_PARTITION_MONTHS_AHEAD", "3"))
+    app.config["RELEASE_ID_RETENTION_DAYS"] = int(os.environ.get("RELEASE_ID_RETENTION_DAYS", "7"))
+
+
+def migrate() -> None:
+    # Idempotent schema changes, run once per deploy (`python manage.py migrate`)
+    wait_for_db()
+    db.create_all()
+    for model in (Route, Trip, TripArchive, SeatHold, RouteDayStats):
+        add_missing_columns(model)
+    # create_all does not add indexes to tables that already exist
+    for index in Trip.__table__.indexes | RouteDayStats.__table__.indexes:
+        index.create(bind=db.engine, checkfirst=True)
+    # Backfill calendar aggregates for databases that predate them
+    if db.session.query(RouteDayStats.route_id).first() is None and db.session.query(Trip.id).first() is not None:
+        rebuild(db.session.connection())
+        db.session.commit()
+
+
+def add_missing_columns(model: Any) -> None:
+    # create_all does not add columns to tables that already exist
+    table = model.__table__
+    existing = {c["name"] for c in inspect(db.engine).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}"
+        if column.server_default is not None:
+            ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+        else:
+            ddl += " NULL"
+        db.session.execute(text(ddl))
+    db.session.commit()
+
+
+def prepare_database() -> None:
+    migrate()
+    seed_if_empty()
 
-    CORS(app)
+
+def bootstrap(commands: Iterable[str] = ("migrate", "seed")) -> None:
+    # Schema creation and seeding outside the workers, through `python
+    # manage.py`, which the gunicorn master also runs unless SKIP_BOOTSTRAP=1
+    app = Flask(__name__)
+    configure(app)
+    db.init_app(app)
+    tasks = {"migrate": migrate, "seed": seed_if_empty}
+    with app.app_context():
+        for command in commands:
+            tasks[command]()
+        db.engine.dispose()
+
+
+def create_app() -> Flask:
+    startup = Startup()
+    app = Flask(__name__)
+    configure(app)
+
+    CORS(app, expose_headers=["X-Next-After-Id", PIN_HEADER])
     db.init_app(app)
+    metrics = Metrics(app.config["METRICS_SLOW_REQUEST_MS"])
+    metrics.init_app(app)
+
+    router = ReadRouter(
+        app.config["SQLALCHEMY_REPLICA_URIS"],
+        engine_options,
+        pin_seconds=app.config["READ_YOUR_WRITES_SECONDS"],
+    )
+    router.init_app(app)
+    for engine in router.engines:
+        metrics.instrument_engine(engine)
+    metrics.counter(
+        "db_requests_routed_total",
+        "Requests by the database their reads were sent to.",
+        lambda: {(("target", k),): v for k, v in router.routed.items()},
+    )
+    metrics.gauge(
+        "db_replica_state",
+        "Configured and unreachable replicas, clients pinned to the primary.",
+        lambda: {(("state", k),): v for k, v in router.stats().items()},
+    )
 
     with app.app_context():
-        wait_for_db()
-        db.create_all()
-        seed_if_empty()
+        metrics.instrument_engine(db.engine)
+        if os.environ.get("SKIP_BOOTSTRAP") != "1":
+            prepare_database()
+        if app.config["SEAT_INVENTORY_ENGINE"] and not app.config["STREAM_SERVER"]:
+            inventory = SeatInventory(db.engine, max_batch=app.config["SEAT_INVENTORY_MAX_BATCH"])
+            inventory.start()
+            startup.add("seat inventory", inventory.recover)
+            app.extensions["seat_inventory"] = inventory
 
+    app.extensions["search_cache"] = SearchCache(app.config["SEARCH_CACHE_SIZE"], app.config["SEARCH_CACHE_TTL"])
+    app.extensions["change_feed"] = ChangeFeed(app, app.config["STREAM_POLL_INTERVAL"])
+    sweeper = HoldSweeper(app, partial(seats_moved, app), batch_size=app.config["HOLD_SWEEP_BATCH"])
+    # The stream server only reads: background writers stay on the main server
+    if not app.config["STREAM_SERVER"]:
+        startup.add("seat holds", sweeper.recover)
+        sweeper.start()
+    app.extensions["hold_sweeper"] = sweeper
+    app.extensions["route_graph"] = RouteGraph(
+        app.config["ROUTE_DEFAULT_DURATION_MINUTES"], app.config["ROUTE_GRAPH_TTL"]
+    )
+    archiver = TripArchiver(
+        app,
+        partial(trips_archived, app),
+        after_days=app.config["ARCHIVE_AFTER_DAYS"],
+        batch_size=app.config["ARCHIVE_BATCH_SIZE"],
+        interval=app.config["ARCHIVE_INTERVAL"],
+        partitioning=app.config["ARCHIVE_PARTITIONING"],
+        months_ahead=app.config["ARCHIVE_PARTITION_MONTHS_AHEAD"],
+        release_retention_days=app.config["RELEASE_ID_RETENTION_DAYS"],
+    )
+    app.extensions["archiver"] = archiver
+    if app.config["ARCHIVER"] and not app.config["STREAM_SERVER"]:
+        startup.add("archiver", archiver.start)
+    app.extensions["startup"] = startup
+    register_metrics(app, metrics)
     register_routes(app)
+    startup.start(app)
     return app
 
 
+def register_metrics(app: Flask, metrics: Metrics) -> None:
+    search_cache: SearchCache = app.extensions["search_cache"]
+    metrics.counter(
+        "search_cache_lookups_total",
+        "Search cache lookups by result.",
+        lambda: {(("result", "hit"),): search_cache.hits, (("result", "miss"),): search_cache.misses},
+    )
+    metrics.gauge("search_cache_entries", "Cached search results.", lambda: {(): len(search_cache)})
+    inventory = app.extensions.get("seat_inventory")
+    if inventory is not None:
+        metrics.gauge(
+            "seat_inventory_state",
+            "Seat inventory engine counters and queued deltas.",
+            lambda: {(("kind", k),): v for k, v in inventory.stats().items()},
+        )
+    sweeper: HoldSweeper = app.extensions["hold_sweeper"]
+    metrics.gauge("seat_holds_tracked", "Holds waiting for expiry in this process.", lambda: {(): sweeper.stats()["tracked"]})
+    metrics.counter("seat_holds_expired_total", "Holds expired by the sweeper.", lambda: {(): sweeper.expired})
+    feed: ChangeFeed = app.extensions["change_feed"]
+    metrics.gauge(
+        "seat_stream_state",
+        "Open availability streams and the trips they watch.",
+        lambda: {(("kind", k),): v for k, v in feed.stats().items()},
+    )
+    archiver: TripArchiver = app.extensions["archiver"]
+    metrics.counter("trips_archived_total", "Trips moved to trips_archive.", lambda: {(): archiver.archived})
+    startup: Startup = app.extensions["startup"]
+    metrics.gauge(
+        "app_startup",
+        "1 once ready to serve, and seconds from create_app to ready.",
+        lambda: {(("kind", "ready"),): int(startup.ready), (("kind", "seconds"),): startup.ready_after or 0},
+    )
+
+
 def seed_if_empty() -> None:
     if Route.query.count() > 0:
         return
@@ -69,26 +287,31 @@ def seed_if_empty() -> None:
         ("Ahmedabad", "Vadodara"), ("Indore", "Bhopal"), ("Nagpur", "Bhopal"),
         ("Pune", "Surat"), ("Jaipur", "Ahmedabad")
     ]
-    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
-    departures = [6, 10, 14, 18]  # hours
-    for origin, destination in pairs:
-        route = Route(origin=origin, destination=destination)
-        db.session.add(route)
-        db.session.flush()
-        # Create trips for today and tomorrow
-        for day_offset in [0, 1]:
-            for h in departures:
-                trip = Trip(
-                    route_id=route.id,
-                    departure_time=(now + timedelta(days=day_offset)).replace(hour=h),
-                    seats_total=44,
-                    seats_available=44,
-                )
-                db.session.add(trip)
+    db.session.execute(insert(Route), [{"origin": o, "destination": d} for o, d in pairs])
     db.session.commit()
+    # Trips for today and tomorrow
+    today = datetime.utcnow().date()
+    rule, _error = parse_rule(
+        {
+            "start_date": today.isoformat(),
+            "end_date": (today + timedelta(days=1)).isoformat(),
+            "departure_times": ["06:00", "10:00", "14:00", "18:00"],
+            "seats_total": 44,
+        },
+        max_days=2,
+    )
+    for (route_id,) in db.session.query(Route.id).order_by(Route.id).all():
+        materialize(route_id, rule)
 
 
 def register_routes(app: Flask) -> None:
+    search_cache: SearchCache = app.extensions["search_cache"]
+    sweeper: HoldSweeper = app.extensions["hold_sweeper"]
+    route_graph: RouteGraph = app.extensions["route_graph"]
+    feed: ChangeFeed = app.extensions["change_feed"]
+    archiver: TripArchiver = app.extensions["archiver"]
+    startup: Startup = app.extensions["startup"]
+
     @app.get("/health")
     def health() -> Any:
         try:
@@ -97,6 +320,22 @@ def register_routes(app: Flask) -> None:
         except Exception as exc:
             return jsonify({"status": "degraded", "error": str(exc)}), 500
 
+    @app.get("/health/live")
+    def liveness() -> Any:
+        # Process is up; never touches the database
+        return jsonify({"status": "ok", "uptime_seconds": startup.stats()["uptime_seconds"]})
+
+    @app.get("/health/ready")
+    def readiness() -> Any:
+        stats = startup.stats()
+        if not startup.ready:
+            return jsonify(dict(stats, status="starting")), 503
+        try:
+            ping()
+        except Exception as exc:
+            return jsonify(dict(stats, status="unavailable", error=str(exc))), 503
+        return jsonify(dict(stats, status="ready"))
+
     @app.post("/routes")
     def create_route() -> Any:
         data = request.get_json(force=True)
@@ -104,18 +343,215 @@ def register_routes(app: Flask) -> None:
         destination = (data or {}).get("destination")
         if not origin or not destination:
             return jsonify({"error": "origin and destination are required"}), 400
-        route = Route(origin=origin, destination=destination)
+        try:
+            duration = data.get("duration_minutes")
+            duration_minutes = int(duration) if duration is not None else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "duration_minutes must be an integer"}), 400
+        route = Route(origin=origin, destination=destination, duration_minutes=duration_minutes)
         db.session.add(route)
         db.session.commit()
-        return jsonify({"id": route.id, "origin": route.origin, "destination": route.destination}), 201
+        search_cache.invalidate(route.origin, route.destination)
+        route_graph.invalidate()
+        return jsonify(serialize_route(route)), 201
 
     @app.get("/routes")
     def list_routes() -> Any:
-        routes = Route.query.all()
+        after_id, limit, error = parse_page_args()
+        if error:
+            return jsonify({"error": error}), 400
+        query = Route.query.order_by(Route.id)
+        if after_id is not None:
+            query = query.filter(Route.id > after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        if wants_ndjson():
+            return stream_ndjson(query, serialize_route)
+        return paged_response(query.all(), limit, serialize_route)
+
+    @app.get("/routes/<int:route_id>/calendar")
+    def route_calendar(route_id: int) -> Any:
+        if db.session.get(Route, route_id) is None:
+            return jsonify({"error": "route not found"}), 404
+        start, end, error = parse_day_range()
+        if error:
+            return jsonify({"error": error}), 400
+        rows = (
+            RouteDayStats.query.filter(
+                RouteDayStats.route_id == route_id, RouteDayStats.day >= start, RouteDayStats.day <= end
+            )
+            .order_by(RouteDayStats.day)
+            .all()
+        )
+        minimums = day_minimums(
+            db.session, [(route_id, row.day) for row in rows if row.min_seats_available == MIN_UNKNOWN]
+        )
         return jsonify([
-            {"id": r.id, "origin": r.origin, "destination": r.destination} for r in routes
+            serialize_day(row, minimums.get((route_id, row.day), row.min_seats_available)) for row in rows
         ])
 
+    @app.get("/calendar")
+    def pair_calendar() -> Any:
+        origin = request.args.get("origin")
+        destination = request.args.get("destination")
+        if not (origin and destination):
+            return jsonify({"error": "origin and destination are required"}), 400
+        start, end, error = parse_day_range()
+        if error:
+            return jsonify({"error": error}), 400
+        # Several routes can serve the same pair: fold them per day
+        rows = (
+            db.session.query(
+                RouteDayStats.day,
+                func.sum(RouteDayStats.trip_count),
+                func.sum(RouteDayStats.seats_total),
+                func.sum(RouteDayStats.seats_available),
+                func.min(RouteDayStats.min_seats_available),
+            )
+            .join(Route, Route.id == RouteDayStats.route_id)
+            .filter(
+                Route.origin == origin,
+                Route.destination == destination,
+                RouteDayStats.day >= start,
+                RouteDayStats.day <= end,
+            )
+            .group_by(RouteDayStats.day)
+            .order_by(RouteDayStats.day)
+            .all()
+        )
+        # A day with an unknown minimum on any route folds to MIN_UNKNOWN
+        unknown = {day for day, *_rest, min_available in rows if min_available == MIN_UNKNOWN}
+        day_min: Dict[date, int] = {}
+        if unknown:
+            route_ids = [
+                route_id
+                for (route_id,) in db.session.query(Route.id).filter(
+                    Route.origin == origin, Route.destination == destination
+                )
+            ]
+            keys = [(route_id, day) for route_id in route_ids for day in unknown]
+            for (_route_id, day), minimum in day_minimums(db.session, keys).items():
+                day_min[day] = min(day_min.get(day, minimum), minimum)
+        return jsonify([
+            {
+                "date": day.isoformat(),
+                "trips": int(trips),
+                "seats_total": int(seats_total),
+                "seats_available": int(seats_available),
+                "min_seats_available": int(day_min.get(day, min_available)),
+            }
+            for day, trips, seats_total, seats_available, min_available in rows
+        ])
+
+    @app.get("/occupancy")
+    def occupancy() -> Any:
+        # Seats taken (booked or held) over seats offered, per day or per route
+        group = request.args.get("group", "day")
+        if group not in ("day", "route"):
+            return jsonify({"error": "group must be day or route"}), 400
+        start, end, error = parse_day_range()
+        if error:
+            return jsonify({"error": error}), 400
+        try:
+            route_ids = [int(r) for r in request.args.get("route_ids", "").split(",") if r]
+        except ValueError:
+            return jsonify({"error": "route_ids must be comma separated integers"}), 400
+        key = RouteDayStats.day if group == "day" else RouteDayStats.route_id
+        query = db.session.query(
+            key,
+            func.sum(RouteDayStats.trip_count),
+            func.sum(RouteDayStats.seats_total),
+            func.sum(RouteDayStats.seats_available),
+        ).filter(RouteDayStats.day >= start, RouteDayStats.day <= end)
+        if route_ids:
+            query = query.filter(RouteDayStats.route_id.in_(route_ids))
+        rows = query.group_by(key).order_by(key).all()
+        return jsonify([
+            serialize_occupancy({"date": value.isoformat()} if group == "day" else {"route_id": value}, *totals)
+            for value, *totals in rows
+        ])
+
+    def parse_day_range() -> Tuple[Optional[date], Optional[date], Optional[str]]:
+        try:
+            start = date.fromisoformat(request.args["from"]) if request.args.get("from") else date.today()
+            end = date.fromisoformat(request.args["to"]) if request.args.get("to") else start + timedelta(days=30)
+        except ValueError:
+            return None, None, "from and to must be YYYY-MM-DD"
+        if end < start or (end - start).days >= app.config["CALENDAR_MAX_DAYS"]:
+            return None, None, f"need from <= to and at most {app.config['CALENDAR_MAX_DAYS']} days"
+        return start, end, None
+
+    @app.post("/routes/<int:route_id>/timetable")
+    def create_timetable(route_id: int) -> Any:
+        route = db.session.get(Route, route_id)
+        if route is None:
+            return jsonify({"error": "route not found"}), 404
+        rule, error = parse_rule(request.get_json(force=True) or {}, app.config["TIMETABLE_MAX_DAYS"])
+        if error:
+            return jsonify({"error": error}), 400
+        result = apply_timetable(route, rule)
+        return jsonify(result), 201 if result["created"] else 200
+
+    @app.post("/timetable")
+    def create_timetables() -> Any:
+        # One rule for many routes; all routes when route_ids is omitted
+        data = request.get_json(force=True) or {}
+        rule, error = parse_rule(data, app.config["TIMETABLE_MAX_DAYS"])
+        if error:
+            return jsonify({"error": error}), 400
+        query = Route.query.order_by(Route.id)
+        if data.get("route_ids") is not None:
+            try:
+                route_ids = [int(r) for r in data["route_ids"]]
+            except Exception:
+                return jsonify({"error": "route_ids must be integers"}), 400
+            query = query.filter(Route.id.in_(route_ids))
+        results = [apply_timetable(route, rule) for route in query.all()]
+        created = sum(r["created"] for r in results)
+        return jsonify({
+            "routes": results,
+            "requested": sum(r["requested"] for r in results),
+            "created": created,
+        }), 201 if created else 200
+
+    def apply_timetable(route: Route, rule: Any) -> Dict[str, Any]:
+        route_id, origin, destination = route.id, route.origin, route.destination
+        requested = rule.count()
+        created = materialize(route_id, rule, app.config["TIMETABLE_CHUNK_SIZE"])
+        if created:
+            search_cache.invalidate(origin, destination)
+        return {"route_id": route_id, "requested": requested, "created": created, "skipped": requested - created}
+
+    @app.get("/export")
+    def export_data() -> Any:
+        entity = request.args.get("entity", "trips")
+        fmt = request.args.get("format", "ndjson")
+        if entity not in ("routes", "trips") or fmt not in ("csv", "ndjson"):
+            return jsonify({"error": "entity must be routes or trips, format csv or ndjson"}), 400
+        mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+        resp = Response(stream_with_context(export_lines(entity, fmt, STREAM_BATCH_SIZE)), mimetype=mimetype)
+        resp.headers["Content-Disposition"] = f"attachment; filename={entity}.{fmt}"
+        return resp
+
+    @app.post("/import")
+    def import_data() -> Any:
+        entity = request.args.get("entity", "trips")
+        fmt = request.args.get("format") or ("csv" if request.mimetype == "text/csv" else "ndjson")
+        if entity not in ("routes", "trips") or fmt not in ("csv", "ndjson"):
+            return jsonify({"error": "entity must be routes or trips, format csv or ndjson"}), 400
+        # Read the body as a stream instead of buffering it
+        importer = Importer(entity, app.config["IMPORT_BATCH_SIZE"])
+        try:
+            report = importer.run(read_records(request.stream, fmt))
+        except UnicodeDecodeError:
+            db.session.rollback()
+            return jsonify({"error": "body must be UTF-8", "created": importer.created}), 400
+        if report["created"] or report["routes_created"]:
+            search_cache.clear()
+        if entity == "routes" or report["routes_created"]:
+            route_graph.invalidate()
+        return jsonify(report), 201 if report["created"] else 200
+
     @app.post("/trips")
     def create_trip() -> Any:
         data = request.get_json(force=True)
@@ -137,7 +573,13 @@ def register_routes(app: Flask) -> None:
             seats_available=seats_total,
         )
         db.session.add(trip)
+        db.session.flush()
+        add_trips(
+            db.session.connection(),
+            [(trip.route_id, trip.departure_time.date(), trip.seats_total, trip.seats_available)],
+        )
         db.session.commit()
+        search_cache.invalidate(route.origin, route.destination, trip.departure_time.date())
         return jsonify(serialize_trip(trip)), 201
 
     @app.get("/trips/search")
@@ -154,11 +596,18 @@ def register_routes(app: Flask) -> None:
         except Exception:
             return jsonify({"error": "invalid date format"}), 400
 
+        cache_key = (origin, destination, search_date)
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
         start_dt = datetime.combine(search_date, datetime.min.time())
         end_dt = datetime.combine(search_date, datetime.max.time())
 
+        # Load the route through the join instead of one lazy query per trip
         trips = (
             Trip.query.join(Route)
+            .options(contains_eager(Trip.route))
             .filter(
                 and_(
                     Route.origin == origin,
@@ -169,31 +618,158 @@ def register_routes(app: Flask) -> None:
             )
             .all()
         )
-        return jsonify([serialize_trip(t) for t in trips])
+        if start_dt < archiver.cutoff():
+            trips += (
+                TripArchive.query.join(Route, Route.id == TripArchive.route_id)
+                .options(contains_eager(TripArchive.route))
+                .filter(
+                    Route.origin == origin,
+                    Route.destination == destination,
+                    TripArchive.departure_time >= start_dt,
+                    TripArchive.departure_time <= end_dt,
+                )
+                .all()
+            )
+        result = [serialize_trip(t) for t in trips]
+        search_cache.put(cache_key, result)
+        return jsonify(result)
+
+    @app.get("/trips/connections")
+    def search_connections() -> Any:
+        origin = request.args.get("origin")
+        destination = request.args.get("destination")
+        date_str = request.args.get("date")
+        if not (origin and destination and date_str):
+            return jsonify({"error": "origin, destination, and date are required"}), 400
+        try:
+            depart_after = (
+                datetime.fromisoformat(request.args["after"]) if request.args.get("after")
+                else datetime.combine(date.fromisoformat(date_str), datetime.min.time())
+            )
+            seats = int(request.args.get("seats", 1))
+            max_legs = int(request.args.get("max_legs", 3))
+            min_transfer = int(request.args.get("min_transfer_minutes", 30))
+            limit = int(request.args.get("limit", 5))
+        except ValueError:
+            return jsonify({"error": "invalid date, after, seats, max_legs, min_transfer_minutes or limit"}), 400
+        if not (1 <= max_legs <= 4 and 1 <= limit <= 20 and seats >= 1 and min_transfer >= 0):
+            return jsonify({"error": "need 1 <= max_legs <= 4, 1 <= limit <= 20, seats >= 1"}), 400
+
+        itineraries = route_graph.search(
+            origin,
+            destination,
+            depart_after,
+            timedelta(hours=app.config["CONNECTION_WINDOW_HOURS"]),
+            seats=seats,
+            max_legs=max_legs,
+            min_transfer=timedelta(minutes=min_transfer),
+            limit=limit,
+        )
+        return jsonify([serialize_itinerary(legs) for legs in itineraries])
+
+    @app.get("/cache/stats")
+    def cache_stats() -> Any:
+        return jsonify({"search": search_cache.stats(), "route_graph": route_graph.stats()})
+
+    @app.post("/admin/archive")
+    def run_archive() -> Any:
+        try:
+            max_batches = int(request.args["max_batches"]) if request.args.get("max_batches") else None
+        except ValueError:
+            return jsonify({"error": "max_batches must be an integer"}), 400
+        archived = archiver.run(max_batches)
+        return jsonify({"archived": archived, "cutoff": archiver.cutoff().isoformat()})
+
+    @app.get("/trips")
+    @primary
+    def list_trips_by_id() -> Any:
+        try:
+            trip_ids = [int(t) for t in request.args.get("ids", "").split(",") if t]
+        except ValueError:
+            return jsonify({"error": "ids must be comma separated integers"}), 400
+        if not trip_ids or len(trip_ids) > MAX_PAGE_SIZE:
+            return jsonify({"error": f"between 1 and {MAX_PAGE_SIZE} ids required"}), 400
+        trips = (
+            Trip.query.join(Route)
+            .options(contains_eager(Trip.route))
+            .filter(Trip.id.in_(trip_ids))
+            .order_by(Trip.id)
+            .all()
+        )
+        missing = set(trip_ids) - {t.id for t in trips}
+        if missing:
+            archived = (
+                TripArchive.query.options(joinedload(TripArchive.route))
+                .filter(TripArchive.id.in_(missing))
+                .all()
+            )
+            trips = sorted(trips + archived, key=lambda t: t.id)
+        # Open holds, so callers can tell held seats from allocated ones
+        held = dict(
+            db.session.query(SeatHold.trip_id, func.sum(SeatHold.count))
+            .filter(SeatHold.trip_id.in_(trip_ids), SeatHold.status == "HELD")
+            .group_by(SeatHold.trip_id)
+            .all()
+        )
+        return jsonify([dict(serialize_trip(t), seats_held=int(held.get(t.id) or 0)) for t in trips])
 
     @app.get("/trips/<int:trip_id>")
     def get_trip(trip_id: int) -> Any:
-        trip = Trip.query.get(trip_id)
+        trip = find_trip(trip_id)
         if trip is None:
             return jsonify({"error": "trip not found"}), 404
         return jsonify(serialize_trip(trip))
 
+    @app.get("/trips/stream")
+    def stream_availability() -> Any:
+        # Server-sent events: a snapshot, then coalesced seats_available changes
+        if not (app.config["STREAMS"] or app.config["STREAM_SERVER"]):
+            return jsonify({"error": "availability streams are served by the stream server"}), 503
+        try:
+            trip_ids = {int(t) for t in request.args.get("ids", "").split(",") if t}
+        except ValueError:
+            return jsonify({"error": "ids must be comma separated integers"}), 400
+        if not trip_ids or len(trip_ids) > app.config["STREAM_MAX_TRIPS"]:
+            return jsonify({"error": f"between 1 and {app.config['STREAM_MAX_TRIPS']} ids required"}), 400
+        sub, snapshot = feed.subscribe(trip_ids)
+        stream = feed.stream(sub, snapshot, app.config["STREAM_MIN_INTERVAL"], app.config["STREAM_KEEPALIVE"])
+        resp = Response(stream, mimetype="text/event-stream")
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Accel-Buffering"] = "no"
+        return resp
+
     @app.get("/trips/<int:trip_id>/availability")
     def trip_availability(trip_id: int) -> Any:
-        trip = Trip.query.get(trip_id)
+        trip = find_trip(trip_id)
         if trip is None:
             return jsonify({"error": "trip not found"}), 404
         return jsonify({"trip_id": trip.id, "seats_available": trip.seats_available})
 
+    @app.get("/trips/<int:trip_id>/seatmap")
+    def trip_seatmap(trip_id: int) -> Any:
+        trip = find_trip(trip_id)
+        if trip is None:
+            return jsonify({"error": "trip not found"}), 404
+        return jsonify(serialize_seatmap(trip))
+
     @app.post("/trips/<int:trip_id>/allocate")
     def allocate_seats(trip_id: int) -> Any:
-        data = request.get_json(force=True) or {}
-        try:
-            count = int(data.get("count", 0))
-        except Exception:
-            return jsonify({"error": "count must be integer"}), 400
-        if count <= 0:
-            return jsonify({"error": "count must be positive"}), 400
+        count, seats, adjacent, error = parse_seats(request.get_json(force=True) or {})
+        if error:
+            return jsonify({"error": error}), 400
+
+        inventory = app.extensions.get("seat_inventory")
+        # Numbered seats live in the trip row, so they always take the row lock
+        if inventory is not None and not seats and not adjacent:
+            result = inventory.allocate(trip_id, count)
+            if result.status == "not_found":
+                return jsonify({"error": "trip not found"}), 404
+            if result.status == "insufficient":
+                return jsonify({"error": "insufficient_seats", "available": result.seats_available}), 409
+            if result.status == "unavailable":
+                return jsonify({"error": "inventory_unavailable"}), 503
+            seats_moved(app, [(trip_id, result.seats_available)], engine_managed=True)
+            return jsonify({"trip_id": trip_id, "allocated": count, "seats_available": result.seats_available})
 
         # Transaction with row-level lock
         trip = (
@@ -204,22 +780,69 @@ def register_routes(app: Flask) -> None:
         )
         if trip is None:
             return jsonify({"error": "trip not found"}), 404
-        if trip.seats_available < count:
-            return jsonify({"error": "insufficient_seats", "available": trip.seats_available}), 409
-        trip.seats_available -= count
+        before = seats_before([trip])
+        picked, error = take_seats(trip, count, seats, adjacent)
+        if error:
+            return jsonify(error), 409
+        refresh_calendar([trip], before)
         db.session.commit()
-        return jsonify({"trip_id": trip.id, "allocated": count, "seats_available": trip.seats_available})
+        seats_moved(app, [(trip.id, trip.seats_available)])
+        result = {"trip_id": trip.id, "allocated": count, "seats_available": trip.seats_available}
+        if picked is not None:
+            result["seats"] = picked
+        return jsonify(result)
 
     @app.post("/trips/<int:trip_id>/release")
     def release_seats(trip_id: int) -> Any:
+        count, seats, _adjacent, error = parse_seats(request.get_json(force=True) or {})
+        if error:
+            return jsonify({"error": error}), 400
+
+        inventory = app.extensions.get("seat_inventory")
+        if inventory is not None and not seats:
+            result = inventory.release(trip_id, count)
+            if result.status == "not_found":
+                return jsonify({"error": "trip not found"}), 404
+            if result.status != "ok":
+                return jsonify({"error": "inventory_unavailable"}), 503
+            seats_moved(app, [(trip_id, result.seats_available)], engine_managed=True)
+            return jsonify({"trip_id": trip_id, "released": result.amount, "seats_available": result.seats_available})
+
+        trip = (
+            db.session.query(Trip)
+            .filter(Trip.id == trip_id)
+            .with_for_update()
+            .one_or_none()
+        )
+        if trip is None:
+            return jsonify({"error": "trip not found"}), 404
+        before = seats_before([trip])
+        released, freed = free_seats(trip, count, seats)
+        refresh_calendar([trip], before)
+        db.session.commit()
+        seats_moved(app, [(trip.id, trip.seats_available)])
+        result = {"trip_id": trip.id, "released": released, "seats_available": trip.seats_available}
+        if freed is not None:
+            result["seats"] = freed
+        return jsonify(result)
+
+    @app.post("/trips/<int:trip_id>/hold")
+    def hold_seats(trip_id: int) -> Any:
         data = request.get_json(force=True) or {}
         try:
             count = int(data.get("count", 0))
+            ttl = int(data.get("ttl_seconds") or app.config["HOLD_TTL_SECONDS"])
         except Exception:
-            return jsonify({"error": "count must be integer"}), 400
+            return jsonify({"error": "count and ttl_seconds must be integers"}), 400
+        owner = data.get("owner")
+        if owner is not None and (not isinstance(owner, str) or len(owner) > 80):
+            return jsonify({"error": "owner must be a string of at most 80 characters"}), 400
         if count <= 0:
             return jsonify({"error": "count must be positive"}), 400
+        if not 1 <= ttl <= app.config["HOLD_MAX_TTL_SECONDS"]:
+            return jsonify({"error": f"ttl_seconds must be between 1 and {app.config['HOLD_MAX_TTL_SECONDS']}"}), 400
 
+        # Held seats leave seats_available right away, like an allocation
         trip = (
             db.session.query(Trip)
             .filter(Trip.id == trip_id)
@@ -228,17 +851,480 @@ def register_routes(app: Flask) -> None:
         )
         if trip is None:
             return jsonify({"error": "trip not found"}), 404
-        # Do not exceed seats_total
-        new_available = min(trip.seats_total, trip.seats_available + count)
-        actually_released = new_available - trip.seats_available
-        trip.seats_available = new_available
+        if trip.seats_available < count:
+            return jsonify({"error": "insufficient_seats", "available": trip.seats_available}), 409
+        before = seats_before([trip])
+        trip.seats_available -= count
+        hold = SeatHold(
+            id=uuid.uuid4().hex,
+            trip_id=trip.id,
+            count=count,
+            owner=owner,
+            status="HELD",
+            expires_at=datetime.utcnow() + timedelta(seconds=ttl),
+        )
+        db.session.add(hold)
+        refresh_calendar([trip], before)
         db.session.commit()
-        return jsonify({"trip_id": trip.id, "released": actually_released, "seats_available": trip.seats_available})
+        seats_moved(app, [(trip.id, trip.seats_available)])
+        sweeper.track(hold.id, hold.expires_at)
+        result = serialize_hold(hold)
+        result["seats_available"] = trip.seats_available
+        return jsonify(result), 201
 
+    @app.get("/holds/<hold_id>")
+    def get_hold(hold_id: str) -> Any:
+        hold = db.session.get(SeatHold, hold_id)
+        if hold is None:
+            return jsonify({"error": "hold not found"}), 404
+        return jsonify(serialize_hold(hold))
 
-def serialize_trip(trip: Trip) -> Dict[str, Any]:
-    route = trip.route
+    @app.post("/holds/<hold_id>/confirm")
+    def confirm_hold(hold_id: str) -> Any:
+        # The seats were taken when the hold was placed: no availability check
+        hold = lock_hold(hold_id, hold_owner())
+        if hold is None:
+            db.session.rollback()
+            return jsonify({"error": "hold not found"}), 404
+        error = hold_closed_error(hold)
+        if error:
+            db.session.rollback()
+            return error
+        hold.status = "CONFIRMED"
+        hold.closed_at = datetime.utcnow()
+        db.session.commit()
+        return jsonify(serialize_hold(hold))
+
+    @app.post("/holds/<hold_id>/release")
+    def release_hold(hold_id: str) -> Any:
+        hold = lock_hold(hold_id, hold_owner())
+        if hold is None:
+            db.session.rollback()
+            return jsonify({"error": "hold not found"}), 404
+        error = hold_closed_error(hold)
+        if error:
+            db.session.rollback()
+            return error
+        trip = (
+            db.session.query(Trip)
+            .filter(Trip.id == hold.trip_id)
+            .with_for_update()
+            .one()
+        )
+        hold.status = "RELEASED"
+        hold.closed_at = datetime.utcnow()
+        before = seats_before([trip])
+        free_seats(trip, hold.count)
+        refresh_calendar([trip], before)
+        db.session.commit()
+        seats_moved(app, [(trip.id, trip.seats_available)])
+        result = serialize_hold(hold)
+        result["seats_available"] = trip.seats_available
+        return jsonify(result)
+
+    @app.post("/trips/allocate-batch")
+    def allocate_batch() -> Any:
+        counts, seats, error = parse_batch(request.get_json(force=True))
+        if error:
+            return jsonify({"error": error}), 400
+
+        trips = lock_trips(list(counts))
+        missing = [trip_id for trip_id in counts if trip_id not in trips]
+        if missing:
+            db.session.rollback()
+            return jsonify({"error": "trip not found", "trip_ids": missing}), 404
+        short = [
+            {"trip_id": trip_id, "requested": count, "available": trips[trip_id].seats_available}
+            for trip_id, count in counts.items()
+            if trips[trip_id].seats_available < count
+        ]
+        if short:
+            db.session.rollback()
+            return jsonify({"error": "insufficient_seats", "results": short}), 409
+
+        before = seats_before(trips.values())
+        results = []
+        for trip_id, count in counts.items():
+            picked, error = take_seats(trips[trip_id], count, seats.get(trip_id))
+            if error:
+                db.session.rollback()
+                return jsonify(dict(error, trip_id=trip_id)), 409
+            results.append({"trip_id": trip_id, "allocated": count})
+            if picked is not None:
+                results[-1]["seats"] = picked
+        refresh_calendar(trips.values(), before)
+        db.session.commit()
+        seats_moved(app, [(trip.id, trip.seats_available) for trip in trips.values()])
+        for item in results:
+            item["seats_available"] = trips[item["trip_id"]].seats_available
+        return jsonify({"results": results})
+
+    @app.post("/trips/release-batch")
+    def release_batch() -> Any:
+        data = request.get_json(force=True)
+        counts, seats, error = parse_batch(data)
+        if error:
+            return jsonify({"error": error}), 400
+        items = data.get("items") if isinstance(data, dict) else data
+        release_ids = [item.get("release_id") for item in items if item.get("release_id") is not None]
+        if any(not isinstance(release_id, str) or len(release_id) > 64 for release_id in release_ids):
+            return jsonify({"error": "release_id must be a string of at most 64 characters"}), 400
+
+        duplicates = 0
+        if release_ids:
+            # At-least-once senders tag items with a release_id: skip the ones
+            # already applied and record the rest in this transaction
+            seen = applied_releases(release_ids)
+            fresh = []
+            for item in items:
+                release_id = item.get("release_id")
+                if release_id is not None:
+                    if release_id in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(release_id)
+                    db.session.add(AppliedRelease(release_id=release_id))
+                fresh.append(item)
+            counts, seats, _ = parse_batch(fresh) if fresh else ({}, {}, None)
+
+        trips = lock_trips(list(counts))
+        missing = [trip_id for trip_id in counts if trip_id not in trips]
+        if missing:
+            db.session.rollback()
+            return jsonify({"error": "trip not found", "trip_ids": missing}), 404
+
+        before = seats_before(trips.values())
+        results = []
+        for trip_id, count in counts.items():
+            released, freed = free_seats(trips[trip_id], count, seats.get(trip_id))
+            results.append({"trip_id": trip_id, "released": released})
+            if freed is not None:
+                results[-1]["seats"] = freed
+        refresh_calendar(trips.values(), before)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent delivery of the same release_id won; the sender
+            # retries and finds it applied
+            db.session.rollback()
+            return jsonify({"error": "release in progress"}), 409
+        seats_moved(app, [(trip.id, trip.seats_available) for trip in trips.values()])
+        for item in results:
+            item["seats_available"] = trips[item["trip_id"]].seats_available
+        return jsonify({"results": results, "duplicates": duplicates})
+
+
+def parse_seats(data: Dict[str, Any]) -> Tuple[int, Optional[List[int]], bool, Optional[str]]:
+    # {"count": n}, {"seats": [numbers]} or {"count": n, "adjacent": true}.
+    # count defaults to the number of seats; any beyond them stay unnumbered
+    invalid = "count must be integer and seats a list of seat numbers"
+    try:
+        seats = data.get("seats")
+        if seats is not None and not isinstance(seats, list):
+            return 0, None, False, invalid
+        seats = [int(seat) for seat in seats] if seats is not None else None
+        count = int(data.get("count") or len(seats or []))
+    except Exception:
+        return 0, None, False, invalid
+    adjacent = bool(data.get("adjacent"))
+    if count <= 0:
+        return 0, None, False, "count must be positive"
+    if seats is not None:
+        error = seats_error(seats, count)
+        if error:
+            return 0, None, False, error
+        if adjacent:
+            return 0, None, False, "seats and adjacent cannot be combined"
+        seats = sorted(seats)
+    return count, seats, adjacent, None
+
+
+def seats_error(seats: List[int], count: int) -> Optional[str]:
+    if not seats or min(seats) < 1 or len(set(seats)) != len(seats):
+        return "seats must be distinct positive seat numbers"
+    if len(seats) > count:
+        return "count must not be smaller than the number of seats"
+    return None
+
+
+def parse_batch(data: Any) -> Tuple[Dict[int, int], Dict[int, List[int]], Optional[str]]:
+    items = (data or {}).get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return {}, {}, "items must be a non-empty list of {trip_id, count}"
+    counts: Dict[int, int] = {}
+    seats: Dict[int, List[int]] = {}
+    for item in items:
+        try:
+            trip_id = int(item.get("trip_id"))
+            if item.get("seats") is not None and not isinstance(item["seats"], list):
+                return {}, {}, "seats must be a list of seat numbers"
+            numbers = [int(seat) for seat in item.get("seats") or []]
+            count = int(item.get("count") or len(numbers))
+        except Exception:
+            return {}, {}, "trip_id and count must be integers"
+        if count <= 0:
+            return {}, {}, "count must be positive"
+        # Several legs on the same trip are merged into one change
+        counts[trip_id] = counts.get(trip_id, 0) + count
+        if numbers:
+            seats.setdefault(trip_id, []).extend(numbers)
+    for trip_id, numbers in seats.items():
+        error = seats_error(numbers, counts[trip_id])
+        if error:
+            return {}, {}, f"trip {trip_id}: {error}"
+        numbers.sort()
+    return counts, seats, None
+
+
+def take_seats(
+    trip: Trip, count: int, seats: Optional[List[int]] = None, adjacent: bool = False
+) -> Tuple[Optional[List[int]], Optional[Dict[str, Any]]]:
+    # Caller holds the row lock. Numbered seats come out of the seat map and
+    # seats_available together, the rest only out of seats_available
+    if trip.seats_available < count:
+        return None, {"error": "insufficient_seats", "available": trip.seats_available}
+    picked = None
+    if seats or adjacent:
+        if trip.seats_total > seatmap.MAX_SEATS:
+            return None, {"error": "seat_map_unsupported", "seats_total": trip.seats_total}
+        taken = seatmap.decode(trip.seat_map)
+        if adjacent:
+            wanted = seatmap.find_adjacent(taken, trip.seats_total, count)
+            if not wanted:
+                return None, {"error": "no_adjacent_seats", "available": trip.seats_available}
+        else:
+            if seats[-1] > trip.seats_total:
+                return None, {"error": "invalid_seat", "seats_total": trip.seats_total}
+            wanted = seatmap.mask_of(seats)
+            if wanted & taken:
+                return None, {"error": "seats_taken", "seats": seatmap.seat_numbers(wanted & taken)}
+        trip.seat_map = seatmap.encode(taken | wanted, trip.seats_total)
+        picked = seatmap.seat_numbers(wanted)
+        trip.seats_assigned += len(picked)
+    trip.seats_available -= count
+    return picked, None
+
+
+def free_seats(trip: Trip, count: int, seats: Optional[List[int]] = None) -> Tuple[int, Optional[List[int]]]:
+    # Caller holds the row lock. Numbered seats are freed only if still taken,
+    # and unnumbered ones never lift seats_available past the seats left
+    # unassigned in the map
+    freed = None
+    available = trip.seats_available
+    if seats:
+        taken = seatmap.decode(trip.seat_map)
+        mask = seatmap.mask_of(seats) & taken
+        trip.seat_map = seatmap.encode(taken & ~mask, trip.seats_total)
+        freed = seatmap.seat_numbers(mask)
+        trip.seats_assigned -= len(freed)
+        available += len(freed)
+        count -= len(seats)
+    new_available = min(trip.seats_total - trip.seats_assigned, available + count)
+    released = new_available - trip.seats_available
+    trip.seats_available = new_available
+    return released, freed
+
+
+def applied_releases(release_ids: List[str]) -> Set[str]:
+    rows = db.session.query(AppliedRelease.release_id).filter(AppliedRelease.release_id.in_(set(release_ids)))
+    return {release_id for (release_id,) in rows}
+
+
+def lock_trips(trip_ids: List[int]) -> Dict[int, Trip]:
+    # Lock rows in primary key order so concurrent batches cannot deadlock
+    trips = (
+        db.session.query(Trip)
+        .filter(Trip.id.in_(trip_ids))
+        .order_by(Trip.id)
+        .with_for_update()
+        .all()
+    )
+    return {trip.id: trip for trip in trips}
+
+
+def find_trip(trip_id: int) -> Optional[Any]:
+    # Live trip, else the archived copy of a departed one
+    trip = Trip.query.get(trip_id)
+    if trip is None:
+        trip = TripArchive.query.filter(TripArchive.id == trip_id).first()
+    return trip
+
+
+def seats_before(trips: Iterable[Trip]) -> Dict[int, int]:
+    # Taken right after the row lock, for refresh_calendar
+    return {trip.id: trip.seats_available for trip in trips}
+
+
+def refresh_calendar(trips: Iterable[Trip], before: Dict[int, int]) -> None:
+    # Keep route_day_stats in the same transaction as the trip changes; last
+    # statement before the commit, see daily_stats
+    db.session.flush()
+    move_seats(
+        db.session.connection(),
+        [(trip.route_id, trip.departure_time.date(), before[trip.id], trip.seats_available) for trip in trips],
+    )
+
+
+def lock_hold(hold_id: str, owner: Optional[str] = None) -> Optional[SeatHold]:
+    # Confirm, release and the sweeper all lock the hold row before its trip.
+    # Someone else's hold looks like a missing one
+    hold = (
+        db.session.query(SeatHold)
+        .filter(SeatHold.id == hold_id)
+        .with_for_update()
+        .one_or_none()
+    )
+    if hold is not None and owner is not None and hold.owner != owner:
+        return None
+    return hold
+
+
+def hold_owner() -> Optional[str]:
+    # Callers acting for a user name them; internal callers may omit it
+    data = request.get_json(silent=True)
+    owner = data.get("owner") if isinstance(data, dict) else None
+    return owner if isinstance(owner, str) else None
+
+
+def hold_closed_error(hold: SeatHold) -> Optional[Any]:
+    # A HELD row past its TTL is expired even if the sweeper has not run yet
+    if hold.status == "EXPIRED" or (hold.status == "HELD" and hold.expires_at <= datetime.utcnow()):
+        return jsonify({"error": "hold_expired", "hold_id": hold.id}), 410
+    if hold.status != "HELD":
+        return jsonify({"error": f"hold_{hold.status.lower()}", "hold_id": hold.id}), 409
+    return None
+
+
+def seats_moved(app: Flask, changes: Iterable[Tuple[int, int]], engine_managed: bool = False) -> None:
+    # Called after a commit that changed seats_available of the given trips
+    inventory = app.extensions.get("seat_inventory")
+    search_cache = app.extensions["search_cache"]
+    changes = list(changes)
+    app.extensions["change_feed"].publish(changes)
+    for trip_id, seats_available in changes:
+        if inventory is not None and not engine_managed:
+            # Seats changed outside the inventory engine: drop its cached counter
+            inventory.invalidate(trip_id)
+        search_cache.update_trip(trip_id, seats_available)
+
+
+def trips_archived(app: Flask, trip_ids: List[int]) -> None:
+    # Archived trips can no longer be allocated: drop their inventory slots
+    inventory = app.extensions.get("seat_inventory")
+    if inventory is not None:
+        for trip_id in trip_ids:
+            inventory.invalidate(trip_id)
+
+
+def parse_page_args() -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    # Keyset pagination: ?after_id=<last id seen>&limit=<page size>
+    try:
+        after_id = int(request.args["after_id"]) if request.args.get("after_id") else None
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+    except ValueError:
+        return None, None, "after_id and limit must be integers"
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        return None, None, f"limit must be between 1 and {MAX_PAGE_SIZE}"
+    return after_id, limit, None
+
+
+def wants_ndjson() -> bool:
+    return request.args.get("format") == "ndjson" or request.accept_mimetypes.best == "application/x-ndjson"
+
+
+def stream_ndjson(query: Any, serialize: Callable[[Any], Dict[str, Any]]) -> Response:
+    # yield_per streams rows from a server-side cursor, so memory stays flat
+    def generate() -> Iterator[str]:
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            yield json.dumps(serialize(row)) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def paged_response(items: List[Any], limit: Optional[int], serialize: Callable[[Any], Dict[str, Any]]) -> Response:
+    resp = jsonify([serialize(item) for item in items])
+    if limit is not None and len(items) == limit:
+        resp.headers["X-Next-After-Id"] = str(items[-1].id)
+    return resp
+
+
+def serialize_route(route: Route) -> Dict[str, Any]:
+    return {
+        "id": route.id,
+        "origin": route.origin,
+        "destination": route.destination,
+        "duration_minutes": route.duration_minutes,
+    }
+
+
+def serialize_day(row: RouteDayStats, min_available: int) -> Dict[str, Any]:
+    return {
+        "date": row.day.isoformat(),
+        "trips": row.trip_count,
+        "seats_total": row.seats_total,
+        "seats_available": row.seats_available,
+        "min_seats_available": min_available,
+    }
+
+
+def serialize_occupancy(key: Dict[str, Any], trips: int, seats_total: int, seats_available: int) -> Dict[str, Any]:
+    seats_taken = int(seats_total) - int(seats_available)
+    return dict(
+        key,
+        trips=int(trips),
+        seats_total=int(seats_total),
+        seats_taken=seats_taken,
+        occupancy=round(seats_taken / seats_total, 4) if seats_total else 0.0,
+    )
+
+
+def serialize_seatmap(trip: Any) -> Dict[str, Any]:
     return {
+        "trip_id": trip.id,
+        "seats_total": trip.seats_total,
+        "seats_available": trip.seats_available,
+        # Booked or held without a seat number
+        "seats_unnumbered": trip.seats_total - trip.seats_available - trip.seats_assigned,
+        "taken": seatmap.seat_numbers(seatmap.decode(trip.seat_map)),
+        "seat_map": (trip.seat_map or b"").hex(),
+    }
+
+
+def serialize_itinerary(legs: List[Leg]) -> Dict[str, Any]:
+    return {
+        "departure_time": legs[0].departure_time.isoformat(),
+        "arrival_time": legs[-1].arrival_time.isoformat(),
+        "duration_minutes": int((legs[-1].arrival_time - legs[0].departure_time).total_seconds() // 60),
+        "transfers": len(legs) - 1,
+        "legs": [
+            {
+                "trip_id": leg.trip_id,
+                "route_id": leg.route_id,
+                "origin": leg.origin,
+                "destination": leg.destination,
+                "departure_time": leg.departure_time.isoformat(),
+                "arrival_time": leg.arrival_time.isoformat(),
+                "seats_available": leg.seats_available,
+            }
+            for leg in legs
+        ],
+    }
+
+
+def serialize_hold(hold: SeatHold) -> Dict[str, Any]:
+    return {
+        "hold_id": hold.id,
+        "trip_id": hold.trip_id,
+        "count": hold.count,
+        "owner": hold.owner,
+        "status": hold.status,
+        "expires_at": hold.expires_at.isoformat(),
+    }
+
+
+def serialize_trip(trip: Any) -> Dict[str, Any]:
+    route = trip.route
+    data = {
         "id": trip.id,
         "route": {
             "id": route.id,
@@ -249,6 +1335,9 @@ def serialize_trip(trip: Trip) -> Dict[str, Any]:
         "seats_total": trip.seats_total,
         "seats_available": trip.seats_available,
     }
+    if isinstance(trip, TripArchive):
+        data["archived"] = True
+    return data
 
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import Flask
+from sqlalchemy import delete, insert, literal, select
+
+from daily_stats import remove_trips, repair_minimums
+from models import db, AppliedRelease, SeatHold, Trip, TripArchive
+from partitions import ensure_month_partitions
+
+# Moves departed trips out of `trips` into `trips_archive`.
+#
+# Each batch locks up to `batch_size` trips that departed before the cutoff
+# (midnight, `after_days` ago, so whole days move together), copies them
+# with INSERT ... SELECT, drops their closed holds and deletes them, all in
+# one transaction. The archived trips are subtracted from route_day_stats in
+# the same transaction, which removes their days from the calendar. Trips that still have
+# an open hold wait for the sweeper. Rows are claimed with SKIP LOCKED, so
+# every gunicorn worker can run an archiver. GET endpoints fall back to the
+# archive for ids they do not find (see app.find_trip).
+#
+# The same thread recomputes route_day_stats minimums that a delta left
+# unknown, and prunes applied_releases rows older than
+# `release_retention_days`, long after the sender stopped retrying them.
+
+logger = logging.getLogger(__name__)
+
+trips_table = Trip.__table__
+archive_table = TripArchive.__table__
+COLUMNS = [
+    "id", "route_id", "departure_time", "seats_total", "seats_available", "seat_map", "seats_assigned", "created_at"
+]
+
+
+class TripArchiver:
+    def __init__(
+        self,
+        app: Flask,
+        on_archived: Callable[[List[int]], None],
+        after_days: int = 30,
+        batch_size: int = 500,
+        interval: float = 3600.0,
+        partitioning: bool = False,
+        months_ahead: int = 3,
+        release_retention_days: int = 7,
+    ) -> None:
+        self.app = app
+        self.on_archived = on_archived
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.partitioning = partitioning
+        self.months_ahead = months_ahead
+        self.release_retention_days = release_retention_days
+        self.archived = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="trip-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def cutoff(self) -> datetime:
+        return datetime.combine(date.today() - timedelta(days=self.after_days), datetime.min.time())
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception:
+                logger.exception("trip archival failed")
+            self._stop.wait(self.interval)
+
+    def run(self, max_batches: Optional[int] = None) -> int:
+        # Batches until nothing is left to move (or max_batches)
+        total = 0
+        batches = 0
+        with self.app.app_context():
+            try:
+                if self.partitioning:
+                    self.ensure_partitions()
+                while max_batches is None or batches < max_batches:
+                    claimed, moved = self._archive_batch()
+                    total += len(moved)
+                    batches += 1
+                    if moved:
+                        self.on_archived(moved)
+                    # Stop when drained, or when everything left waits on a hold
+                    if claimed < self.batch_size or not moved:
+                        break
+                self.repair_minimums()
+                self.prune_releases()
+            finally:
+                db.session.remove()
+        return total
+
+    def ensure_partitions(self) -> int:
+        added = ensure_month_partitions(
+            db.session.connection(), archive_table.name, "departure_time", self.cutoff().date(), self.months_ahead
+        )
+        db.session.commit()
+        return added
+
+    def repair_minimums(self) -> int:
+        repaired = 0
+        while True:
+            count = repair_minimums(db.session.connection(), self.batch_size)
+            db.session.commit()
+            repaired += count
+            if count < self.batch_size:
+                return repaired
+
+    def prune_releases(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=self.release_retention_days)
+        pruned = 0
+        while True:
+            ids = [
+                release_id
+                for (release_id,) in db.session.query(AppliedRelease.release_id)
+                .filter(AppliedRelease.applied_at < cutoff)
+                .limit(self.batch_size)
+            ]
+            if ids:
+                db.session.query(AppliedRelease).filter(AppliedRelease.release_id.in_(ids)).delete(
+                    synchronize_session=False
+                )
+            db.session.commit()
+            pruned += len(ids)
+            if len(ids) < self.batch_size:
+                return pruned
+
+    def _archive_batch(self) -> Tuple[int, List[int]]:
+        cutoff = self.cutoff()
+        rows = (
+            db.session.query(Trip.id, Trip.route_id, Trip.departure_time, Trip.seats_total, Trip.seats_available)
+            .filter(Trip.departure_time < cutoff)
+            .order_by(Trip.departure_time)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not rows:
+            db.session.rollback()
+            return 0, []
+        claimed = len(rows)
+        # Hold creation locks the trip first, so no new hold can appear now
+        open_holds = {
+            trip_id
+            for (trip_id,) in db.session.query(SeatHold.trip_id)
+            .filter(SeatHold.trip_id.in_([row.id for row in rows]), SeatHold.status == "HELD")
+            .distinct()
+        }
+        rows = [row for row in rows if row.id not in open_holds]
+        ids = [row.id for row in rows]
+        if ids:
+            conn = db.session.connection()
+            now = datetime.utcnow()
+            conn.execute(
+                insert(archive_table).from_select(
+                    COLUMNS + ["archived_at"],
+                    select(*(trips_table.c[name] for name in COLUMNS), literal(now)).where(trips_table.c.id.in_(ids)),
+                )
+            )
+            conn.execute(delete(SeatHold.__table__).where(SeatHold.__table__.c.trip_id.in_(ids)))
+            conn.execute(delete(trips_table).where(trips_table.c.id.in_(ids)))
+            remove_trips(
+                conn, [(row.route_id, row.departure_time.date(), row.seats_total, row.seats_available) for row in rows]
+            )
+        db.session.commit()
+        self.archived += len(ids)
+        return claimed, ids
+
+    def stats(self) -> Dict[str, int]:
+        return {"archived": self.archived}
@@ -0,0 +1,152 @@
+import json
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from flask import Flask
+
+from models import db, Trip
+
+# Seat availability change feed for /trips/stream.
+#
+# One feed per process. Changes committed by this process arrive through
+# `publish` (called from seats_moved) right after the commit; changes made
+# by other workers or services are picked up by a single poller thread that
+# reads the watched trips once per `poll_interval`, however many clients
+# watch them. Each subscription keeps only the latest value per trip, so a
+# slow client gets one coalesced update per interval instead of a backlog.
+
+logger = logging.getLogger(__name__)
+
+POLL_CHUNK = 500
+
+
+class Subscription:
+    def __init__(self, trip_ids: Set[int]) -> None:
+        self.trip_ids = trip_ids
+        self.pending: Dict[int, int] = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+
+    def offer(self, trip_id: int, seats_available: int) -> None:
+        with self.lock:
+            self.pending[trip_id] = seats_available
+        self.ready.set()
+
+    def drain(self) -> Dict[int, int]:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.ready.clear()
+        return pending
+
+
+class ChangeFeed:
+    def __init__(self, app: Flask, poll_interval: float = 1.0) -> None:
+        self.app = app
+        self.poll_interval = poll_interval
+        self._latest: Dict[int, int] = {}
+        self._watchers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, trip_ids: Iterable[int]) -> Tuple[Subscription, Dict[int, int]]:
+        # Returns the subscription and a snapshot of the trips that exist.
+        # Watchers are registered first so nobody drops our trips meanwhile.
+        sub = Subscription(set(trip_ids))
+        with self._lock:
+            for trip_id in sub.trip_ids:
+                self._watchers.setdefault(trip_id, set()).add(sub)
+            missing = [t for t in sub.trip_ids if t not in self._latest]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="seat-change-feed", daemon=True)
+                self._thread.start()
+        rows = []
+        if missing:
+            rows = db.session.query(Trip.id, Trip.seats_available).filter(Trip.id.in_(missing)).all()
+            # Hand the connection back; the stream outlives the request
+            db.session.rollback()
+        with self._lock:
+            for trip_id, seats_available in rows:
+                self._latest.setdefault(trip_id, seats_available)
+        unknown = {t for t in sub.trip_ids if t not in self._latest}
+        if unknown:
+            self.unsubscribe(sub, unknown)
+            sub.trip_ids -= unknown
+        with self._lock:
+            snapshot = {t: self._latest[t] for t in sub.trip_ids if t in self._latest}
+        return sub, snapshot
+
+    def unsubscribe(self, sub: Subscription, trip_ids: Optional[Set[int]] = None) -> None:
+        with self._lock:
+            for trip_id in sub.trip_ids if trip_ids is None else trip_ids:
+                watchers = self._watchers.get(trip_id)
+                if watchers is None:
+                    continue
+                watchers.discard(sub)
+                if not watchers:
+                    del self._watchers[trip_id]
+                    self._latest.pop(trip_id, None)
+
+    def publish(self, changes: Iterable[Tuple[int, int]]) -> None:
+        with self._lock:
+            for trip_id, seats_available in changes:
+                watchers = self._watchers.get(trip_id)
+                if not watchers or self._latest.get(trip_id) == seats_available:
+                    continue
+                self._latest[trip_id] = seats_available
+                for sub in watchers:
+                    sub.offer(trip_id, seats_available)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                watched = list(self._watchers)
+            if not watched:
+                continue
+            try:
+                with self.app.app_context():
+                    try:
+                        for start in range(0, len(watched), POLL_CHUNK):
+                            rows = (
+                                db.session.query(Trip.id, Trip.seats_available)
+                                .filter(Trip.id.in_(watched[start:start + POLL_CHUNK]))
+                                .all()
+                            )
+                            self.publish(rows)
+                    finally:
+                        db.session.remove()
+            except Exception:
+                logger.exception("seat change feed poll failed")
+
+    def stream(self, sub: Subscription, snapshot: Dict[int, int], min_interval: float, keepalive: float) -> Iterator[str]:
+        try:
+            yield sse_event("snapshot", snapshot)
+            last_sent = time.monotonic()
+            while True:
+                if not sub.ready.wait(keepalive):
+                    yield ": keepalive\n\n"
+                    continue
+                # Coalesce: changes arriving within min_interval go out together
+                delay = last_sent + min_interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                updates = sub.drain()
+                if updates:
+                    yield sse_event("seats", updates)
+                    last_sent = time.monotonic()
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            subs: Set[Subscription] = set()
+            for watchers in self._watchers.values():
+                subs |= watchers
+            return {"subscriptions": len(subs), "watched_trips": len(self._watchers)}
+
+
+def sse_event(name: str, seats: Dict[int, int]) -> str:
+    data: List[Dict[str, int]] = [{"trip_id": t, "seats_available": s} for t, s in sorted(seats.items())]
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
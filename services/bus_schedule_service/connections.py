@@ -0,0 +1,171 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from models import db, Route, Trip
+
+# Connection search over the route network.
+#
+# RouteGraph keeps an adjacency list city -> outgoing routes, rebuilt when
+# this process changes routes (invalidate) and at least every `ttl` seconds
+# so changes made by other workers show up. A search first walks the graph
+# to find the routes that can be part of an itinerary within `max_legs`,
+# loads their departures in the time window with one query, and then runs
+# a time-dependent earliest-arrival search: labels are (arrival time, city)
+# popped in arrival order. Every departure from the origin seeds a label;
+# later labels are expanded with the first departure per outgoing route that
+# leaves after the transfer window. Itineraries come out ranked by arrival.
+
+
+class Edge(NamedTuple):
+    route_id: int
+    destination: str
+    duration: timedelta
+
+
+class Leg(NamedTuple):
+    trip_id: int
+    route_id: int
+    origin: str
+    destination: str
+    departure_time: datetime
+    arrival_time: datetime
+    seats_available: int
+
+
+class RouteGraph:
+    def __init__(self, default_duration_minutes: int = 240, ttl: float = 60.0) -> None:
+        self.default_duration = timedelta(minutes=default_duration_minutes)
+        self.ttl = ttl
+        self._adjacency: Dict[str, List[Edge]] = {}
+        self._reverse: Dict[str, Set[str]] = {}
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        self._built_at = None
+
+    def adjacency(self) -> Dict[str, List[Edge]]:
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > self.ttl:
+            self._build()
+        return self._adjacency
+
+    def _build(self) -> None:
+        with self._lock:
+            adjacency: Dict[str, List[Edge]] = defaultdict(list)
+            reverse: Dict[str, Set[str]] = defaultdict(set)
+            for route_id, origin, destination, minutes in db.session.query(
+                Route.id, Route.origin, Route.destination, Route.duration_minutes
+            ):
+                duration = timedelta(minutes=minutes) if minutes else self.default_duration
+                adjacency[origin].append(Edge(route_id, destination, duration))
+                reverse[destination].add(origin)
+            # Swap in whole structures so concurrent searches see one version
+            self._adjacency, self._reverse = dict(adjacency), dict(reverse)
+            self._built_at = time.monotonic()
+
+    def candidate_routes(self, origin: str, destination: str, max_legs: int) -> Set[int]:
+        # Routes on some path origin -> destination of at most max_legs hops
+        adjacency = self.adjacency()
+        reverse = self._reverse
+        to_destination = {destination: 0}
+        frontier = [destination]
+        for hops in range(1, max_legs):
+            next_frontier = []
+            for target in frontier:
+                for city in reverse.get(target, ()):
+                    if city not in to_destination:
+                        to_destination[city] = hops
+                        next_frontier.append(city)
+            frontier = next_frontier
+        routes: Set[int] = set()
+        from_origin = {origin: 0}
+        frontier = [origin]
+        for hops in range(max_legs):
+            next_frontier = []
+            for city in frontier:
+                for edge in adjacency.get(city, ()):
+                    remaining = to_destination.get(edge.destination)
+                    if remaining is None or hops + 1 + remaining > max_legs:
+                        continue
+                    routes.add(edge.route_id)
+                    if edge.destination not in from_origin:
+                        from_origin[edge.destination] = hops + 1
+                        next_frontier.append(edge.destination)
+            frontier = next_frontier
+        return routes
+
+    def search(
+        self,
+        origin: str,
+        destination: str,
+        depart_after: datetime,
+        window: timedelta,
+        seats: int = 1,
+        max_legs: int = 3,
+        min_transfer: timedelta = timedelta(minutes=30),
+        limit: int = 5,
+    ) -> List[List[Leg]]:
+        routes = self.candidate_routes(origin, destination, max_legs)
+        if not routes:
+            return []
+        adjacency = self.adjacency()
+
+        # One query for every departure the search may use
+        departures: Dict[int, List[Tuple[datetime, int, int]]] = defaultdict(list)
+        rows = db.session.query(Trip.route_id, Trip.departure_time, Trip.id, Trip.seats_available).filter(
+            Trip.route_id.in_(routes),
+            Trip.departure_time >= depart_after,
+            Trip.departure_time < depart_after + window,
+            Trip.seats_available >= seats,
+        )
+        for route_id, departure_time, trip_id, seats_available in rows:
+            departures[route_id].append((departure_time, trip_id, seats_available))
+        for times in departures.values():
+            times.sort()
+
+        results: List[List[Leg]] = []
+        # Each city is settled at most `limit` times: enough for `limit`
+        # distinct itineraries without exploring every label
+        settled: Dict[str, int] = defaultdict(int)
+        counter = 0
+        heap: List[Tuple[datetime, int, str, Tuple[Leg, ...]]] = [(depart_after, counter, origin, ())]
+        while heap and len(results) < limit:
+            arrival, _n, city, path = heapq.heappop(heap)
+            if city == destination and path:
+                results.append(list(path))
+                continue
+            if settled[city] >= limit or len(path) >= max_legs:
+                continue
+            settled[city] += 1
+            ready = arrival + min_transfer if path else arrival
+            visited = {origin} | {leg.destination for leg in path}
+            for edge in adjacency.get(city, ()):
+                if edge.route_id not in routes or edge.destination in visited:
+                    continue
+                times = departures.get(edge.route_id)
+                if not times:
+                    continue
+                index = bisect_left(times, (ready,))
+                # Every departure from the origin starts its own itinerary;
+                # after that the first connecting departure is the best one
+                for departure_time, trip_id, seats_available in times[index:] if not path else times[index:index + 1]:
+                    leg = Leg(
+                        trip_id, edge.route_id, city, edge.destination,
+                        departure_time, departure_time + edge.duration, seats_available,
+                    )
+                    counter += 1
+                    heapq.heappush(heap, (leg.arrival_time, counter, edge.destination, path + (leg,)))
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cities": len(self._adjacency),
+            "routes": sum(len(edges) for edges in self._adjacency.values()),
+            "age_seconds": None if self._built_at is None else round(time.monotonic() - self._built_at, 1),
+        }
@@ -0,0 +1,227 @@
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, insert, or_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+
+from models import RouteDayStats, Trip
+
+# Per-route, per-day seat aggregates behind the calendar endpoints.
+#
+# Every write path that adds, removes or moves seats on trips applies the
+# change to route_day_stats as a delta inside its own transaction
+# (`move_seats`, `add_trips`, `remove_trips`), so a row is never out of step
+# with the trips it summarizes. A delta is one UPDATE ... SET x = x + d on
+# the (route, day) row and never reads other trips, so concurrent bookings
+# on different trips of the same day cannot lose each other's updates. It is
+# the last statement before the commit, so the row lock is held only for
+# the commit.
+#
+# A delta can only lower min_seats_available. When a trip that may hold the
+# minimum gains seats or goes away, the minimum becomes MIN_UNKNOWN: reads
+# resolve it from the day's trips (`day_minimums`) and the archiver repairs
+# it (`repair_minimums`), skipping rows whose version moved on meanwhile.
+
+Key = Tuple[int, date]
+
+trips_table = Trip.__table__
+stats_table = RouteDayStats.__table__
+KEYS_PER_QUERY = 100
+MIN_UNKNOWN = -1
+
+
+class _Delta:
+    __slots__ = ("trips", "seats_total", "seats_available", "lowest", "raised_from")
+
+    def __init__(self) -> None:
+        self.trips = 0
+        self.seats_total = 0
+        self.seats_available = 0
+        self.lowest: Optional[int] = None  # smallest new value, may lower the minimum
+        self.raised_from: Optional[int] = None  # smallest value that went up or away
+
+    def lower(self, value: int) -> None:
+        self.lowest = value if self.lowest is None else min(self.lowest, value)
+
+    def raise_from(self, value: int) -> None:
+        self.raised_from = value if self.raised_from is None else min(self.raised_from, value)
+
+
+def move_seats(conn: Connection, changes: Iterable[Tuple[int, date, int, int]]) -> None:
+    # (route_id, day, seats_available before, after) per trip
+    deltas: Dict[Key, _Delta] = {}
+    for route_id, day, before, after in changes:
+        if after == before:
+            continue
+        delta = deltas.setdefault((route_id, day), _Delta())
+        delta.seats_available += after - before
+        if after < before:
+            delta.lower(after)
+        else:
+            delta.raise_from(before)
+    _apply(conn, deltas)
+
+
+def add_trips(conn: Connection, trips: Iterable[Tuple[int, date, int, int]]) -> None:
+    # (route_id, day, seats_total, seats_available) per new trip
+    deltas: Dict[Key, _Delta] = {}
+    for route_id, day, seats_total, seats_available in trips:
+        delta = deltas.setdefault((route_id, day), _Delta())
+        delta.trips += 1
+        delta.seats_total += seats_total
+        delta.seats_available += seats_available
+        delta.lower(seats_available)
+    _apply(conn, deltas)
+
+
+def remove_trips(conn: Connection, trips: Iterable[Tuple[int, date, int, int]]) -> None:
+    # (route_id, day, seats_total, seats_available) per deleted trip
+    deltas: Dict[Key, _Delta] = {}
+    for route_id, day, seats_total, seats_available in trips:
+        delta = deltas.setdefault((route_id, day), _Delta())
+        delta.trips -= 1
+        delta.seats_total -= seats_total
+        delta.seats_available -= seats_available
+        delta.raise_from(seats_available)
+    _apply(conn, deltas)
+
+
+def day_minimums(conn: Any, keys: Iterable[Key]) -> Dict[Key, int]:
+    # Smallest seats_available per (route, day), read from the trips; takes a
+    # Connection or a Session, so GET requests can read it from a replica
+    keys = sorted(set(keys))
+    minimums: Dict[Key, int] = {}
+    for start in range(0, len(keys), KEYS_PER_QUERY):
+        chunk = keys[start:start + KEYS_PER_QUERY]
+        rows = conn.execute(
+            select(trips_table.c.route_id, trips_table.c.departure_time, trips_table.c.seats_available).where(
+                or_(*(_day_filter(route_id, day) for route_id, day in chunk))
+            )
+        )
+        for route_id, departure, seats_available in rows:
+            key = (route_id, departure.date())
+            minimums[key] = min(minimums.get(key, seats_available), seats_available)
+    return minimums
+
+
+def repair_minimums(conn: Connection, limit: int = 500) -> int:
+    # The version and the trips are read in one snapshot; a row whose version
+    # changed since then is left for the next run
+    c = stats_table.c
+    rows = conn.execute(
+        select(c.route_id, c.day, c.version).where(c.min_seats_available == MIN_UNKNOWN).limit(limit)
+    ).all()
+    if not rows:
+        return 0
+    minimums = day_minimums(conn, [(route_id, day) for route_id, day, _version in rows])
+    repaired = 0
+    for route_id, day, version in rows:
+        if (route_id, day) not in minimums:
+            continue
+        repaired += conn.execute(
+            update(stats_table)
+            .where(c.route_id == route_id, c.day == day, c.version == version)
+            .values(min_seats_available=minimums[(route_id, day)])
+        ).rowcount
+    return repaired
+
+
+def rebuild(conn: Connection) -> int:
+    # Full recomputation, for databases that predate the table
+    stats: Dict[Key, List] = {}
+    rows = conn.execution_options(yield_per=1000).execute(
+        select(
+            trips_table.c.route_id,
+            trips_table.c.departure_time,
+            trips_table.c.seats_total,
+            trips_table.c.seats_available,
+        )
+    )
+    for route_id, departure, seats_total, seats_available in rows:
+        _add(stats.setdefault((route_id, departure.date()), [0, 0, 0, None]), seats_total, seats_available)
+    conn.execute(delete(stats_table))
+    for (route_id, day), (trip_count, seats_total, seats_available, min_available) in stats.items():
+        conn.execute(
+            insert(stats_table).values(
+                route_id=route_id,
+                day=day,
+                trip_count=trip_count,
+                seats_total=seats_total,
+                seats_available=seats_available,
+                min_seats_available=min_available,
+            )
+        )
+    return len(stats)
+
+
+def _day_filter(route_id: int, day: date):
+    start = datetime.combine(day, datetime.min.time())
+    return and_(
+        trips_table.c.route_id == route_id,
+        trips_table.c.departure_time >= start,
+        trips_table.c.departure_time < start + timedelta(days=1),
+    )
+
+
+def _add(values: List, seats_total: int, seats_available: int) -> None:
+    values[0] += 1
+    values[1] += seats_total
+    values[2] += seats_available
+    values[3] = seats_available if values[3] is None else min(values[3], seats_available)
+
+
+def _apply(conn: Connection, deltas: Dict[Key, _Delta]) -> None:
+    c = stats_table.c
+    # Rows in key order, so concurrent writers lock them in the same order
+    for (route_id, day), delta in sorted(deltas.items()):
+        # An unknown minimum stays unknown. A new value at or below the
+        # minimum is the new minimum, since every other trip is at or above
+        # the old one; otherwise a trip at the minimum that went up or away
+        # leaves it unknown
+        whens = [(c.min_seats_available == MIN_UNKNOWN, MIN_UNKNOWN)]
+        if delta.lowest is not None:
+            whens.append((c.min_seats_available >= delta.lowest, delta.lowest))
+        if delta.raised_from is not None:
+            whens.append((c.min_seats_available >= delta.raised_from, MIN_UNKNOWN))
+        # Each SET expression reads only its own column, so MySQL's
+        # left-to-right ON DUPLICATE KEY UPDATE sees the old row throughout
+        values = {
+            "trip_count": c.trip_count + delta.trips,
+            "seats_total": c.seats_total + delta.seats_total,
+            "seats_available": c.seats_available + delta.seats_available,
+            "min_seats_available": case(*whens, else_=c.min_seats_available),
+            "version": c.version + 1,
+        }
+        key = and_(c.route_id == route_id, c.day == day)
+        if delta.trips > 0:
+            row = {
+                "route_id": route_id,
+                "day": day,
+                "trip_count": delta.trips,
+                "seats_total": delta.seats_total,
+                "seats_available": delta.seats_available,
+                "min_seats_available": delta.lowest,
+            }
+            _upsert(conn, key, row, values)
+            continue
+        conn.execute(update(stats_table).where(key).values(**values))
+        if delta.trips < 0:
+            conn.execute(delete(stats_table).where(key, c.trip_count <= 0))
+
+
+def _upsert(conn: Connection, key: Any, row: Dict[str, Any], values: Dict[str, Any]) -> None:
+    # One statement: two writers adding the first trips of a day must not
+    # both find the row missing and both insert it
+    dialect = conn.dialect.name
+    if dialect == "mysql":
+        conn.execute(mysql_insert(stats_table).values(**row).on_duplicate_key_update(**values))
+    elif dialect == "sqlite":
+        conn.execute(
+            sqlite_insert(stats_table)
+            .values(**row)
+            .on_conflict_do_update(index_elements=[stats_table.c.route_id, stats_table.c.day], set_=values)
+        )
+    elif not conn.execute(update(stats_table).where(key).values(**values)).rowcount:
+        conn.execute(insert(stats_table).values(**row))
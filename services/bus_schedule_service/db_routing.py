@@ -0,0 +1,139 @@
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import Flask, Response, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Select
+
+# Read/write splitting between the primary and optional read replicas. The
+# schedule and reservation services carry identical copies of this module.
+#
+# Each GET/HEAD request picks one replica (round robin) in before_request and
+# RoutingSession sends that request's plain SELECTs to it. Everything else
+# uses the primary: other methods, flushes, SELECT ... FOR UPDATE, code
+# running outside a request (seeding, background threads) and views marked
+# with @primary. After a write, the same client (same Authorization header,
+# else address) keeps reading from the primary for `pin_seconds`, so it sees
+# its own writes despite replica lag. The pin is kept in-process and handed
+# to the client for requests that land on another worker: as a cookie, and
+# as the PIN_HEADER response header that cross-origin clients (which do not
+# send cookies) echo back on their next requests.
+
+PIN_COOKIE = "db_primary_until"
+PIN_HEADER = "X-DB-Primary-Until"
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper: Any = None, clause: Any = None, bind: Any = None, **kwargs: Any) -> Any:
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get("db_replica")
+            if replica is not None and isinstance(clause, Select) and clause._for_update_arg is None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def primary(view: Callable) -> Callable:
+    # Views whose reads must not lag behind the primary
+    view.db_primary_only = True
+    return view
+
+
+class ReadRouter:
+    def __init__(
+        self,
+        replica_uris: List[str],
+        engine_options: Callable[[str], Dict[str, Any]] = lambda uri: {},
+        pin_seconds: float = 5.0,
+        retry_after: float = 10.0,
+        max_pins: int = 100000,
+    ) -> None:
+        self.engines: List[Engine] = [create_engine(uri, **engine_options(uri)) for uri in replica_uris]
+        self.pin_seconds = pin_seconds
+        self.retry_after = retry_after
+        self.max_pins = max_pins
+        self._next = itertools.cycle(range(len(self.engines))) if self.engines else None
+        self._down_until: Dict[int, float] = {}
+        self._pins: "OrderedDict[bytes, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.routed = {"primary": 0, "replica": 0}
+        for index, engine in enumerate(self.engines):
+            self._watch(index, engine)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["db_router"] = self
+        if not self.engines:
+            return
+
+        @app.before_request
+        def _choose_engine() -> None:
+            g.db_replica = self.choose(app)
+
+        @app.after_request
+        def _pin_writer(resp: Response) -> Response:
+            if request.method not in ("GET", "HEAD", "OPTIONS") and resp.status_code < 400:
+                until = time.time() + self.pin_seconds
+                self._pin(self._client_key(), until)
+                value = str(int(until) + 1)
+                resp.set_cookie(PIN_COOKIE, value, max_age=int(self.pin_seconds) + 1, httponly=True, samesite="Lax")
+                resp.headers[PIN_HEADER] = value
+            return resp
+
+    def choose(self, app: Flask) -> Optional[Engine]:
+        view = app.view_functions.get(request.endpoint or "")
+        if request.method not in ("GET", "HEAD") or getattr(view, "db_primary_only", False) or self._pinned():
+            self.routed["primary"] += 1
+            return None
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            index = next(self._next)
+            if self._down_until.get(index, 0) <= now:
+                self.routed["replica"] += 1
+                return self.engines[index]
+        # Every replica is marked down
+        self.routed["primary"] += 1
+        return None
+
+    def _pinned(self) -> bool:
+        now = time.time()
+        for value in (request.cookies.get(PIN_COOKIE), request.headers.get(PIN_HEADER)):
+            try:
+                # Capped, so a made-up value cannot pin a client for long
+                if value and now < float(value) <= now + self.pin_seconds + 1:
+                    return True
+            except ValueError:
+                pass
+        until = self._pins.get(self._client_key())
+        return until is not None and until > time.time()
+
+    def _pin(self, key: bytes, until: float) -> None:
+        with self._lock:
+            self._pins[key] = until
+            self._pins.move_to_end(key)
+            while len(self._pins) > self.max_pins:
+                self._pins.popitem(last=False)
+
+    @staticmethod
+    def _client_key() -> bytes:
+        identity = request.headers.get("Authorization") or request.remote_addr or ""
+        return hashlib.sha256(identity.encode()).digest()
+
+    def _watch(self, index: int, engine: Engine) -> None:
+        # Take a replica out of rotation for a while when it cannot be reached
+        @event.listens_for(engine, "handle_error")
+        def _on_error(context: Any) -> None:
+            if context.is_disconnect or context.connection is None:
+                self._down_until[index] = time.monotonic() + self.retry_after
+
+    def stats(self) -> Dict[str, int]:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.engines),
+            "replicas_down": sum(1 for until in self._down_until.values() if until > now),
+            "pinned_clients": len(self._pins),
+        }
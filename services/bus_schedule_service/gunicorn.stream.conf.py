@@ -0,0 +1,22 @@
+import os
+
+# Availability streams only: `gunicorn -c gunicorn.stream.conf.py wsgi:app`,
+# next to the main server, with /trips/stream routed here.
+# gevent workers park every open stream on a greenlet rather than a thread,
+# so a few processes hold thousands of subscribers while the gthread server
+# keeps its threads for allocate and search. Workers here run no background
+# jobs and leave the schema to the main server.
+
+os.environ["STREAM_SERVER"] = "1"
+os.environ.setdefault("SKIP_BOOTSTRAP", "1")
+
+bind = f"0.0.0.0:{os.environ.get('STREAM_PORT', '5003')}"
+workers = int(os.environ.get("STREAM_WORKERS", "2"))
+worker_class = "gevent"
+worker_connections = int(os.environ.get("STREAM_WORKER_CONNECTIONS", "5000"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+preload_app = False
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
@@ -0,0 +1,146 @@
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import Flask
+
+from daily_stats import move_seats
+from models import db, SeatHold, Trip
+
+# Expiry of seat holds.
+#
+# Every hold this process creates (or finds HELD at startup) is pushed onto a
+# min-heap keyed by its expiry time. The sweeper thread sleeps until the
+# earliest expiry, pops everything that is due and expires it in one
+# transaction, returning the seats per trip in bulk. The table is never
+# scanned: the only query over it is the indexed (status, expires_at) load
+# in `recover`. Confirm and release lock the hold row too, so whichever
+# transaction gets there first decides the hold's fate.
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 1.0
+
+
+class HoldSweeper:
+    def __init__(
+        self,
+        app: Flask,
+        on_release: Callable[[List[Tuple[int, int]]], None],
+        batch_size: int = 500,
+    ) -> None:
+        self.app = app
+        self.on_release = on_release
+        self.batch_size = batch_size
+        self._heap: List[Tuple[datetime, str]] = []
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self.expired = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="hold-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    def track(self, hold_id: str, expires_at: datetime) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (expires_at, hold_id))
+            # Only a new earliest deadline changes how long the sweeper sleeps
+            if self._heap[0][1] == hold_id:
+                self._cond.notify()
+
+    def recover(self) -> int:
+        # Holds left HELD by a previous process (or another worker's restart)
+        rows = db.session.query(SeatHold.id, SeatHold.expires_at).filter(SeatHold.status == "HELD").all()
+        with self._cond:
+            for hold_id, expires_at in rows:
+                heapq.heappush(self._heap, (expires_at, hold_id))
+            self._cond.notify()
+        return len(rows)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop:
+                    if self._heap:
+                        wait = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._stop:
+                    return
+                now = datetime.utcnow()
+                due: List[str] = []
+                while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                    due.append(heapq.heappop(self._heap)[1])
+            try:
+                self.expire(due)
+            except Exception:
+                logger.exception("expiring %d holds failed, retrying later", len(due))
+                retry_at = datetime.utcnow() + timedelta(seconds=RETRY_SECONDS)
+                with self._cond:
+                    for hold_id in due:
+                        heapq.heappush(self._heap, (retry_at, hold_id))
+
+    def expire(self, hold_ids: List[str]) -> List[Tuple[int, int]]:
+        if not hold_ids:
+            return []
+        with self.app.app_context():
+            try:
+                changes = self._expire(hold_ids)
+            finally:
+                db.session.remove()
+        if changes:
+            self.on_release(changes)
+        return changes
+
+    def _expire(self, hold_ids: List[str]) -> List[Tuple[int, int]]:
+        now = datetime.utcnow()
+        holds = (
+            db.session.query(SeatHold)
+            .filter(SeatHold.id.in_(hold_ids), SeatHold.status == "HELD", SeatHold.expires_at <= now)
+            .with_for_update()
+            .all()
+        )
+        if not holds:
+            db.session.rollback()
+            return []
+        counts: Dict[int, int] = {}
+        for hold in holds:
+            hold.status = "EXPIRED"
+            hold.closed_at = now
+            counts[hold.trip_id] = counts.get(hold.trip_id, 0) + hold.count
+        # Same lock order as the batch endpoints: trips by primary key
+        trips = (
+            db.session.query(Trip)
+            .filter(Trip.id.in_(list(counts)))
+            .order_by(Trip.id)
+            .with_for_update()
+            .all()
+        )
+        before = {trip.id: trip.seats_available for trip in trips}
+        for trip in trips:
+            # Numbered seats (seats_assigned) are never released by a hold
+            trip.seats_available = min(trip.seats_total - trip.seats_assigned, trip.seats_available + counts[trip.id])
+        db.session.flush()
+        move_seats(
+            db.session.connection(),
+            [(trip.route_id, trip.departure_time.date(), before[trip.id], trip.seats_available) for trip in trips],
+        )
+        db.session.commit()
+        self.expired += len(holds)
+        return [(trip.id, trip.seats_available) for trip in trips]
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self._heap), "expired": self.expired}
@@ -0,0 +1,301 @@
+import atexit
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.engine import Engine
+
+from daily_stats import move_seats
+from models import Trip
+
+# In-process seat counters for hot trips.
+#
+# Requests do an atomic check-and-decrement against the in-memory counter and
+# then wait for a single flusher thread that group-commits the queued deltas
+# of every request that arrived meanwhile in one transaction. The flush locks
+# the batch's rows and decides every delta against them, in order, so the
+# database stays the source of truth and other processes can never make us
+# oversell; a request is only answered after its delta is durable, so nothing
+# has to be replayed after a restart. A request that times out while its
+# delta is still queued is withdrawn; one already being flushed waits for the
+# outcome, so a 503 never hides a committed change. Counters are simply
+# rebuilt from `trips.seats_available` (see `recover`). Numbered seats (see
+# seatmap) never go through the engine; releases are capped at the seats left
+# unassigned by the flush, never by the (possibly stale) counter.
+
+trips_table = Trip.__table__
+capacity = (trips_table.c.seats_total - trips_table.c.seats_assigned).label("capacity")
+
+
+class InventoryResult(NamedTuple):
+    status: str  # ok / not_found / insufficient / unavailable
+    trip_id: int
+    amount: int
+    seats_available: int
+
+
+class _Slot:
+    __slots__ = ("lock", "seats_available", "pending", "loaded_at")
+
+    def __init__(self, seats_available: int) -> None:
+        self.lock = threading.Lock()
+        self.seats_available = seats_available
+        self.pending = 0  # sum of queued, not yet committed deltas
+        self.loaded_at = time.monotonic()
+
+
+class _Op:
+    __slots__ = ("trip_id", "delta", "slot", "done", "status", "amount", "seats_available")
+
+    def __init__(self, trip_id: int, delta: int, slot: _Slot) -> None:
+        self.trip_id = trip_id
+        self.delta = delta
+        self.slot = slot
+        self.done = threading.Event()
+        self.status = "unavailable"
+        self.amount = 0  # seats actually moved
+        self.seats_available = 0
+
+
+class SeatInventory:
+    def __init__(
+        self,
+        engine: Engine,
+        max_batch: int = 1000,
+        max_trips: int = 50000,
+        reload_interval: float = 1.0,
+        wait_timeout: float = 10.0,
+    ) -> None:
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_trips = max_trips
+        self.reload_interval = reload_interval
+        self.wait_timeout = wait_timeout
+        self._slots: Dict[int, _Slot] = {}
+        self._slots_lock = threading.Lock()
+        self._queue: Deque[_Op] = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    # Lifecycle
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="seat-inventory-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.wait_timeout)
+
+    def recover(self, trip_ids: Optional[Iterable[int]] = None, horizon_hours: int = 72) -> int:
+        # Rebuild counters after a restart. Only committed deltas were ever
+        # acknowledged, so loading the current rows is all that is needed.
+        stmt = select(trips_table.c.id, trips_table.c.seats_available)
+        if trip_ids is not None:
+            stmt = stmt.where(trips_table.c.id.in_(list(trip_ids)))
+        else:
+            now = datetime.utcnow()
+            stmt = stmt.where(
+                trips_table.c.departure_time >= now,
+                trips_table.c.departure_time <= now + timedelta(hours=horizon_hours),
+            )
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+        with self._slots_lock:
+            for trip_id, seats_available in rows:
+                if trip_id not in self._slots:
+                    self._slots[trip_id] = _Slot(seats_available)
+        return len(rows)
+
+    def invalidate(self, trip_id: int) -> None:
+        # Called when seats move outside the engine (batch endpoints, holds, ...)
+        with self._slots_lock:
+            slot = self._slots.get(trip_id)
+            if slot is not None and slot.pending == 0:
+                del self._slots[trip_id]
+
+    # Request path
+
+    def allocate(self, trip_id: int, count: int) -> InventoryResult:
+        slot = self._slot(trip_id)
+        if slot is None:
+            return InventoryResult("not_found", trip_id, 0, 0)
+        with slot.lock:
+            if slot.seats_available < count and time.monotonic() - slot.loaded_at >= self.reload_interval:
+                # Another process may have released seats since we loaded
+                self._reload(trip_id, slot)
+            if slot.seats_available < count:
+                return InventoryResult("insufficient", trip_id, 0, slot.seats_available)
+            slot.seats_available -= count
+            slot.pending -= count
+            op = _Op(trip_id, -count, slot)
+        self._submit(op)
+        return InventoryResult(op.status, trip_id, op.amount, op.seats_available)
+
+    def release(self, trip_id: int, count: int) -> InventoryResult:
+        slot = self._slot(trip_id)
+        if slot is None:
+            return InventoryResult("not_found", trip_id, 0, 0)
+        with slot.lock:
+            # The flush caps this at seats_total - seats_assigned
+            slot.seats_available += count
+            slot.pending += count
+            op = _Op(trip_id, count, slot)
+        self._submit(op)
+        return InventoryResult(op.status, trip_id, op.amount, op.seats_available)
+
+    def stats(self) -> Dict[str, int]:
+        return {"trips": len(self._slots), "queued": len(self._queue)}
+
+    # Internals
+
+    def _slot(self, trip_id: int) -> Optional[_Slot]:
+        slot = self._slots.get(trip_id)
+        if slot is not None:
+            return slot
+        with self.engine.connect() as conn:
+            row = conn.execute(select(trips_table.c.seats_available).where(trips_table.c.id == trip_id)).first()
+        if row is None:
+            return None
+        with self._slots_lock:
+            slot = self._slots.get(trip_id)
+            if slot is None:
+                if len(self._slots) >= self.max_trips:
+                    self._evict_idle()
+                slot = _Slot(row[0])
+                self._slots[trip_id] = slot
+        return slot
+
+    def _evict_idle(self) -> None:
+        for trip_id in [k for k, s in self._slots.items() if s.pending == 0][: max(1, self.max_trips // 10)]:
+            del self._slots[trip_id]
+
+    def _reload(self, trip_id: int, slot: _Slot) -> None:
+        # Caller holds slot.lock
+        with self.engine.connect() as conn:
+            row = conn.execute(select(trips_table.c.seats_available).where(trips_table.c.id == trip_id)).first()
+        if row is not None:
+            slot.seats_available = row[0] + slot.pending
+        slot.loaded_at = time.monotonic()
+
+    def _submit(self, op: _Op) -> None:
+        with self._cond:
+            self._queue.append(op)
+            self._cond.notify()
+        if op.done.wait(self.wait_timeout):
+            return
+        with self._cond:
+            try:
+                self._queue.remove(op)
+            except ValueError:
+                # Already taken by the flusher: its outcome is the answer
+                pass
+            else:
+                with op.slot.lock:
+                    op.slot.seats_available -= op.delta
+                    op.slot.pending -= op.delta
+                    op.slot.loaded_at = 0.0
+                    op.seats_available = op.slot.seats_available
+                return
+        op.done.wait()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running and not self._queue:
+                    return
+                batch: List[_Op] = []
+                while self._queue and len(batch) < self.max_batch:
+                    batch.append(self._queue.popleft())
+            self._flush(batch)
+
+    def _flush(self, batch: List[_Op]) -> None:
+        by_trip: Dict[int, List[_Op]] = {}
+        for op in batch:
+            by_trip.setdefault(op.trip_id, []).append(op)
+
+        committed: Dict[int, int] = {}
+        try:
+            with self.engine.begin() as conn:
+                # Lock the batch's rows in id order, then decide every delta
+                # against their current values, in arrival order
+                rows = conn.execute(
+                    select(
+                        trips_table.c.id,
+                        trips_table.c.route_id,
+                        trips_table.c.departure_time,
+                        capacity,
+                        trips_table.c.seats_available,
+                    )
+                    .where(trips_table.c.id.in_(list(by_trip)))
+                    .order_by(trips_table.c.id)
+                    .with_for_update()
+                ).all()
+                changes = []
+                moved = []
+                for trip_id, route_id, departure, seats_capacity, seats_available in rows:
+                    before = seats_available
+                    for op in by_trip[trip_id]:
+                        if op.delta < 0:
+                            if seats_available + op.delta < 0:
+                                op.status = "insufficient"
+                                continue
+                            op.amount = -op.delta
+                            seats_available += op.delta
+                        else:
+                            op.amount = max(0, min(op.delta, seats_capacity - seats_available))
+                            seats_available += op.amount
+                        op.status = "ok"
+                    committed[trip_id] = seats_available
+                    if seats_available != before:
+                        changes.append({"row_id": trip_id, "new_available": seats_available})
+                        moved.append((route_id, departure.date(), before, seats_available))
+                if changes:
+                    conn.execute(
+                        update(trips_table)
+                        .where(trips_table.c.id == bindparam("row_id"))
+                        .values(seats_available=bindparam("new_available")),
+                        changes,
+                    )
+                    move_seats(conn, moved)
+            for trip_id in by_trip.keys() - committed.keys():
+                # Deleted since its slot was loaded
+                for op in by_trip[trip_id]:
+                    op.status = "not_found"
+        except Exception:
+            committed = {}
+            for op in batch:
+                op.status = "unavailable"
+                op.amount = 0
+
+        for trip_id, ops in by_trip.items():
+            seats = committed.get(trip_id)
+            for slot in {id(op.slot): op.slot for op in ops}.values():
+                delta = sum(op.delta for op in ops if op.slot is slot)
+                with slot.lock:
+                    slot.pending -= delta
+                    if seats is not None:
+                        slot.seats_available = seats + slot.pending
+                        slot.loaded_at = time.monotonic()
+                    else:
+                        # Nothing was written: undo the optimistic change
+                        slot.seats_available -= delta
+                        slot.loaded_at = 0.0
+            for op in ops:
+                op.seats_available = seats if seats is not None else op.slot.seats_available
+                op.done.set()
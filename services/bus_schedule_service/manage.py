@@ -0,0 +1,25 @@
+import argparse
+import logging
+import time
+
+from app import bootstrap
+
+# One-shot schema and seed tasks, run once per deploy before the web workers
+# start (which then run with SKIP_BOOTSTRAP=1):
+#
+#   python manage.py migrate seed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bus schedule service maintenance tasks")
+    parser.add_argument("commands", nargs="+", choices=["migrate", "seed"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    for command in args.commands:
+        started = time.monotonic()
+        bootstrap([command])
+        logging.info("%s done in %.2fs", command, time.monotonic() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from flask import Flask, Response, current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Request, SQL and outbound-call instrumentation exported in Prometheus text
+# format on /metrics. Kept dependency-free; the schedule and reservation
+# services carry identical copies of this module. Every gunicorn worker keeps
+# its own numbers, labelled with its pid.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # one slot per bucket, then +Inf, sum
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self, extra: Labels) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            labels = extra + key
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_fmt(labels + (('le', _num(bound)),))} {_num(count)}")
+            lines.append(f"{self.name}_bucket{_fmt(labels + (('le', '+Inf'),))} {_num(series[-2])}")
+            lines.append(f"{self.name}_sum{_fmt(labels)} {series[-1]!r}")
+            lines.append(f"{self.name}_count{_fmt(labels)} {_num(series[-2])}")
+        return lines
+
+
+class _RequestStats:
+    __slots__ = ("started", "db_count", "db_time", "outbound_count", "outbound_time")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.outbound_count = 0
+        self.outbound_time = 0.0
+
+
+class Metrics:
+    def __init__(self, slow_request_ms: float = 0.0) -> None:
+        self.slow_request_ms = slow_request_ms
+        self.requests = Histogram("http_request_duration_seconds", "Request latency by route.", LATENCY_BUCKETS)
+        self.request_queries = Histogram("http_request_db_queries", "SQL statements per request.", QUERY_COUNT_BUCKETS)
+        self.request_db_time = Histogram("http_request_db_seconds", "Time spent in SQL per request.", LATENCY_BUCKETS)
+        self.queries = Histogram("db_query_duration_seconds", "SQL statement latency.", LATENCY_BUCKETS)
+        self.outbound = Histogram("outbound_request_duration_seconds", "Outbound HTTP latency.", LATENCY_BUCKETS)
+        self._collectors: List[Tuple[str, str, str, Callable[[], Dict[Labels, float]]]] = []
+        self._local = threading.local()
+        self._labels: Labels = (("pid", str(os.getpid())),)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["metrics"] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule("/metrics", "metrics", self._export)
+
+    def instrument_engine(self, engine: Engine) -> None:
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+            elapsed = time.perf_counter() - conn.info["query_started"].pop()
+            self.queries.observe(elapsed, operation=statement.lstrip().split(" ", 1)[0].upper())
+            stats = getattr(self._local, "stats", None)
+            if stats is not None:
+                stats.db_count += 1
+                stats.db_time += elapsed
+
+        @event.listens_for(engine, "handle_error")
+        def _error(context: Any) -> None:
+            # after_cursor_execute does not run for a statement that raised
+            started = context.connection.info.get("query_started") if context.connection is not None else None
+            if started and context.execution_context is not None:
+                started.pop()
+
+    def observe_outbound(self, target: str, method: str, path: str, status: int, seconds: float) -> None:
+        # Collapse ids so /trips/17/allocate and /trips/18/allocate share a series
+        self.outbound.observe(seconds, target=target, method=method, path=re.sub(r"/\d+", "/<id>", path), status=str(status))
+        stats = getattr(self._local, "stats", None)
+        if stats is not None:
+            stats.outbound_count += 1
+            stats.outbound_time += seconds
+
+    def gauge(self, name: str, help_text: str, collect: Callable[[], Dict[Labels, float]]) -> None:
+        # collect() returns {labels: value}, evaluated on every scrape
+        self._collectors.append((name, help_text, "gauge", collect))
+
+    def counter(self, name: str, help_text: str, collect: Callable[[], Dict[Labels, float]]) -> None:
+        self._collectors.append((name, help_text, "counter", collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for histogram in (self.requests, self.request_queries, self.request_db_time, self.queries, self.outbound):
+            lines.extend(histogram.render(self._labels))
+        for name, help_text, kind, collect in self._collectors:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in collect().items():
+                lines.append(f"{name}{_fmt(self._labels + tuple(labels))} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+    # Flask hooks
+
+    def _before_request(self) -> None:
+        self._local.stats = _RequestStats()
+
+    def _after_request(self, response: Response) -> Response:
+        stats = getattr(self._local, "stats", None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        self.requests.observe(elapsed, method=request.method, route=route, status=str(response.status_code))
+        self.request_queries.observe(stats.db_count, route=route)
+        self.request_db_time.observe(stats.db_time, route=route)
+        if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+            other = elapsed - stats.db_time - stats.outbound_time
+            current_app.logger.warning(
+                "slow request %s %s status=%s total=%.1fms db=%.1fms (%d queries) outbound=%.1fms (%d calls) app=%.1fms",
+                request.method, route, response.status_code, elapsed * 1000,
+                stats.db_time * 1000, stats.db_count, stats.outbound_time * 1000, stats.outbound_count, other * 1000,
+            )
+        return response
+
+    def _teardown_request(self, exc: Optional[BaseException]) -> None:
+        self._local.stats = None
+
+    def _export(self) -> Response:
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}"
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -4,7 +4,10 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
-db = SQLAlchemy()
+from db_routing import RoutingSession
+
+# Reads inside GET requests may go to a replica, see db_routing
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 class Route(db.Model):
@@ -13,6 +16,8 @@ class Route(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     origin = db.Column(db.String(100), nullable=False, index=True)
     destination = db.Column(db.String(100), nullable=False, index=True)
+    # Travel time, used to chain trips into connections; NULL means unknown
+    duration_minutes = db.Column(db.Integer, nullable=True)
 
     trips = relationship("Trip", back_populates="route", cascade="all, delete-orphan")
 
@@ -25,7 +30,79 @@ class Trip(db.Model):
     departure_time = db.Column(db.DateTime, nullable=False, index=True)
     seats_total = db.Column(db.Integer, nullable=False)
     seats_available = db.Column(db.Integer, nullable=False)
+    # Numbered seats: bitmap of taken seats and its popcount, see seatmap
+    seat_map = db.Column(db.VARBINARY(64), nullable=True)
+    seats_assigned = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     route = relationship("Route", back_populates="trips")
 
+    __table_args__ = (db.Index("ix_trips_route_departure", "route_id", "departure_time"),)
+
+
+class TripArchive(db.Model):
+    # Departed trips moved out of `trips` by the archiver, keeping their ids.
+    # No foreign keys and departure_time in the primary key, so the table can
+    # be partitioned by month (see partitions).
+    __tablename__ = "trips_archive"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    departure_time = db.Column(db.DateTime, primary_key=True)
+    route_id = db.Column(db.Integer, nullable=False)
+    seats_total = db.Column(db.Integer, nullable=False)
+    seats_available = db.Column(db.Integer, nullable=False)
+    seat_map = db.Column(db.VARBINARY(64), nullable=True)
+    seats_assigned = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    created_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    route = relationship("Route", primaryjoin="foreign(TripArchive.route_id) == Route.id", viewonly=True)
+
+    __table_args__ = (
+        db.Index("ix_trips_archive_id", "id"),
+        db.Index("ix_trips_archive_route_departure", "route_id", "departure_time"),
+    )
+
+
+class SeatHold(db.Model):
+    __tablename__ = "seat_holds"
+
+    id = db.Column(db.String(32), primary_key=True)
+    trip_id = db.Column(db.Integer, db.ForeignKey("trips.id"), nullable=False, index=True)
+    count = db.Column(db.Integer, nullable=False)
+    # Username the hold was placed for; confirm and release must name it
+    owner = db.Column(db.String(80), nullable=True)
+    # HELD -> CONFIRMED | RELEASED | EXPIRED
+    status = db.Column(db.String(20), nullable=False, default="HELD")
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index("ix_seat_holds_status_expires", "status", "expires_at"),)
+
+
+class AppliedRelease(db.Model):
+    # Release ids already applied by /trips/release-batch, so a redelivered
+    # outbox event is skipped; pruned by the archiver after a retention period
+    __tablename__ = "applied_releases"
+
+    release_id = db.Column(db.String(64), primary_key=True)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class RouteDayStats(db.Model):
+    # Per route and departure day, kept in step with trips by daily_stats
+    __tablename__ = "route_day_stats"
+
+    route_id = db.Column(db.Integer, db.ForeignKey("routes.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    trip_count = db.Column(db.Integer, nullable=False, default=0)
+    seats_total = db.Column(db.Integer, nullable=False, default=0)
+    seats_available = db.Column(db.Integer, nullable=False, default=0)
+    # -1 when unknown, see daily_stats
+    min_seats_available = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped by every delta, so a repair of the minimum can detect a race
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    # Network-wide occupancy reads a day range across all routes
+    __table_args__ = (db.Index("ix_route_day_stats_day", "day"),)
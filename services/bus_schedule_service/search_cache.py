@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# LRU cache of serialized /trips/search results keyed on (origin, destination, date).
+#
+# Writes in this process patch or drop the affected entries directly; the TTL
+# bounds how long a change committed by another worker can stay invisible.
+
+SearchKey = Tuple[str, str, date]
+
+
+class SearchCache:
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 30.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[SearchKey, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._by_trip: Dict[int, Set[SearchKey]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: SearchKey) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: SearchKey, trips: List[Dict[str, Any]]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), trips)
+            for trip in trips:
+                self._by_trip.setdefault(trip["id"], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def update_trip(self, trip_id: int, seats_available: int) -> None:
+        # Patch cached rows in place instead of dropping whole result lists
+        with self._lock:
+            for key in self._by_trip.get(trip_id, ()):
+                for trip in self._entries[key][1]:
+                    if trip["id"] == trip_id:
+                        trip["seats_available"] = seats_available
+
+    def invalidate(self, origin: str, destination: str, day: Optional[date] = None) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == origin and k[1] == destination]:
+                if day is None or key[2] == day:
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_trip.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, key: SearchKey) -> None:
+        # Caller holds self._lock
+        _stored_at, trips = self._entries.pop(key)
+        for trip in trips:
+            keys = self._by_trip.get(trip["id"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_trip[trip["id"]]
@@ -0,0 +1,55 @@
+from typing import Iterable, List, Optional
+
+# Seat-level assignment as a bitmap per trip: bit n-1 is set when seat n is
+# taken. The map is stored little-endian in trips.seat_map (NULL until a seat
+# is picked), so a 44-seat coach needs 6 bytes, and all operations below are
+# a handful of integer ops on it.
+#
+# Seats booked without a number stay anonymous: they only come out of
+# seats_available. trips.seats_assigned mirrors the popcount of the map, so
+# plain releases can be capped at seats_total - seats_assigned in SQL and a
+# numbered seat is never handed back twice.
+
+# Size of the VARBINARY(64) seat_map columns
+MAX_SEATS = 512
+
+
+def decode(raw: Optional[bytes]) -> int:
+    return int.from_bytes(raw or b"", "little")
+
+
+def encode(mask: int, seats_total: int) -> Optional[bytes]:
+    if not mask:
+        return None
+    return mask.to_bytes((seats_total + 7) // 8, "little")
+
+
+def mask_of(seats: Iterable[int]) -> int:
+    mask = 0
+    for seat in seats:
+        mask |= 1 << (seat - 1)
+    return mask
+
+
+def seat_numbers(mask: int) -> List[int]:
+    seats = []
+    while mask:
+        low = mask & -mask
+        seats.append(low.bit_length())
+        mask ^= low
+    return seats
+
+
+def find_adjacent(taken: int, seats_total: int, count: int) -> int:
+    # Lowest-numbered run of `count` free seats, as a mask (0 if none): after
+    # count-1 shift-and-steps, bit i survives only if seats i+1..i+count are
+    # all free, so the lowest surviving bit is the start of the run
+    if count <= 0 or count > seats_total:
+        return 0
+    runs = ~taken & ((1 << seats_total) - 1)
+    for _ in range(count - 1):
+        runs &= runs >> 1
+    if not runs:
+        return 0
+    start = (runs & -runs).bit_length() - 1
+    return ((1 << count) - 1) << start
@@ -0,0 +1,122 @@
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import insert
+
+from daily_stats import add_trips
+from models import db, Route, Trip
+
+# Materializes recurring departures into trips.
+#
+# Departures are generated lazily and written in chunks: per chunk the route
+# row is locked, departures that already exist are looked up through the
+# (route_id, departure_time) index and the rest go in as one multi-row
+# INSERT. Re-running the same rule therefore creates nothing, and two runs
+# for the same route cannot interleave inside a chunk.
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+class TimetableRule(NamedTuple):
+    start_date: date
+    end_date: date
+    weekdays: frozenset  # date.weekday() values
+    departure_times: Tuple[time, ...]
+    seats_total: int
+    exclude_dates: frozenset
+
+    def departures(self) -> Iterator[datetime]:
+        day = self.start_date
+        while day <= self.end_date:
+            if day.weekday() in self.weekdays and day not in self.exclude_dates:
+                for departure in self.departure_times:
+                    yield datetime.combine(day, departure)
+            day += timedelta(days=1)
+
+    def count(self) -> int:
+        return sum(1 for _ in self.departures())
+
+
+def parse_weekday(value: Any) -> int:
+    if isinstance(value, int) and 0 <= value <= 6:
+        return value
+    return WEEKDAYS.index(str(value).strip().lower()[:3])
+
+
+def parse_rule(data: Dict[str, Any], max_days: int) -> Tuple[Optional[TimetableRule], Optional[str]]:
+    try:
+        start_date = date.fromisoformat(data["start_date"])
+        end_date = date.fromisoformat(data["end_date"])
+    except Exception:
+        return None, "start_date and end_date (YYYY-MM-DD) required"
+    if end_date < start_date:
+        return None, "end_date is before start_date"
+    if (end_date - start_date).days >= max_days:
+        return None, f"date range is limited to {max_days} days"
+    try:
+        weekdays = frozenset(parse_weekday(d) for d in data.get("days_of_week") or range(7))
+    except ValueError:
+        return None, "days_of_week must be 0-6 (Monday=0) or day names"
+    try:
+        departure_times = tuple(sorted({time.fromisoformat(t) for t in data.get("departure_times") or []}))
+    except Exception:
+        return None, "departure_times must be HH:MM strings"
+    if not departure_times:
+        return None, "departure_times required"
+    try:
+        seats_total = int(data.get("seats_total"))
+    except Exception:
+        return None, "seats_total required"
+    if seats_total <= 0:
+        return None, "seats_total must be positive"
+    try:
+        exclude_dates = frozenset(date.fromisoformat(d) for d in data.get("exclude_dates") or [])
+    except Exception:
+        return None, "exclude_dates must be YYYY-MM-DD strings"
+    return TimetableRule(start_date, end_date, weekdays, departure_times, seats_total, exclude_dates), None
+
+
+def materialize(route_id: int, rule: TimetableRule, chunk_size: int = 1000) -> int:
+    created = 0
+    chunk: List[datetime] = []
+    for departure in rule.departures():
+        chunk.append(departure)
+        if len(chunk) >= chunk_size:
+            created += _insert_chunk(route_id, chunk, rule.seats_total)
+            chunk = []
+    if chunk:
+        created += _insert_chunk(route_id, chunk, rule.seats_total)
+    return created
+
+
+def _insert_chunk(route_id: int, departures: List[datetime], seats_total: int) -> int:
+    # Serializes timetable runs per route; the commit below releases the lock
+    db.session.query(Route.id).filter(Route.id == route_id).with_for_update().one()
+    existing = {
+        row[0]
+        for row in db.session.query(Trip.departure_time).filter(
+            Trip.route_id == route_id,
+            Trip.departure_time >= departures[0],
+            Trip.departure_time <= departures[-1],
+        )
+    }
+    now = datetime.utcnow()
+    rows = [
+        {
+            "route_id": route_id,
+            "departure_time": departure,
+            "seats_total": seats_total,
+            "seats_available": seats_total,
+            "created_at": now,
+        }
+        for departure in departures
+        if departure not in existing
+    ]
+    if rows:
+        db.session.execute(insert(Trip), rows)
+        add_trips(
+            db.session.connection(),
+            [(route_id, row["departure_time"].date(), seats_total, seats_total) for row in rows],
+        )
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,248 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from daily_stats import add_trips
+from models import db, Route, Trip
+
+# Streaming import/export of routes and trips as CSV or NDJSON.
+#
+# Export walks a server-side cursor (yield_per) over plain column tuples, so
+# nothing accumulates in the session and memory stays flat however large the
+# table. Import reads the request body line by line, resolves
+# (origin, destination) to route ids through an in-memory map, and writes
+# rows in batched transactions. Trips whose (route, departure_time) already
+# exists are skipped, so re-importing the same file is harmless.
+
+ROUTE_FIELDS = ["id", "origin", "destination", "duration_minutes"]
+TRIP_FIELDS = ["id", "route_id", "origin", "destination", "departure_time", "seats_total", "seats_available"]
+MAX_REPORTED_ERRORS = 100
+
+
+def export_lines(entity: str, fmt: str, batch_size: int = 1000) -> Iterator[str]:
+    if entity == "routes":
+        fields = ROUTE_FIELDS
+        query = db.session.query(Route.id, Route.origin, Route.destination, Route.duration_minutes).order_by(Route.id)
+    else:
+        fields = TRIP_FIELDS
+        query = (
+            db.session.query(
+                Trip.id, Trip.route_id, Route.origin, Route.destination,
+                Trip.departure_time, Trip.seats_total, Trip.seats_available,
+            )
+            .join(Route, Trip.route_id == Route.id)
+            .order_by(Trip.id)
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(fields)
+    for row in query.yield_per(batch_size):
+        values = [v.isoformat() if isinstance(v, datetime) else v for v in row]
+        if fmt == "csv":
+            writer.writerow(values)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            yield json.dumps(dict(zip(fields, values))) + "\n"
+    if fmt == "csv" and buffer.tell():
+        yield buffer.getvalue()
+
+
+def read_records(stream: IO[bytes], fmt: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    # (line number, record); record is None for a line that does not parse
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_num, record if isinstance(record, dict) else None
+
+
+class Importer:
+    def __init__(self, entity: str, batch_size: int = 1000) -> None:
+        self.entity = entity
+        self.batch_size = batch_size
+        self.created = 0
+        self.skipped = 0
+        self.routes_created = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.error_count = 0
+        self._routes: Dict[Tuple[str, str], int] = {}
+        self._route_ids = set()
+        self._load_routes()
+
+    def run(self, records: Iterable[Tuple[int, Optional[Dict[str, Any]]]]) -> Dict[str, Any]:
+        batch: List[Dict[str, Any]] = []
+        for line_num, record in records:
+            row = self._parse(line_num, record)
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        db.session.commit()
+        return {
+            "entity": self.entity,
+            "created": self.created,
+            "skipped": self.skipped,
+            "routes_created": self.routes_created,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+    def _error(self, line_num: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_num, "error": message})
+
+    def _parse(self, line_num: int, record: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if record is None:
+            self._error(line_num, "could not parse line")
+            return None
+        if self.entity == "routes":
+            try:
+                origin = text_field(record, "origin")
+                destination = text_field(record, "destination")
+            except TypeError:
+                self._error(line_num, "origin and destination must be strings")
+                return None
+            if not origin or not destination:
+                self._error(line_num, "origin and destination are required")
+                return None
+            try:
+                duration = record.get("duration_minutes")
+                duration_minutes = int(duration) if duration not in (None, "") else None
+            except (TypeError, ValueError):
+                self._error(line_num, "duration_minutes must be an integer")
+                return None
+            return {"origin": origin, "destination": destination, "duration_minutes": duration_minutes}
+        try:
+            departure_time = datetime.fromisoformat(str(record["departure_time"]))
+            seats_total = int(record["seats_total"])
+            available = record.get("seats_available")
+            # 0 is a valid count: only a missing or blank field means "all free"
+            seats_available = seats_total if available in (None, "") else int(available)
+        except (KeyError, TypeError, ValueError):
+            self._error(line_num, "departure_time (ISO) and seats_total are required")
+            return None
+        if seats_total <= 0 or not 0 <= seats_available <= seats_total:
+            self._error(line_num, "need 0 <= seats_available <= seats_total and seats_total > 0")
+            return None
+        try:
+            route_id = self._resolve_route(record)
+        except TypeError:
+            self._error(line_num, "origin and destination must be strings")
+            return None
+        if route_id is None:
+            self._error(line_num, "origin and destination (or a known route_id) are required")
+            return None
+        return {
+            "route_id": route_id,
+            "departure_time": departure_time,
+            "seats_total": seats_total,
+            "seats_available": seats_available,
+        }
+
+    def _resolve_route(self, record: Dict[str, Any]) -> Optional[int]:
+        origin = text_field(record, "origin")
+        destination = text_field(record, "destination")
+        if origin and destination:
+            route_id = self._routes.get((origin, destination))
+            if route_id is None:
+                # Unknown pair: create the route on the fly
+                route_id = db.session.execute(
+                    insert(Route).values(origin=origin, destination=destination)
+                ).inserted_primary_key[0]
+                self._routes[(origin, destination)] = route_id
+                self._route_ids.add(route_id)
+                self.routes_created += 1
+            return route_id
+        try:
+            route_id = int(record.get("route_id"))
+        except (TypeError, ValueError):
+            return None
+        return route_id if route_id in self._route_ids else None
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        if self.entity == "routes":
+            rows = []
+            for row in batch:
+                key = (row["origin"], row["destination"])
+                if key in self._routes:
+                    self.skipped += 1
+                    continue
+                self._routes[key] = 0  # placeholder until the ids are read back
+                rows.append(row)
+            if rows:
+                db.session.execute(insert(Route), rows)
+                self.created += len(rows)
+            db.session.commit()
+            if rows:
+                self._load_routes({row["origin"] for row in rows})
+            return
+
+        route_ids = {row["route_id"] for row in batch}
+        departures = [row["departure_time"] for row in batch]
+        existing = set(
+            db.session.query(Trip.route_id, Trip.departure_time).filter(
+                Trip.route_id.in_(route_ids),
+                Trip.departure_time >= min(departures),
+                Trip.departure_time <= max(departures),
+            )
+        )
+        rows = []
+        now = datetime.utcnow()
+        for row in batch:
+            key = (row["route_id"], row["departure_time"])
+            if key in existing:
+                self.skipped += 1
+                continue
+            existing.add(key)
+            rows.append(dict(row, created_at=now))
+        if rows:
+            db.session.execute(insert(Trip), rows)
+            add_trips(
+                db.session.connection(),
+                [
+                    (row["route_id"], row["departure_time"].date(), row["seats_total"], row["seats_available"])
+                    for row in rows
+                ],
+            )
+            self.created += len(rows)
+        db.session.commit()
+
+    def _load_routes(self, origins: Optional[set] = None) -> None:
+        query = db.session.query(Route.id, Route.origin, Route.destination)
+        if origins is not None:
+            query = query.filter(Route.origin.in_(origins))
+        # Descending, so the lowest id wins when the table holds duplicate pairs
+        for route_id, origin, destination in query.order_by(Route.id.desc()):
+            self._routes[(origin, destination)] = route_id
+            self._route_ids.add(route_id)
+
+
+def text_field(record: Dict[str, Any], name: str) -> str:
+    # CSV gives strings; a JSON list, object or number must not become a name
+    value = record.get(name)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise TypeError(f"{name} must be a string")
+    return value.strip()
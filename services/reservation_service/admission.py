@@ -0,0 +1,196 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+# Admission control for booking endpoints, so a sale opening turns into
+# quick 429s instead of threads piling up on schedule-service calls and row
+# locks.
+#
+# A request first needs a token from the global bucket and from the user's
+# bucket (rate per second, burst). Then, for every trip it books, it needs
+# one of `trip_concurrency` slots. Nothing ever waits for a slot: like a
+# virtual waiting room, a request that finds all slots taken gets a place in
+# the trip's FIFO queue and a 429 at once, with its position and when to
+# retry. Retrying keeps the place, and a retry that has reached the front
+# takes the next free slot ahead of newcomers. A place nobody retries for
+# within `ticket_ttl` seconds is dropped. The queue is bounded and a user
+# holds at most one place in it per trip, so one client cannot crowd out
+# the rest. Everything is per process: with several gunicorn workers the
+# effective limits are multiplied by the number of workers.
+
+
+class Rejection(NamedTuple):
+    reason: str  # global_rate / user_rate / trip_queue_full / queued
+    retry_after: float
+    trip_id: Optional[int] = None
+    queue_position: Optional[int] = None
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float) -> None:
+        self.tokens = burst
+        self.updated = now
+
+
+class _TripQueue:
+    __slots__ = ("active", "waiting")
+
+    def __init__(self) -> None:
+        self.active = 0
+        # username -> when the place lapses, in arrival order
+        self.waiting: "OrderedDict[str, float]" = OrderedDict()
+
+
+class AdmissionControl:
+    def __init__(
+        self,
+        global_rate: float = 200.0,
+        global_burst: float = 400.0,
+        user_rate: float = 2.0,
+        user_burst: float = 5.0,
+        trip_concurrency: int = 4,
+        trip_queue: int = 32,
+        ticket_ttl: float = 10.0,
+        max_users: int = 100000,
+    ) -> None:
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.trip_concurrency = trip_concurrency
+        self.trip_queue = trip_queue
+        self.ticket_ttl = ticket_ttl
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._global = _Bucket(global_burst, time.monotonic())
+        self._users: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._trips: Dict[int, _TripQueue] = {}
+        # Moving average of how long a booking holds its slot, for retry_after
+        self._slot_seconds = 0.25
+        self._next_sweep = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Dict[str, int] = {}
+
+    # Rate limits
+
+    def admit(self, username: str) -> Optional[Rejection]:
+        now = time.monotonic()
+        with self._lock:
+            user = self._users.get(username)
+            if user is None:
+                user = self._users[username] = _Bucket(self.user_burst, now)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(username)
+            _refill(self._global, self.global_rate, self.global_burst, now)
+            _refill(user, self.user_rate, self.user_burst, now)
+            # Take both tokens or neither
+            if user.tokens < 1:
+                return self._reject(Rejection("user_rate", (1 - user.tokens) / self.user_rate))
+            if self._global.tokens < 1:
+                return self._reject(Rejection("global_rate", (1 - self._global.tokens) / self.global_rate))
+            user.tokens -= 1
+            self._global.tokens -= 1
+            self.admitted += 1
+        return None
+
+    # Per-trip concurrency
+
+    @contextmanager
+    def trips(self, trip_ids: Iterable[int], username: str) -> Iterator[Optional[Rejection]]:
+        # Yields None while holding a slot on every trip, else the rejection.
+        # Trips are entered in id order; a rejection releases the slots taken.
+        entered: List[int] = []
+        rejection = None
+        started = time.monotonic()
+        try:
+            for trip_id in sorted(set(trip_ids)):
+                rejection = self._enter(trip_id, username, time.monotonic())
+                if rejection is not None:
+                    break
+                entered.append(trip_id)
+            yield rejection
+        finally:
+            held = time.monotonic() - started
+            for trip_id in entered:
+                self._leave(trip_id, held)
+
+    def _enter(self, trip_id: int, username: str, now: float) -> Optional[Rejection]:
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            queue = self._trips.get(trip_id)
+            if queue is None:
+                queue = self._trips[trip_id] = _TripQueue()
+            _drop_lapsed(queue, now)
+            free = self.trip_concurrency - queue.active
+            if username in queue.waiting:
+                position = list(queue.waiting).index(username) + 1
+                if position <= free:
+                    del queue.waiting[username]
+                    queue.active += 1
+                    return None
+                queue.waiting[username] = now + self.ticket_ttl
+                return self._reject(Rejection("queued", self._retry_after(position), trip_id, position))
+            if free > len(queue.waiting):
+                queue.active += 1
+                return None
+            if len(queue.waiting) >= self.trip_queue:
+                position = len(queue.waiting) + 1
+                return self._reject(Rejection("trip_queue_full", self._retry_after(position), trip_id, position))
+            queue.waiting[username] = now + self.ticket_ttl
+            self.queued += 1
+            position = len(queue.waiting)
+            return self._reject(Rejection("queued", self._retry_after(position), trip_id, position))
+
+    def _leave(self, trip_id: int, held: float) -> None:
+        with self._lock:
+            self._slot_seconds += 0.1 * (held - self._slot_seconds)
+            queue = self._trips[trip_id]
+            queue.active -= 1
+            if queue.active == 0 and not queue.waiting:
+                del self._trips[trip_id]
+
+    def _sweep(self, now: float) -> None:
+        # Caller holds _lock. Forgets trips whose queue only held lapsed places
+        for trip_id, queue in list(self._trips.items()):
+            _drop_lapsed(queue, now)
+            if queue.active == 0 and not queue.waiting:
+                del self._trips[trip_id]
+        self._next_sweep = now + self.ticket_ttl
+
+    def _retry_after(self, position: int) -> float:
+        # Caller holds _lock. About when the slots ahead of this place free up
+        rounds = math.ceil(position / max(1, self.trip_concurrency))
+        return min(self.ticket_ttl / 2, max(0.1, rounds * self._slot_seconds))
+
+    def _reject(self, rejection: Rejection) -> Rejection:
+        self.rejected[rejection.reason] = self.rejected.get(rejection.reason, 0) + 1
+        return rejection
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            depths = [len(queue.waiting) for queue in self._trips.values()]
+            return {
+                "trips": len(self._trips),
+                "active": sum(queue.active for queue in self._trips.values()),
+                "waiting": sum(depths),
+                "max_depth": max(depths, default=0),
+            }
+
+
+def _drop_lapsed(queue: _TripQueue, now: float) -> None:
+    for username, lapses in list(queue.waiting.items()):
+        if lapses <= now:
+            del queue.waiting[username]
+
+
+def _refill(bucket: _Bucket, rate: float, burst: float, now: float) -> None:
+    bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+    bucket.updated = now
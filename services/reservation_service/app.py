@@ -1,28 +1,50 @@
+import heapq
+import itertools
+import json
+import math
 import os
 import time
-from typing import Any, Dict, Optional, Tuple
+from contextlib import nullcontext
+from datetime import date, datetime
+from functools import partial
+from hashlib import sha256
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import requests
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 
-from models import db, Reservation, User
-from sqlalchemy import text
-
-
-def wait_for_db(retries: int = 30, delay_seconds: float = 2.0) -> None:
-    for attempt in range(1, retries + 1):
+from admission import AdmissionControl, Rejection
+from archive import ReservationArchiver
+from auth import TokenAuth
+from booking_stats import SCOPES, StatsCompactor, read as read_stats, rebuild as rebuild_stats, record_event
+from db_routing import PIN_HEADER, ReadRouter, primary
+from metrics import Metrics
+from models import db, BookingEvent, OutboxEvent, Reservation, ReservationArchive, RevokedToken, TripBookingStats, User
+from outbox import OutboxDispatcher, enqueue_release, join_seats, reconcile, split_seats
+from schedule_client import ScheduleClient, ScheduleUnavailable
+from sqlalchemy import inspect, text
+from startup import Startup, ping
+
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def wait_for_db(timeout: float = 60.0, max_delay: float = 5.0) -> None:
+    # Exponential backoff, so a database that is already up costs nothing
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while time.monotonic() + delay < deadline:
         try:
             db.session.execute(text("SELECT 1"))
             return
         except Exception:
-            time.sleep(delay_seconds)
+            db.session.rollback()
+            time.sleep(delay)
+            delay = min(max_delay, delay * 2)
     db.session.execute(text("SELECT 1"))
 
 
 def seed_users() -> None:
-    from hashlib import sha256
-
     if User.query.filter_by(username="admin").first() is None:
         admin = User(username="admin", password_hash=sha256("Admin@123".encode()).hexdigest(), role="ADMIN")
         db.session.add(admin)
@@ -32,19 +54,17 @@ def seed_users() -> None:
     db.session.commit()
 
 
-def seed_reservations() -> None:
-    import requests as rq
+def seed_reservations(client: ScheduleClient) -> None:
     from random import randint
     from datetime import date as _d
 
     if Reservation.query.count() > 0:
         return
-    schedule_base = os.environ.get("SCHEDULE_SERVICE_URL", "http://localhost:5001")
     try:
-        q = rq.get(f"{schedule_base}/trips/search", params={"origin": "City A", "destination": "City B", "date": _d.today().isoformat()}, timeout=5)
+        q = client.search("City A", "City B", _d.today().isoformat())
         trips = q.json() if q.status_code == 200 else []
         for t in trips[:2]:
-            rq.post(f"{schedule_base}/trips/{t['id']}/allocate", json={"count": 2}, timeout=5)
+            client.allocate(t['id'], 2)
             r = Reservation(trip_id=t['id'], passenger_name=f"Demo User {randint(100,999)}", seats_booked=2, status="BOOKED", booked_by="user")
             db.session.add(r)
         db.session.commit()
@@ -52,41 +72,291 @@ def seed_reservations() -> None:
         db.session.rollback()
 
 
-def create_app() -> Flask:
-    app = Flask(__name__)
+def engine_options(uri: str) -> Dict[str, Any]:
+    # One pool per worker process, sized to the worker's thread count
+    if not uri.startswith("mysql"):
+        return {}
+    threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", str(threads))),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "2")),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "280")),
+        "pool_pre_ping": True,
+    }
+
 
+def configure(app: Flask) -> None:
     db_user = os.environ.get("DB_USER", "reservation_user")
     db_password = os.environ.get("DB_PASSWORD", "reservation_password")
     db_host = os.environ.get("DB_HOST", "127.0.0.1")
     db_port = os.environ.get("DB_PORT", "3306")
     db_name = os.environ.get("DB_NAME", "reservation_db")
-    app.config["SQLALCHEMY_DATABASE_URI"] = (
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL") or (
         f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
     )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    # Optional read replicas: full URLs, or hosts sharing the primary's credentials
+    replica_urls = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+    replica_hosts = [h.strip() for h in os.environ.get("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+    app.config["SQLALCHEMY_REPLICA_URIS"] = replica_urls or [
+        f"mysql+pymysql://{db_user}:{db_password}@{host if ':' in host else f'{host}:{db_port}'}/{db_name}"
+        for host in replica_hosts
+    ]
+    app.config["READ_YOUR_WRITES_SECONDS"] = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
     app.config["JWT_SECRET"] = os.environ.get("JWT_SECRET", "dev_secret_change_me")
+    app.config["JWT_TTL_SECONDS"] = int(os.environ.get("JWT_TTL_SECONDS", str(12 * 3600)))
+    app.config["AUTH_CACHE_SIZE"] = int(os.environ.get("AUTH_CACHE_SIZE", "10000"))
+    app.config["AUTH_CACHE_TTL"] = float(os.environ.get("AUTH_CACHE_TTL", "60"))
+    app.config["ADMISSION_CONTROL"] = os.environ.get("ADMISSION_CONTROL", "1") == "1"
+    app.config["ADMISSION_GLOBAL_RATE"] = float(os.environ.get("ADMISSION_GLOBAL_RATE", "200"))
+    app.config["ADMISSION_GLOBAL_BURST"] = float(os.environ.get("ADMISSION_GLOBAL_BURST", "400"))
+    app.config["ADMISSION_USER_RATE"] = float(os.environ.get("ADMISSION_USER_RATE", "2"))
+    app.config["ADMISSION_USER_BURST"] = float(os.environ.get("ADMISSION_USER_BURST", "5"))
+    # Half a worker's threads, so one busy trip leaves the rest to other requests
+    threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+    app.config["ADMISSION_TRIP_CONCURRENCY"] = int(
+        os.environ.get("ADMISSION_TRIP_CONCURRENCY", str(max(1, threads // 2)))
+    )
+    app.config["ADMISSION_TRIP_QUEUE"] = int(os.environ.get("ADMISSION_TRIP_QUEUE", "32"))
+    app.config["ADMISSION_TICKET_TTL"] = float(os.environ.get("ADMISSION_TICKET_TTL", "10"))
+    app.config["OUTBOX_DISPATCHER"] = os.environ.get("OUTBOX_DISPATCHER", "1") == "1"
+    app.config["OUTBOX_BATCH_SIZE"] = int(os.environ.get("OUTBOX_BATCH_SIZE", "100"))
+    app.config["OUTBOX_POLL_INTERVAL"] = float(os.environ.get("OUTBOX_POLL_INTERVAL", "1"))
+    app.config["STATS_COMPACTOR"] = os.environ.get("STATS_COMPACTOR", "1") == "1"
+    app.config["STATS_COMPACT_BATCH"] = int(os.environ.get("STATS_COMPACT_BATCH", "1000"))
+    app.config["STATS_COMPACT_INTERVAL"] = float(os.environ.get("STATS_COMPACT_INTERVAL", "5"))
+    app.config["ARCHIVER"] = os.environ.get("ARCHIVER", "1") == "1"
+    app.config["ARCHIVE_AFTER_DAYS"] = int(os.environ.get("ARCHIVE_AFTER_DAYS", "30"))
+    app.config["ARCHIVE_CANCELLED_DAYS"] = int(os.environ.get("ARCHIVE_CANCELLED_DAYS", "7"))
+    app.config["ARCHIVE_BATCH_SIZE"] = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+    app.config["ARCHIVE_INTERVAL"] = float(os.environ.get("ARCHIVE_INTERVAL", "3600"))
+    app.config["ARCHIVE_PARTITIONING"] = os.environ.get("ARCHIVE_PARTITIONING", "0") == "1"
+    app.config["ARCHIVE_PARTITION_MONTHS_AHEAD"] = int(os.environ.get("ARCHIVE_PARTITION_MONTHS_AHEAD", "3"))
+    app.config["SCHEDULE_SERVICE_URL"] = os.environ.get("SCHEDULE_SERVICE_URL", "http://localhost:5001")
+    app.config["SCHEDULE_POOL_SIZE"] = int(os.environ.get("SCHEDULE_POOL_SIZE", "20"))
+    app.config["SCHEDULE_CONNECT_TIMEOUT"] = float(os.environ.get("SCHEDULE_CONNECT_TIMEOUT", "1"))
+    app.config["SCHEDULE_READ_TIMEOUT"] = float(os.environ.get("SCHEDULE_READ_TIMEOUT", "5"))
+    app.config["SCHEDULE_RETRIES"] = int(os.environ.get("SCHEDULE_RETRIES", "2"))
+    app.config["SCHEDULE_BREAKER_THRESHOLD"] = int(os.environ.get("SCHEDULE_BREAKER_THRESHOLD", "5"))
+    app.config["SCHEDULE_BREAKER_RESET"] = float(os.environ.get("SCHEDULE_BREAKER_RESET", "10"))
+    app.config["METRICS_SLOW_REQUEST_MS"] = float(os.environ.get("METRICS_SLOW_REQUEST_MS", "0"))
+
+
+def migrate() -> None:
+    # Idempotent schema changes, run once per deploy (`python manage.py migrate`)
+    wait_for_db()
+    db.create_all()
+    for model in (Reservation, ReservationArchive, OutboxEvent):
+        add_missing_columns(model)
+    # create_all does not add indexes to tables that already exist
+    for index in Reservation.__table__.indexes:
+        index.create(bind=db.engine, checkfirst=True)
+    # Backfill booking stats for databases that predate them
+    if (
+        db.session.query(TripBookingStats.trip_id).first() is None
+        and db.session.query(BookingEvent.id).first() is None
+        and db.session.query(Reservation.id).first() is not None
+    ):
+        rebuild_stats(db.session.connection())
+        db.session.commit()
 
-    CORS(app)
+
+def add_missing_columns(model: Any) -> None:
+    # create_all does not add columns to tables that already exist
+    table = model.__table__
+    existing = {c["name"] for c in inspect(db.engine).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}"
+        if column.server_default is not None:
+            ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+        else:
+            ddl += " NULL"
+        db.session.execute(text(ddl))
+    db.session.commit()
+
+
+def seed(client: ScheduleClient) -> None:
+    seed_users()
+    seed_reservations(client)
+
+
+def prepare_database(client: ScheduleClient) -> None:
+    migrate()
+    seed(client)
+
+
+def bootstrap(commands: Iterable[str] = ("migrate", "seed")) -> None:
+    # Schema creation and seeding outside the workers, through `python
+    # manage.py`, which the gunicorn master also runs unless SKIP_BOOTSTRAP=1
+    app = Flask(__name__)
+    configure(app)
     db.init_app(app)
+    client = ScheduleClient.from_config(app.config)
+    tasks = {"migrate": migrate, "seed": partial(seed, client)}
+    with app.app_context():
+        for command in commands:
+            tasks[command]()
+        db.engine.dispose()
+    client.close()
+
+
+def create_app(schedule_client: Optional[ScheduleClient] = None) -> Flask:
+    startup = Startup()
+    app = Flask(__name__)
+    configure(app)
+
+    CORS(app, expose_headers=["X-Next-After-Id", PIN_HEADER])
+    db.init_app(app)
+    # Benchmarks pass an in-process stand-in for the schedule service
+    app.extensions["schedule_client"] = schedule_client or ScheduleClient.from_config(app.config)
+    metrics = Metrics(app.config["METRICS_SLOW_REQUEST_MS"])
+    metrics.init_app(app)
+    app.extensions["schedule_client"].observer = partial(metrics.observe_outbound, "schedule")
+    breaker = getattr(app.extensions["schedule_client"], "breaker", None)
+    if breaker is not None:
+        metrics.gauge(
+            "schedule_circuit_open",
+            "1 while the schedule-service circuit breaker rejects calls.",
+            lambda: {(): 0 if breaker.state == "closed" else 1},
+        )
+
+    auth = TokenAuth(
+        app.config["JWT_SECRET"],
+        token_ttl=app.config["JWT_TTL_SECONDS"],
+        cache_size=app.config["AUTH_CACHE_SIZE"],
+        cache_ttl=app.config["AUTH_CACHE_TTL"],
+        is_revoked=lambda jti: db.session.get(RevokedToken, jti) is not None,
+    )
+    app.extensions["token_auth"] = auth
+    metrics.counter(
+        "auth_token_cache_lookups_total",
+        "Verified-token cache lookups by result.",
+        lambda: {(("result", "hit"),): auth.hits, (("result", "miss"),): auth.misses},
+    )
+
+    admission = None
+    if app.config["ADMISSION_CONTROL"]:
+        admission = AdmissionControl(
+            global_rate=app.config["ADMISSION_GLOBAL_RATE"],
+            global_burst=app.config["ADMISSION_GLOBAL_BURST"],
+            user_rate=app.config["ADMISSION_USER_RATE"],
+            user_burst=app.config["ADMISSION_USER_BURST"],
+            trip_concurrency=app.config["ADMISSION_TRIP_CONCURRENCY"],
+            trip_queue=app.config["ADMISSION_TRIP_QUEUE"],
+            ticket_ttl=app.config["ADMISSION_TICKET_TTL"],
+        )
+        register_admission_metrics(admission, metrics)
+    app.extensions["admission"] = admission
+
+    router = ReadRouter(
+        app.config["SQLALCHEMY_REPLICA_URIS"],
+        engine_options,
+        pin_seconds=app.config["READ_YOUR_WRITES_SECONDS"],
+    )
+    router.init_app(app)
+    for engine in router.engines:
+        metrics.instrument_engine(engine)
+    metrics.counter(
+        "db_requests_routed_total",
+        "Requests by the database their reads were sent to.",
+        lambda: {(("target", k),): v for k, v in router.routed.items()},
+    )
+    metrics.gauge(
+        "db_replica_state",
+        "Configured and unreachable replicas, clients pinned to the primary.",
+        lambda: {(("state", k),): v for k, v in router.stats().items()},
+    )
 
     with app.app_context():
-        wait_for_db()
-        db.create_all()
-        # Ensure booked_by column exists (safe guard for existing DBs)
-        try:
-            db.session.execute(text("ALTER TABLE reservations ADD COLUMN IF NOT EXISTS booked_by VARCHAR(80) NULL"))
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
-        seed_users()
-        seed_reservations()
+        metrics.instrument_engine(db.engine)
+        if os.environ.get("SKIP_BOOTSTRAP") != "1":
+            prepare_database(app.extensions["schedule_client"])
+
+    dispatcher = OutboxDispatcher(
+        app,
+        app.extensions["schedule_client"],
+        batch_size=app.config["OUTBOX_BATCH_SIZE"],
+        interval=app.config["OUTBOX_POLL_INTERVAL"],
+    )
+    app.extensions["outbox"] = dispatcher
+    if app.config["OUTBOX_DISPATCHER"]:
+        startup.add("outbox dispatcher", dispatcher.start)
+
+    archiver = ReservationArchiver(
+        app,
+        app.extensions["schedule_client"],
+        after_days=app.config["ARCHIVE_AFTER_DAYS"],
+        cancelled_after_days=app.config["ARCHIVE_CANCELLED_DAYS"],
+        batch_size=app.config["ARCHIVE_BATCH_SIZE"],
+        interval=app.config["ARCHIVE_INTERVAL"],
+        partitioning=app.config["ARCHIVE_PARTITIONING"],
+        months_ahead=app.config["ARCHIVE_PARTITION_MONTHS_AHEAD"],
+    )
+    app.extensions["archiver"] = archiver
+    if app.config["ARCHIVER"]:
+        startup.add("archiver", archiver.start)
+    metrics.counter(
+        "reservations_archived_total", "Reservations moved to reservations_archive.", lambda: {(): archiver.archived}
+    )
+
+    compactor = StatsCompactor(
+        app, batch_size=app.config["STATS_COMPACT_BATCH"], interval=app.config["STATS_COMPACT_INTERVAL"]
+    )
+    app.extensions["stats_compactor"] = compactor
+    if app.config["STATS_COMPACTOR"]:
+        startup.add("stats compactor", compactor.start)
+    metrics.counter(
+        "booking_events_compacted_total", "Booking events folded into the stats rollups.", lambda: {(): compactor.compacted}
+    )
+    metrics.gauge("booking_events_backlog", "Booking events waiting for the compactor.", lambda: {(): compactor.backlog()})
 
+    app.extensions["startup"] = startup
+    metrics.gauge(
+        "app_startup",
+        "1 once ready to serve, and seconds from create_app to ready.",
+        lambda: {(("kind", "ready"),): int(startup.ready), (("kind", "seconds"),): startup.ready_after or 0},
+    )
     register_routes(app)
+    startup.start(app)
     return app
 
 
+def register_admission_metrics(admission: AdmissionControl, metrics: Metrics) -> None:
+    metrics.counter(
+        "admission_requests_total",
+        "Booking requests let through or turned away by admission control.",
+        lambda: {
+            (("result", "admitted"),): admission.admitted,
+            **{(("result", reason),): count for reason, count in admission.rejected.items()},
+        },
+    )
+    metrics.counter(
+        "admission_queued_total", "Requests given a place in a trip queue.", lambda: {(): admission.queued}
+    )
+    metrics.gauge(
+        "admission_trip_queue",
+        "Trips with booking traffic, requests holding a trip slot, places in trip queues, deepest trip queue.",
+        lambda: {(("kind", k),): v for k, v in admission.stats().items()},
+    )
+
+
 def register_routes(app: Flask) -> None:
-    schedule_base = os.environ.get("SCHEDULE_SERVICE_URL", "http://localhost:5001")
+    schedule: ScheduleClient = app.extensions["schedule_client"]
+    auth: TokenAuth = app.extensions["token_auth"]
+    outbox: OutboxDispatcher = app.extensions["outbox"]
+    archiver: ReservationArchiver = app.extensions["archiver"]
+    startup: Startup = app.extensions["startup"]
+    admission: Optional[AdmissionControl] = app.extensions["admission"]
+
+    def admit(username: str) -> Optional[Rejection]:
+        return admission.admit(username) if admission is not None else None
+
+    def trip_slots(trip_ids: Iterable[int], username: str) -> Any:
+        # Context manager yielding None while the trips' slots are held
+        return admission.trips(trip_ids, username) if admission is not None else nullcontext()
 
     @app.get("/health")
     def health() -> Any:
@@ -96,11 +366,24 @@ def register_routes(app: Flask) -> None:
         except Exception as exc:
             return jsonify({"status": "degraded", "error": str(exc)}), 500
 
+    @app.get("/health/live")
+    def liveness() -> Any:
+        # Process is up; never touches the database
+        return jsonify({"status": "ok", "uptime_seconds": startup.stats()["uptime_seconds"]})
+
+    @app.get("/health/ready")
+    def readiness() -> Any:
+        stats = startup.stats()
+        if not startup.ready:
+            return jsonify(dict(stats, status="starting")), 503
+        try:
+            ping()
+        except Exception as exc:
+            return jsonify(dict(stats, status="unavailable", error=str(exc))), 503
+        return jsonify(dict(stats, status="ready"))
+
     @app.post("/auth/login")
     def login() -> Any:
-        from hashlib import sha256
-        import jwt
-
         data = request.get_json(force=True) or {}
         username = str(data.get("username", "")).strip()
         password = str(data.get("password", ""))
@@ -113,8 +396,24 @@ def register_routes(app: Flask) -> None:
         if user.password_hash != sha256(password.encode()).hexdigest():
             return jsonify({"error": "invalid_credentials"}), 401
 
-        token = jwt.encode({"sub": user.username, "role": user.role}, app.config["JWT_SECRET"], algorithm="HS256")
-        return jsonify({"token": token, "role": user.role})
+        token = auth.issue(user.username, user.role)
+        return jsonify({"token": token, "role": user.role, "expires_in": auth.token_ttl})
+
+    @app.post("/auth/logout")
+    def logout() -> Any:
+        token = bearer_token()
+        claims = auth.claims(token) if token else None
+        if claims is None:
+            return jsonify({"error": "unauthorized"}), 401
+        jti = claims.get("jti")
+        if not jti:
+            return jsonify({"error": "token_not_revocable"}), 400
+        if db.session.get(RevokedToken, jti) is None:
+            expires_at = datetime.utcfromtimestamp(claims["exp"]) if "exp" in claims else None
+            db.session.add(RevokedToken(jti=jti, expires_at=expires_at))
+            db.session.commit()
+        auth.evict(jti)
+        return jsonify({"status": "revoked"})
 
     @app.post("/reservations")
     def create_reservation() -> Any:
@@ -123,44 +422,48 @@ def register_routes(app: Flask) -> None:
             return jsonify({"error": "unauthorized"}), 401
         username, _role = user
 
+        rejection = admit(username)
+        if rejection is not None:
+            return too_many_requests(rejection)
         data = request.get_json(force=True) or {}
+        if data.get("legs") is not None:
+            return create_multi_leg_reservation(username, data)
+        if data.get("hold_id"):
+            return create_held_reservation(username, data)
         try:
             trip_id = int(data.get("trip_id"))
             passenger_name = str(data.get("passenger_name")) or username
-            seats = int(data.get("seats", 1))
+            # Optional numbered seats: picked ones, or the best adjacent run
+            seat_numbers = parse_seat_numbers(data.get("seat_numbers"))
+            seats = int(data.get("seats", len(seat_numbers) if seat_numbers else 1))
         except Exception:
             return jsonify({"error": "trip_id, passenger_name, seats required"}), 400
+        adjacent = bool(data.get("adjacent"))
 
-        # Check availability
-        avail_resp = requests.get(f"{schedule_base}/trips/{trip_id}/availability", timeout=5)
-        if avail_resp.status_code != 200:
-            return jsonify({"error": "trip_not_found_or_service_unavailable"}), 502
-        available = avail_resp.json().get("seats_available", 0)
-        if available < seats:
-            return jsonify({"error": "insufficient_seats", "available": available}), 409
-
-        # Allocate seats atomically on schedule service
-        alloc_resp = requests.post(
-            f"{schedule_base}/trips/{trip_id}/allocate",
-            json={"count": seats},
-            timeout=5,
-        )
-        if alloc_resp.status_code != 200:
-            # Pass through error
+        with trip_slots([trip_id], username) as rejection:
+            if rejection is not None:
+                return too_many_requests(rejection)
+            # allocate re-checks availability under the row lock, so no pre-check
             try:
-                return jsonify(alloc_resp.json()), alloc_resp.status_code
-            except Exception:
-                return jsonify({"error": "allocation_failed"}), 502
-
-        reservation = Reservation(
-            trip_id=trip_id,
-            passenger_name=passenger_name,
-            seats_booked=seats,
-            status="BOOKED",
-            booked_by=username,
-        )
-        db.session.add(reservation)
-        db.session.commit()
+                alloc_resp = schedule.allocate(trip_id, seats, seat_numbers, adjacent)
+            except ScheduleUnavailable:
+                return jsonify({"error": "schedule_service_unavailable"}), 503
+            if alloc_resp.status_code != 200:
+                return relay(alloc_resp, "allocation_failed")
+            seat_numbers = alloc_resp.json().get("seats")
+
+            reservation = Reservation(
+                trip_id=trip_id,
+                passenger_name=passenger_name,
+                seats_booked=seats,
+                status="BOOKED",
+                booked_by=username,
+                seat_numbers=join_seats(seat_numbers),
+            )
+            db.session.add(reservation)
+            record_event("BOOKED", reservation)
+            if not commit_or_compensate([(trip_id, seats, seat_numbers)]):
+                return jsonify({"error": "reservation_failed"}), 500
         return jsonify(serialize_reservation(reservation)), 201
 
     @app.post("/reservations/<int:reservation_id>/cancel")
@@ -170,29 +473,38 @@ def register_routes(app: Flask) -> None:
             return jsonify({"error": "unauthorized"}), 401
         username, role = user
 
-        reservation = Reservation.query.get(reservation_id)
+        # Row lock so concurrent cancels cannot both queue a release
+        reservation = (
+            db.session.query(Reservation)
+            .filter(Reservation.id == reservation_id)
+            .with_for_update()
+            .one_or_none()
+        )
         if reservation is None:
-            return jsonify({"error": "reservation_not_found"}), 404
+            db.session.rollback()
+            reservation = find_archived(reservation_id)
+            if reservation is None:
+                return jsonify({"error": "reservation_not_found"}), 404
         # Non-admins can only cancel their own bookings
         if role != "ADMIN" and reservation.booked_by != username:
             return jsonify({"error": "forbidden"}), 403
+        if isinstance(reservation, ReservationArchive):
+            # Old bookings are read-only once archived
+            if reservation.status == "CANCELLED":
+                return jsonify(serialize_reservation(reservation))
+            return jsonify({"error": "reservation_archived"}), 409
         if reservation.status == "CANCELLED":
+            db.session.rollback()
             return jsonify(serialize_reservation(reservation))
 
-        # Release seats back to schedule service
-        release_resp = requests.post(
-            f"{schedule_base}/trips/{reservation.trip_id}/release",
-            json={"count": reservation.seats_booked},
-            timeout=5,
-        )
-        if release_resp.status_code != 200:
-            try:
-                return jsonify(release_resp.json()), release_resp.status_code
-            except Exception:
-                return jsonify({"error": "release_failed"}), 502
-
+        # Seats go back to the schedule service through the outbox
         reservation.status = "CANCELLED"
+        enqueue_release(
+            reservation.trip_id, reservation.seats_booked, reservation.id, split_seats(reservation.seat_numbers)
+        )
+        record_event("CANCELLED", reservation)
         db.session.commit()
+        outbox.notify()
         return jsonify(serialize_reservation(reservation))
 
     @app.get("/reservations")
@@ -201,11 +513,29 @@ def register_routes(app: Flask) -> None:
         if user is None:
             return jsonify({"error": "unauthorized"}), 401
         username, role = user
-        query = Reservation.query
-        if role != "ADMIN":
-            query = query.filter(Reservation.booked_by == username)
-        items = query.order_by(Reservation.id.desc()).all()
-        return jsonify([serialize_reservation(r) for r in items])
+        after_id, limit, error = parse_page_args()
+        if error:
+            return jsonify({"error": error}), 400
+        models = [Reservation]
+        if request.args.get("include_archived") == "1":
+            models.append(ReservationArchive)
+        queries = []
+        for model in models:
+            query = model.query
+            if role != "ADMIN":
+                query = query.filter(model.booked_by == username)
+            # Newest first, so the cursor walks towards smaller ids
+            if after_id is not None:
+                query = query.filter(model.id < after_id)
+            query = query.order_by(model.id.desc())
+            if limit is not None:
+                query = query.limit(limit)
+            queries.append(query)
+        if wants_ndjson():
+            return stream_ndjson(queries, serialize_reservation)
+        # Both tables share one id sequence: merge the pages, newest first
+        items = heapq.merge(*(query.all() for query in queries), key=lambda r: r.id, reverse=True)
+        return paged_response(list(itertools.islice(items, limit)), limit, serialize_reservation)
 
     @app.get("/reservations/<int:reservation_id>")
     def get_reservation(reservation_id: int) -> Any:
@@ -213,36 +543,316 @@ def register_routes(app: Flask) -> None:
         if user is None:
             return jsonify({"error": "unauthorized"}), 401
         username, role = user
-        reservation = Reservation.query.get(reservation_id)
+        reservation = Reservation.query.get(reservation_id) or find_archived(reservation_id)
         if reservation is None:
             return jsonify({"error": "reservation_not_found"}), 404
         if role != "ADMIN" and reservation.booked_by != username:
             return jsonify({"error": "forbidden"}), 403
         return jsonify(serialize_reservation(reservation))
 
-    def get_current_user() -> Optional[Tuple[str, str]]:
-        import jwt
-        auth = request.headers.get("Authorization", "")
-        if not auth.startswith("Bearer "):
-            return None
-        token = auth.split(" ", 1)[1].strip()
+    def create_held_reservation(username: str, data: Dict[str, Any]) -> Any:
+        hold_id = str(data.get("hold_id"))
+        if not hold_id.isalnum():
+            return jsonify({"error": "invalid hold_id"}), 400
+        # Confirming turns the held seats into an allocation without another
+        # availability check; trip and seat count come from the hold
+        try:
+            confirm_resp = schedule.confirm_hold(hold_id, owner=username)
+        except ScheduleUnavailable:
+            return jsonify({"error": "schedule_service_unavailable"}), 503
+        if confirm_resp.status_code != 200:
+            return relay(confirm_resp, "hold_confirm_failed")
+        hold = confirm_resp.json()
+
+        reservation = Reservation(
+            trip_id=hold["trip_id"],
+            passenger_name=str(data.get("passenger_name") or username),
+            seats_booked=hold["count"],
+            status="BOOKED",
+            booked_by=username,
+        )
+        db.session.add(reservation)
+        record_event("BOOKED", reservation)
+        if not commit_or_compensate([(hold["trip_id"], hold["count"], None)]):
+            return jsonify({"error": "reservation_failed"}), 500
+        return jsonify(serialize_reservation(reservation)), 201
+
+    @app.post("/holds")
+    def create_hold() -> Any:
+        user = get_current_user()
+        if user is None:
+            return jsonify({"error": "unauthorized"}), 401
+        rejection = admit(user[0])
+        if rejection is not None:
+            return too_many_requests(rejection)
+        data = request.get_json(force=True) or {}
         try:
-            payload = jwt.decode(token, app.config["JWT_SECRET"], algorithms=["HS256"])
-            return str(payload.get("sub")), str(payload.get("role"))
+            trip_id = int(data.get("trip_id"))
+            seats = int(data.get("seats", 1))
+            ttl_seconds = int(data["ttl_seconds"]) if data.get("ttl_seconds") else None
         except Exception:
+            return jsonify({"error": "trip_id and seats required"}), 400
+        with trip_slots([trip_id], user[0]) as rejection:
+            if rejection is not None:
+                return too_many_requests(rejection)
+            try:
+                resp = schedule.hold(trip_id, seats, ttl_seconds, owner=user[0])
+            except ScheduleUnavailable:
+                return jsonify({"error": "schedule_service_unavailable"}), 503
+        return relay(resp, "hold_failed")
+
+    @app.post("/holds/<hold_id>/release")
+    def release_hold(hold_id: str) -> Any:
+        user = get_current_user()
+        if user is None:
+            return jsonify({"error": "unauthorized"}), 401
+        if not hold_id.isalnum():
+            return jsonify({"error": "invalid hold_id"}), 400
+        try:
+            # Only the user who placed the hold (or an admin) may release it
+            resp = schedule.release_hold(hold_id, owner=None if user[1] == "ADMIN" else user[0])
+        except ScheduleUnavailable:
+            return jsonify({"error": "schedule_service_unavailable"}), 503
+        return relay(resp, "hold_release_failed")
+
+    def create_multi_leg_reservation(username: str, data: Dict[str, Any]) -> Any:
+        legs = data.get("legs")
+        if not isinstance(legs, list) or not legs:
+            return jsonify({"error": "legs must be a non-empty list"}), 400
+        try:
+            parsed = []
+            for leg in legs:
+                numbers = parse_seat_numbers(leg.get("seat_numbers"))
+                parsed.append((
+                    int(leg.get("trip_id")),
+                    str(leg.get("passenger_name") or data.get("passenger_name") or username),
+                    int(leg.get("seats", len(numbers) if numbers else data.get("seats", 1))),
+                    numbers,
+                ))
+        except Exception:
+            return jsonify({"error": "each leg needs trip_id and seats"}), 400
+        if any(seats <= 0 for _trip_id, _name, seats, _numbers in parsed):
+            return jsonify({"error": "seats must be positive"}), 400
+
+        # All legs are allocated in one all-or-nothing call
+        items: List[Dict[str, Any]] = [
+            dict({"trip_id": trip_id, "count": seats}, **({"seats": numbers} if numbers else {}))
+            for trip_id, _name, seats, numbers in parsed
+        ]
+        with trip_slots([trip_id for trip_id, _name, _seats, _numbers in parsed], username) as rejection:
+            if rejection is not None:
+                return too_many_requests(rejection)
+            try:
+                alloc_resp = schedule.allocate_batch(items)
+            except ScheduleUnavailable:
+                return jsonify({"error": "schedule_service_unavailable"}), 503
+            if alloc_resp.status_code != 200:
+                return relay(alloc_resp, "allocation_failed")
+
+            reservations = [
+                Reservation(
+                    trip_id=trip_id,
+                    passenger_name=passenger_name,
+                    seats_booked=seats,
+                    status="BOOKED",
+                    booked_by=username,
+                    seat_numbers=join_seats(numbers),
+                )
+                for trip_id, passenger_name, seats, numbers in parsed
+            ]
+            db.session.add_all(reservations)
+            for reservation in reservations:
+                record_event("BOOKED", reservation)
+            if not commit_or_compensate([(trip_id, seats, numbers) for trip_id, _name, seats, numbers in parsed]):
+                return jsonify({"error": "reservation_failed"}), 500
+        return jsonify({"reservations": [serialize_reservation(r) for r in reservations]}), 201
+
+    def commit_or_compensate(allocations: List[Tuple[int, int, Optional[List[int]]]]) -> bool:
+        # Seats are already allocated remotely; if the local commit fails they
+        # must be handed back or they leak.
+        try:
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("reservation commit failed, releasing %s", allocations)
+        try:
+            for trip_id, seats, numbers in allocations:
+                enqueue_release(trip_id, seats, seats=numbers)
+            db.session.commit()
+            outbox.notify()
+            return False
+        except Exception:
+            db.session.rollback()
+        # Database unusable: release directly as a last resort
+        try:
+            schedule.release_batch([
+                dict({"trip_id": trip_id, "count": seats}, **({"seats": numbers} if numbers else {}))
+                for trip_id, seats, numbers in allocations
+            ])
+        except ScheduleUnavailable:
+            app.logger.error("could not release seats %s; run reconciliation", allocations)
+        return False
+
+    @app.get("/admin/reconcile")
+    @primary
+    def reconcile_seats() -> Any:
+        user = get_current_user()
+        if user is None:
+            return jsonify({"error": "unauthorized"}), 401
+        if user[1] != "ADMIN":
+            return jsonify({"error": "forbidden"}), 403
+        try:
+            trip_ids = [int(t) for t in request.args.get("trip_ids", "").split(",") if t]
+        except ValueError:
+            return jsonify({"error": "trip_ids must be comma separated integers"}), 400
+        try:
+            report = reconcile(schedule, trip_ids or None)
+        except ScheduleUnavailable:
+            return jsonify({"error": "schedule_service_unavailable"}), 503
+        report["outbox"] = outbox.stats()
+        return jsonify(report)
+
+    @app.get("/stats")
+    def booking_stats() -> Any:
+        # ?by=trip|user|day, then keys=a,b or from/to (days), after/limit to page
+        user = get_current_user()
+        if user is None:
+            return jsonify({"error": "unauthorized"}), 401
+        if user[1] != "ADMIN":
+            return jsonify({"error": "forbidden"}), 403
+        scope = request.args.get("by", "day")
+        if scope not in SCOPES:
+            return jsonify({"error": f"by must be one of {', '.join(SCOPES)}"}), 400
+        parse = {"trip": int, "user": str, "day": date.fromisoformat}[scope]
+        try:
+            keys = [parse(k) for k in request.args["keys"].split(",") if k] if request.args.get("keys") else None
+            start = date.fromisoformat(request.args["from"]) if request.args.get("from") else None
+            end = date.fromisoformat(request.args["to"]) if request.args.get("to") else None
+            after = parse(request.args["after"]) if request.args.get("after") else None
+            limit = int(request.args.get("limit", 100))
+        except ValueError:
+            return jsonify({"error": "invalid keys, from, to, after or limit"}), 400
+        if (start or end) and scope != "day":
+            return jsonify({"error": "from/to only apply to by=day"}), 400
+        if not 1 <= limit <= MAX_PAGE_SIZE or (keys is not None and len(keys) > MAX_PAGE_SIZE):
+            return jsonify({"error": f"limit and number of keys must be between 1 and {MAX_PAGE_SIZE}"}), 400
+        return jsonify(read_stats(scope, keys=keys, start=start, end=end, after=after, limit=limit))
+
+    @app.post("/admin/archive")
+    def run_archive() -> Any:
+        user = get_current_user()
+        if user is None:
+            return jsonify({"error": "unauthorized"}), 401
+        if user[1] != "ADMIN":
+            return jsonify({"error": "forbidden"}), 403
+        try:
+            max_batches = int(request.args["max_batches"]) if request.args.get("max_batches") else None
+        except ValueError:
+            return jsonify({"error": "max_batches must be an integer"}), 400
+        archived = archiver.run(max_batches)
+        return jsonify({"archived": archived, "cutoff": archiver.cutoff().isoformat()})
+
+    def get_current_user() -> Optional[Tuple[str, str]]:
+        token = bearer_token()
+        if not token:
             return None
+        return auth.verify(token)
 
 
-def serialize_reservation(r: Reservation) -> Dict[str, Any]:
-    return {
+def too_many_requests(rejection: Rejection) -> Any:
+    # Cheap to send, and tells clients when to come back
+    body: Dict[str, Any] = {
+        "error": "too_many_requests",
+        "reason": rejection.reason,
+        "retry_after": round(rejection.retry_after, 3),
+    }
+    if rejection.trip_id is not None:
+        body["trip_id"] = rejection.trip_id
+    if rejection.queue_position is not None:
+        body["queue_position"] = rejection.queue_position
+    resp = jsonify(body)
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(max(1, math.ceil(rejection.retry_after)))
+    return resp
+
+
+def find_archived(reservation_id: int) -> Optional[ReservationArchive]:
+    return ReservationArchive.query.filter(ReservationArchive.id == reservation_id).first()
+
+
+def bearer_token() -> Optional[str]:
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Bearer "):
+        return None
+    return header[7:].strip()
+
+
+def relay(resp: Any, fallback: str) -> Any:
+    # Pass the schedule service's response through when it is JSON
+    try:
+        return jsonify(resp.json()), resp.status_code
+    except Exception:
+        return jsonify({"error": fallback}), 502
+
+
+def parse_seat_numbers(value: Any) -> Optional[List[int]]:
+    # A string would iterate as digits: "12" is not seats 1 and 2
+    if not value:
+        return None
+    if not isinstance(value, list):
+        raise TypeError("seat_numbers must be a list")
+    return [int(seat) for seat in value]
+
+
+def parse_page_args() -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    # Keyset pagination: ?after_id=<last id seen>&limit=<page size>
+    try:
+        after_id = int(request.args["after_id"]) if request.args.get("after_id") else None
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+    except ValueError:
+        return None, None, "after_id and limit must be integers"
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        return None, None, f"limit must be between 1 and {MAX_PAGE_SIZE}"
+    return after_id, limit, None
+
+
+def wants_ndjson() -> bool:
+    return request.args.get("format") == "ndjson" or request.accept_mimetypes.best == "application/x-ndjson"
+
+
+def stream_ndjson(queries: List[Any], serialize: Callable[[Any], Dict[str, Any]]) -> Response:
+    # yield_per streams rows from a server-side cursor, so memory stays flat;
+    # one query after the other, since a connection has one open cursor
+    def generate() -> Iterator[str]:
+        for query in queries:
+            for row in query.yield_per(STREAM_BATCH_SIZE):
+                yield json.dumps(serialize(row)) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def paged_response(items: List[Any], limit: Optional[int], serialize: Callable[[Any], Dict[str, Any]]) -> Response:
+    resp = jsonify([serialize(item) for item in items])
+    if limit is not None and len(items) == limit:
+        resp.headers["X-Next-After-Id"] = str(items[-1].id)
+    return resp
+
+
+def serialize_reservation(r: Any) -> Dict[str, Any]:
+    data = {
         "id": r.id,
         "trip_id": r.trip_id,
         "passenger_name": r.passenger_name,
         "seats_booked": r.seats_booked,
         "status": r.status,
         "booked_by": r.booked_by,
+        "seat_numbers": split_seats(r.seat_numbers),
         "created_at": r.created_at.isoformat(),
     }
+    if isinstance(r, ReservationArchive):
+        data["archived"] = True
+    return data
 
 
 if __name__ == "__main__":
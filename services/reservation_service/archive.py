@@ -0,0 +1,204 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import Flask
+from sqlalchemy import delete, insert, literal, select
+
+from models import db, OutboxEvent, Reservation, ReservationArchive, RevokedToken
+from partitions import ensure_month_partitions
+from schedule_client import ScheduleClient, ScheduleUnavailable
+
+# Moves old reservations out of `reservations` into `reservations_archive`.
+#
+# Two kinds of rows move, in batches of `batch_size`, each batch in one
+# transaction (INSERT ... SELECT, then DELETE):
+#   - cancelled bookings older than `cancelled_after_days`;
+#   - every booking on a trip that departed before the cutoff (midnight,
+#     `after_days` ago). Departure times live in the schedule service, so
+#     trips with bookings older than the cutoff are looked up there in
+#     chunks, walking trip ids with a cursor across runs.
+# Bookings with a seat release still pending in the outbox stay until it is
+# delivered. Rows are claimed with SKIP LOCKED, so every gunicorn worker can
+# run an archiver. GET endpoints fall back to the archive for ids they do not
+# find, and reconciliation of explicit trip ids counts archived bookings.
+#
+# Each run also purges revoked_tokens rows whose token has expired: an
+# expired token fails verification on its own.
+
+logger = logging.getLogger(__name__)
+
+reservations_table = Reservation.__table__
+archive_table = ReservationArchive.__table__
+COLUMNS = ["id", "trip_id", "passenger_name", "seats_booked", "status", "booked_by", "seat_numbers", "created_at"]
+TRIP_SCAN = 200
+
+
+class ReservationArchiver:
+    def __init__(
+        self,
+        app: Flask,
+        client: ScheduleClient,
+        after_days: int = 30,
+        cancelled_after_days: int = 7,
+        batch_size: int = 500,
+        interval: float = 3600.0,
+        partitioning: bool = False,
+        months_ahead: int = 3,
+    ) -> None:
+        self.app = app
+        self.client = client
+        self.after_days = after_days
+        self.cancelled_after_days = cancelled_after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.partitioning = partitioning
+        self.months_ahead = months_ahead
+        self.archived = 0
+        self._trip_cursor = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="reservation-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def cutoff(self) -> datetime:
+        return datetime.combine(date.today() - timedelta(days=self.after_days), datetime.min.time())
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception:
+                logger.exception("reservation archival failed")
+            self._stop.wait(self.interval)
+
+    def run(self, max_batches: Optional[int] = None) -> int:
+        # Batches until nothing is left to move (or max_batches)
+        budget = [max_batches]
+        total = 0
+        with self.app.app_context():
+            try:
+                if self.partitioning:
+                    self.ensure_partitions()
+                self.purge_revoked_tokens()
+                cancelled_before = datetime.utcnow() - timedelta(days=self.cancelled_after_days)
+                total += self._drain(
+                    budget, Reservation.status == "CANCELLED", Reservation.created_at < cancelled_before
+                )
+                while budget[0] is None or budget[0] > 0:
+                    try:
+                        trip_ids = self._departed_trips()
+                    except ScheduleUnavailable as exc:
+                        logger.warning("skipping bookings of departed trips: %s", exc)
+                        break
+                    if trip_ids:
+                        total += self._drain(budget, Reservation.trip_id.in_(trip_ids))
+                    if self._trip_cursor == 0:
+                        break
+            finally:
+                db.session.remove()
+        return total
+
+    def ensure_partitions(self) -> int:
+        added = ensure_month_partitions(
+            db.session.connection(), archive_table.name, "created_at", self.cutoff().date(), self.months_ahead
+        )
+        db.session.commit()
+        return added
+
+    def purge_revoked_tokens(self) -> int:
+        purged = 0
+        while True:
+            jtis = [
+                jti
+                for (jti,) in db.session.query(RevokedToken.jti)
+                .filter(RevokedToken.expires_at < datetime.utcnow())
+                .limit(self.batch_size)
+            ]
+            if jtis:
+                db.session.query(RevokedToken).filter(RevokedToken.jti.in_(jtis)).delete(synchronize_session=False)
+            db.session.commit()
+            purged += len(jtis)
+            if len(jtis) < self.batch_size:
+                return purged
+
+    def _drain(self, budget: List[Optional[int]], *criteria: Any) -> int:
+        moved_total = 0
+        while budget[0] is None or budget[0] > 0:
+            claimed, moved = self._archive_batch(criteria)
+            moved_total += moved
+            if budget[0] is not None:
+                budget[0] -= 1
+            # Stop when drained, or when everything left waits on the outbox
+            if claimed < self.batch_size or not moved:
+                break
+        return moved_total
+
+    def _departed_trips(self) -> List[int]:
+        # A booking is made before its trip departs, so only trips with
+        # bookings older than the cutoff can qualify
+        cutoff = self.cutoff()
+        trip_ids = [
+            trip_id
+            for (trip_id,) in db.session.query(Reservation.trip_id)
+            .filter(Reservation.created_at < cutoff, Reservation.trip_id > self._trip_cursor)
+            .distinct()
+            .order_by(Reservation.trip_id)
+            .limit(TRIP_SCAN)
+        ]
+        db.session.rollback()
+        # Wrap around once the end of the table is reached
+        self._trip_cursor = trip_ids[-1] if len(trip_ids) == TRIP_SCAN else 0
+        if not trip_ids:
+            return []
+        resp = self.client.get_trips(trip_ids)
+        if resp.status_code != 200:
+            raise ScheduleUnavailable(f"GET /trips returned {resp.status_code}")
+        return [
+            trip["id"] for trip in resp.json() if datetime.fromisoformat(trip["departure_time"]) < cutoff
+        ]
+
+    def _archive_batch(self, criteria: Tuple[Any, ...]) -> Tuple[int, int]:
+        ids = [
+            reservation_id
+            for (reservation_id,) in db.session.query(Reservation.id)
+            .filter(*criteria)
+            .order_by(Reservation.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ]
+        if not ids:
+            db.session.rollback()
+            return 0, 0
+        claimed = len(ids)
+        waiting = {
+            reservation_id
+            for (reservation_id,) in db.session.query(OutboxEvent.reservation_id)
+            .filter(OutboxEvent.reservation_id.in_(ids), OutboxEvent.status == "PENDING")
+        }
+        ids = [reservation_id for reservation_id in ids if reservation_id not in waiting]
+        if ids:
+            conn = db.session.connection()
+            conn.execute(
+                insert(archive_table).from_select(
+                    COLUMNS + ["archived_at"],
+                    select(*(reservations_table.c[name] for name in COLUMNS), literal(datetime.utcnow())).where(
+                        reservations_table.c.id.in_(ids)
+                    ),
+                )
+            )
+            conn.execute(delete(reservations_table).where(reservations_table.c.id.in_(ids)))
+        db.session.commit()
+        self.archived += len(ids)
+        return claimed, len(ids)
+
+    def stats(self) -> Dict[str, int]:
+        return {"archived": self.archived}
@@ -0,0 +1,92 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import jwt
+
+# Issues HS256 tokens and verifies them through a bounded cache of already
+# verified tokens, keyed by the token's SHA-256 digest. A cache hit costs a
+# digest and a dict lookup instead of a full signature check. Entries never
+# outlive the token's `exp` and are re-verified at least every `cache_ttl`
+# seconds, which is also how revocations made by other workers propagate.
+
+Identity = Tuple[str, str]  # (username, role)
+
+
+class TokenAuth:
+    def __init__(
+        self,
+        secret: str,
+        token_ttl: int = 12 * 3600,
+        cache_size: int = 10000,
+        cache_ttl: float = 60.0,
+        is_revoked: Optional[Callable[[str], bool]] = None,
+    ) -> None:
+        self.secret = secret
+        self.token_ttl = token_ttl
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.is_revoked = is_revoked
+        # digest -> (identity, valid_until, jti)
+        self._cache: "OrderedDict[bytes, Tuple[Identity, float, Optional[str]]]" = OrderedDict()
+        self._by_jti: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def issue(self, username: str, role: str) -> str:
+        now = int(time.time())
+        claims = {"sub": username, "role": role, "iat": now, "exp": now + self.token_ttl, "jti": uuid.uuid4().hex}
+        return jwt.encode(claims, self.secret, algorithm="HS256")
+
+    def verify(self, token: str) -> Optional[Identity]:
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self._cache.get(key)
+        if entry is not None and time.time() < entry[1]:
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        try:
+            payload = jwt.decode(token, self.secret, algorithms=["HS256"])
+        except jwt.PyJWTError:
+            return None
+        jti = payload.get("jti")
+        if jti and self.is_revoked is not None and self.is_revoked(jti):
+            return None
+        identity = (str(payload.get("sub")), str(payload.get("role")))
+        valid_until = time.time() + self.cache_ttl
+        if "exp" in payload:
+            valid_until = min(valid_until, float(payload["exp"]))
+        with self._lock:
+            self._cache[key] = (identity, valid_until, jti)
+            self._cache.move_to_end(key)
+            if jti:
+                self._by_jti[jti] = key
+            while len(self._cache) > self.cache_size:
+                _old_key, (_identity, _until, old_jti) = self._cache.popitem(last=False)
+                if old_jti:
+                    self._by_jti.pop(old_jti, None)
+        return identity
+
+    def claims(self, token: str) -> Optional[Dict[str, object]]:
+        try:
+            return jwt.decode(token, self.secret, algorithms=["HS256"])
+        except jwt.PyJWTError:
+            return None
+
+    def evict(self, jti: str) -> None:
+        # Drop a revoked token from this process's cache right away
+        with self._lock:
+            key = self._by_jti.pop(jti, None)
+            if key is not None:
+                self._cache.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,220 @@
+import logging
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import Flask
+from sqlalchemy import case, delete, func, insert, select, union_all, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+
+from models import (
+    db,
+    BookingEvent,
+    DailyBookingStats,
+    Reservation,
+    ReservationArchive,
+    TripBookingStats,
+    UserBookingStats,
+)
+
+# Booking and cancellation counters per trip, per user and per day.
+#
+# Bookings and cancellations append a BookingEvent in their own transaction
+# (a plain INSERT, so concurrent bookings never wait on a shared counter
+# row). The compactor thread folds events into the three rollup tables in
+# batches and deletes them; rows are claimed with SKIP LOCKED, so every
+# gunicorn worker can run one. Reads combine the rollup rows for the keys
+# asked for with the few events not folded yet, so they are exact and cost
+# O(result + backlog), never O(reservations).
+
+logger = logging.getLogger(__name__)
+
+COUNTS = ["bookings", "seats_booked", "cancellations", "seats_cancelled"]
+# scope -> (rollup model, its key column name, event column holding the key)
+SCOPES: Dict[str, Tuple[Any, str, Any]] = {
+    "trip": (TripBookingStats, "trip_id", BookingEvent.trip_id),
+    "user": (UserBookingStats, "username", BookingEvent.booked_by),
+    "day": (DailyBookingStats, "day", BookingEvent.day),
+}
+
+
+def record_event(kind: str, reservation: Reservation) -> None:
+    # Caller commits, together with the booking or cancellation
+    db.session.add(
+        BookingEvent(
+            kind=kind,
+            trip_id=reservation.trip_id,
+            booked_by=reservation.booked_by,
+            seats=reservation.seats_booked,
+            day=datetime.utcnow().date(),
+        )
+    )
+
+
+class StatsCompactor:
+    def __init__(self, app: Flask, batch_size: int = 1000, interval: float = 5.0) -> None:
+        self.app = app
+        self.batch_size = batch_size
+        self.interval = interval
+        self.compacted = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="stats-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                folded = self.run_once()
+            except Exception:
+                logger.exception("booking stats compaction failed")
+                folded = 0
+            if folded < self.batch_size:
+                self._stop.wait(self.interval)
+
+    def run_once(self) -> int:
+        with self.app.app_context():
+            try:
+                return self._compact()
+            except IntegrityError:
+                # Another worker inserted the same new rollup row first; the
+                # events are still there for the next pass
+                db.session.rollback()
+                return 0
+            finally:
+                db.session.remove()
+
+    def _compact(self) -> int:
+        events: List[BookingEvent] = (
+            BookingEvent.query.order_by(BookingEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not events:
+            db.session.rollback()
+            return 0
+        deltas: Dict[str, Dict[Any, List[int]]] = {scope: {} for scope in SCOPES}
+        for event in events:
+            values = [1, event.seats, 0, 0] if event.kind == "BOOKED" else [0, 0, 1, event.seats]
+            for scope, (_model, _key, column) in SCOPES.items():
+                key = getattr(event, column.key)
+                if key is not None:
+                    _add(deltas[scope].setdefault(key, [0, 0, 0, 0]), values)
+        conn = db.session.connection()
+        for scope, (model, key_name, _column) in SCOPES.items():
+            _apply(conn, model, key_name, deltas[scope])
+        conn.execute(delete(BookingEvent.__table__).where(BookingEvent.__table__.c.id.in_([e.id for e in events])))
+        db.session.commit()
+        self.compacted += len(events)
+        return len(events)
+
+    def backlog(self) -> int:
+        with self.app.app_context():
+            try:
+                return db.session.query(func.count(BookingEvent.id)).scalar() or 0
+            finally:
+                db.session.remove()
+
+
+def read(
+    scope: str,
+    keys: Optional[List[Any]] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    after: Optional[Any] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    model, key_name, event_column = SCOPES[scope]
+    key_column = getattr(model, key_name)
+    query = db.session.query(model)
+    pending = db.session.query(
+        event_column,
+        func.sum(case((BookingEvent.kind == "BOOKED", 1), else_=0)),
+        func.sum(case((BookingEvent.kind == "BOOKED", BookingEvent.seats), else_=0)),
+        func.sum(case((BookingEvent.kind == "BOOKED", 0), else_=1)),
+        func.sum(case((BookingEvent.kind == "BOOKED", 0), else_=BookingEvent.seats)),
+    ).filter(event_column.isnot(None))
+    query = query.filter(*_criteria(key_column, keys, start, end, after))
+    pending = pending.filter(*_criteria(event_column, keys, start, end, after))
+
+    counts: Dict[Any, List[int]] = {
+        getattr(row, key_name): [getattr(row, name) for name in COUNTS]
+        for row in query.order_by(key_column).limit(limit)
+    }
+    for key, *values in pending.group_by(event_column):
+        _add(counts.setdefault(key, [0, 0, 0, 0]), [int(v or 0) for v in values])
+    return [
+        dict({key_name: key.isoformat() if isinstance(key, date) else key}, **dict(zip(COUNTS, values)))
+        for key, values in sorted(counts.items())[:limit]
+    ]
+
+
+def rebuild(conn: Connection) -> None:
+    # One-off backfill from existing reservations, for databases that predate
+    # the rollups. The cancellation date is not recorded, so cancellations
+    # are counted on the booking's day.
+    columns = ("trip_id", "booked_by", "seats_booked", "status", "created_at")
+    source = union_all(
+        select(*(Reservation.__table__.c[name] for name in columns)),
+        select(*(ReservationArchive.__table__.c[name] for name in columns)),
+    ).subquery()
+    cancelled = source.c.status == "CANCELLED"
+    aggregates = [
+        func.count(),
+        func.sum(source.c.seats_booked),
+        func.sum(case((cancelled, 1), else_=0)),
+        func.sum(case((cancelled, source.c.seats_booked), else_=0)),
+    ]
+    for model, key in (
+        (TripBookingStats, source.c.trip_id),
+        (UserBookingStats, source.c.booked_by),
+        (DailyBookingStats, func.date(source.c.created_at)),
+    ):
+        key_name = model.__table__.primary_key.columns.values()[0].name
+        conn.execute(delete(model.__table__))
+        conn.execute(
+            insert(model.__table__).from_select(
+                [key_name] + COUNTS,
+                select(key, *aggregates).where(key.isnot(None)).group_by(key),
+            )
+        )
+
+
+def _criteria(column: Any, keys: Optional[List[Any]], start: Any, end: Any, after: Any) -> List[Any]:
+    criteria = []
+    if keys is not None:
+        criteria.append(column.in_(keys))
+    if start is not None:
+        criteria.append(column >= start)
+    if end is not None:
+        criteria.append(column <= end)
+    if after is not None:
+        criteria.append(column > after)
+    return criteria
+
+
+def _add(values: List[int], delta: List[int]) -> None:
+    for i, d in enumerate(delta):
+        values[i] += d
+
+
+def _apply(conn: Connection, model: Any, key_name: str, deltas: Dict[Any, List[int]]) -> None:
+    table = model.__table__
+    # Sorted, so concurrent compactors lock rollup rows in the same order
+    for key, values in sorted(deltas.items()):
+        updated = conn.execute(
+            update(table)
+            .where(table.c[key_name] == key)
+            .values(**{name: table.c[name] + value for name, value in zip(COUNTS, values)})
+        ).rowcount
+        if not updated:
+            conn.execute(insert(table).values({key_name: key, **dict(zip(COUNTS, values))}))
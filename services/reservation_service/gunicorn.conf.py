@@ -0,0 +1,35 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+
+# Pre-forking server for production: `gunicorn -c gunicorn.conf.py wsgi:app`.
+# Send SIGHUP to the master for a graceful reload of all workers.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5002')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+# Workers build their own app (and DB pool, background threads) after fork
+preload_app = False
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def on_starting(server):
+    # Create the schema and seed data once, so workers do not race on it.
+    # Deployments that run `python manage.py migrate seed` as a separate
+    # step set SKIP_BOOTSTRAP=1 and start without touching the database.
+    # It runs in a child process: importing the service here would pin that
+    # code in the master, and a SIGHUP reload would fork workers from it.
+    if os.environ.get("SKIP_BOOTSTRAP") == "1":
+        return
+    subprocess.run(
+        [sys.executable, "manage.py", "migrate", "seed"], cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    )
+    os.environ["SKIP_BOOTSTRAP"] = "1"
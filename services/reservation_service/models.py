@@ -3,7 +3,10 @@ from __future__ import annotations
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 
-db = SQLAlchemy()
+from db_routing import RoutingSession
+
+# Reads inside GET requests may go to a replica, see db_routing
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 class Reservation(db.Model):
@@ -15,8 +18,34 @@ class Reservation(db.Model):
     seats_booked = db.Column(db.Integer, nullable=False)
     status = db.Column(db.String(20), nullable=False, default="BOOKED")  # BOOKED/CANCELLED
     booked_by = db.Column(db.String(80), nullable=True, index=True)  # username who booked
+    seat_numbers = db.Column(db.String(255), nullable=True)  # "3,4" when seats were picked
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+    # Archiver scans for old cancelled bookings
+    __table_args__ = (db.Index("ix_reservations_status_created", "status", "created_at"),)
+
+
+class ReservationArchive(db.Model):
+    # Old or cancelled reservations moved out of `reservations` by the
+    # archiver, keeping their ids. created_at is in the primary key so the
+    # table can be partitioned by month (see partitions).
+    __tablename__ = "reservations_archive"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    created_at = db.Column(db.DateTime, primary_key=True)
+    trip_id = db.Column(db.Integer, nullable=False, index=True)
+    passenger_name = db.Column(db.String(120), nullable=False)
+    seats_booked = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    booked_by = db.Column(db.String(80), nullable=True)
+    seat_numbers = db.Column(db.String(255), nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_reservations_archive_id", "id"),
+        db.Index("ix_reservations_archive_booked_by_id", "booked_by", "id"),
+    )
+
 
 class User(db.Model):
     __tablename__ = "users"
@@ -27,3 +56,67 @@ class User(db.Model):
     role = db.Column(db.String(20), nullable=False, default="USER")  # ADMIN or USER
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+
+class RevokedToken(db.Model):
+    __tablename__ = "revoked_tokens"
+
+    jti = db.Column(db.String(64), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)  # purge after this
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class OutboxEvent(db.Model):
+    __tablename__ = "outbox_events"
+    __table_args__ = (db.Index("ix_outbox_events_status_next_attempt", "status", "next_attempt_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False, default="RELEASE")
+    trip_id = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    seat_numbers = db.Column(db.String(255), nullable=True)  # numbered seats among `count`
+    reservation_id = db.Column(db.Integer, nullable=True, index=True)
+    status = db.Column(db.String(20), nullable=False, default="PENDING")  # PENDING/DELIVERED/FAILED
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+
+
+class BookingEvent(db.Model):
+    # Written with each booking or cancellation, folded into the *_booking_stats
+    # rollups and deleted by the stats compactor
+    __tablename__ = "booking_events"
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # BOOKED/CANCELLED
+    trip_id = db.Column(db.Integer, nullable=False)
+    booked_by = db.Column(db.String(80), nullable=True)
+    seats = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+
+
+class BookingCounts:
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    seats_booked = db.Column(db.Integer, nullable=False, default=0)
+    cancellations = db.Column(db.Integer, nullable=False, default=0)
+    seats_cancelled = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TripBookingStats(BookingCounts, db.Model):
+    __tablename__ = "trip_booking_stats"
+
+    trip_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+
+class UserBookingStats(BookingCounts, db.Model):
+    __tablename__ = "user_booking_stats"
+
+    username = db.Column(db.String(80), primary_key=True)
+
+
+class DailyBookingStats(BookingCounts, db.Model):
+    # By the day the booking or cancellation happened
+    __tablename__ = "daily_booking_stats"
+
+    day = db.Column(db.Date, primary_key=True)
@@ -0,0 +1,242 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from flask import Flask
+from sqlalchemy import func
+
+from models import db, OutboxEvent, Reservation, ReservationArchive
+from schedule_client import ScheduleClient, ScheduleUnavailable
+
+# Transactional outbox for seat side effects on the schedule service.
+#
+# State changes (a cancellation, a failed booking) write an OutboxEvent in the
+# same transaction; the dispatcher thread delivers pending events to
+# /trips/release-batch in batches, retrying with exponential backoff. Rows are
+# claimed with SELECT ... FOR UPDATE SKIP LOCKED, so every gunicorn worker can
+# run a dispatcher without double delivery. Delivery is at-least-once (a
+# timeout after the release was applied, or a failed commit after a 200, sends
+# it again), so every event carries a release id that the schedule service
+# records with the seats it frees and skips when it comes back. The reconciler
+# reports any drift against the schedule service's counters.
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_CHUNK = 200
+
+
+def enqueue_release(
+    trip_id: int, count: int, reservation_id: Optional[int] = None, seats: Optional[List[int]] = None
+) -> OutboxEvent:
+    # Caller commits, together with the state change the release belongs to
+    event = OutboxEvent(
+        kind="RELEASE",
+        trip_id=trip_id,
+        count=count,
+        seat_numbers=join_seats(seats),
+        reservation_id=reservation_id,
+    )
+    db.session.add(event)
+    return event
+
+
+def join_seats(seats: Optional[List[int]]) -> Optional[str]:
+    return ",".join(str(seat) for seat in seats) if seats else None
+
+
+def split_seats(value: Optional[str]) -> Optional[List[int]]:
+    return [int(seat) for seat in value.split(",")] if value else None
+
+
+def release_id(event: OutboxEvent) -> str:
+    return f"reservation-outbox-{event.id}"
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        app: Flask,
+        client: ScheduleClient,
+        batch_size: int = 100,
+        interval: float = 1.0,
+        max_attempts: int = 12,
+        base_backoff: float = 1.0,
+        max_backoff: float = 300.0,
+    ) -> None:
+        self.app = app
+        self.client = client
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                delivered = self.run_once()
+            except Exception:
+                logger.exception("outbox dispatch failed")
+                delivered = 0
+            if delivered < self.batch_size:
+                # Drained: sleep until the next event or poll interval
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+    def run_once(self) -> int:
+        with self.app.app_context():
+            try:
+                return self._dispatch()
+            finally:
+                db.session.remove()
+
+    def _dispatch(self) -> int:
+        now = datetime.utcnow()
+        events: List[OutboxEvent] = (
+            OutboxEvent.query.filter(OutboxEvent.status == "PENDING", OutboxEvent.next_attempt_at <= now)
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not events:
+            db.session.rollback()
+            return 0
+
+        # One item per event: the schedule service merges them per trip and
+        # skips release ids it has already applied. A seat number repeated
+        # across events of the batch is sent once, or the merged list would
+        # be rejected and the whole batch retried until it fails
+        items: List[Dict[str, Any]] = []
+        released: Dict[int, Set[int]] = {}
+        for event in events:
+            item: Dict[str, Any] = {"trip_id": event.trip_id, "count": event.count, "release_id": release_id(event)}
+            if event.seat_numbers:
+                seen = released.setdefault(event.trip_id, set())
+                numbers = split_seats(event.seat_numbers)
+                fresh = [seat for seat in dict.fromkeys(numbers) if seat not in seen]
+                seen.update(fresh)
+                item["count"] -= len(numbers) - len(fresh)
+                if fresh:
+                    item["seats"] = fresh
+            if item["count"] > 0:
+                items.append(item)
+
+        error = None
+        try:
+            resp = self.client.release_batch(items)
+            if resp.status_code == 200:
+                for event in events:
+                    event.status = "DELIVERED"
+                    event.delivered_at = now
+                db.session.commit()
+                return len(events)
+            if resp.status_code == 404:
+                # Trips gone on the schedule side: park their events, the rest
+                # of the batch goes out on the next pass
+                missing = set((resp.json() or {}).get("trip_ids") or [])
+                if missing:
+                    for event in events:
+                        if event.trip_id in missing:
+                            event.status = "FAILED"
+                            event.last_error = "trip not found"
+                    db.session.commit()
+                    self._wake.set()
+                    return 0
+            error = f"release-batch returned {resp.status_code}"
+        except ScheduleUnavailable as exc:
+            error = str(exc) or "schedule service unavailable"
+
+        for event in events:
+            event.attempts += 1
+            event.last_error = error[:255]
+            if event.attempts >= self.max_attempts:
+                event.status = "FAILED"
+            else:
+                delay = min(self.max_backoff, self.base_backoff * (2 ** (event.attempts - 1)))
+                event.next_attempt_at = now + timedelta(seconds=delay)
+        db.session.commit()
+        return 0
+
+    def stats(self) -> Dict[str, int]:
+        with self.app.app_context():
+            rows = db.session.query(OutboxEvent.status, func.count()).group_by(OutboxEvent.status).all()
+            db.session.remove()
+        return {status: count for status, count in rows}
+
+
+def reconcile(client: ScheduleClient, trip_ids: Optional[List[int]] = None, recheck: bool = True) -> Dict[str, Any]:
+    # Seats the schedule service should consider taken by us: live bookings
+    # plus releases that are still waiting in the outbox.
+    booked_q = db.session.query(Reservation.trip_id, func.sum(Reservation.seats_booked)).filter(
+        Reservation.status == "BOOKED"
+    )
+    pending_q = db.session.query(OutboxEvent.trip_id, func.sum(OutboxEvent.count)).filter(
+        OutboxEvent.status == "PENDING"
+    )
+    if trip_ids:
+        booked_q = booked_q.filter(Reservation.trip_id.in_(trip_ids))
+        pending_q = pending_q.filter(OutboxEvent.trip_id.in_(trip_ids))
+    expected: Dict[int, int] = {}
+    for trip_id, seats in booked_q.group_by(Reservation.trip_id):
+        expected[trip_id] = expected.get(trip_id, 0) + int(seats or 0)
+    for trip_id, seats in pending_q.group_by(OutboxEvent.trip_id):
+        expected[trip_id] = expected.get(trip_id, 0) + int(seats or 0)
+    if trip_ids:
+        # Bookings of departed trips may have been archived
+        archived_q = (
+            db.session.query(ReservationArchive.trip_id, func.sum(ReservationArchive.seats_booked))
+            .filter(ReservationArchive.status == "BOOKED", ReservationArchive.trip_id.in_(trip_ids))
+            .group_by(ReservationArchive.trip_id)
+        )
+        for trip_id, seats in archived_q:
+            expected[trip_id] = expected.get(trip_id, 0) + int(seats or 0)
+    for trip_id in trip_ids or []:
+        expected.setdefault(trip_id, 0)
+
+    drift = []
+    missing: List[int] = []
+    ids = sorted(expected)
+    for start in range(0, len(ids), RECONCILE_CHUNK):
+        chunk = ids[start:start + RECONCILE_CHUNK]
+        resp = client.get_trips(chunk)
+        if resp.status_code != 200:
+            raise ScheduleUnavailable(f"GET /trips returned {resp.status_code}")
+        found = {trip["id"]: trip for trip in resp.json()}
+        for trip_id in chunk:
+            trip = found.get(trip_id)
+            if trip is None:
+                missing.append(trip_id)
+                continue
+            # Seats under an open hold are not ours until the hold is confirmed
+            allocated = trip["seats_total"] - trip["seats_available"] - trip.get("seats_held", 0)
+            if allocated != expected[trip_id]:
+                drift.append({
+                    "trip_id": trip_id,
+                    "expected_allocated": expected[trip_id],
+                    "schedule_allocated": allocated,
+                    "difference": allocated - expected[trip_id],
+                })
+    if drift and recheck:
+        # An event delivered between our two reads shows up as drift once;
+        # only report trips that still disagree on a second look
+        db.session.rollback()
+        drift = reconcile(client, [item["trip_id"] for item in drift], recheck=False)["drift"]
+    return {"trips_checked": len(ids), "drift": drift, "missing_trips": missing}
@@ -0,0 +1,69 @@
+from datetime import date
+from typing import List, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Monthly RANGE partitioning of archive tables (MySQL only; a no-op on other
+# databases). The schedule and reservation services carry identical copies
+# of this module.
+#
+# Partitions are named pYYYYMM and hold rows before the first day of the
+# following month; a trailing pmax partition catches everything later, so an
+# insert never fails when a month is missing. `ensure_month_partitions`
+# partitions the table on first use and afterwards splits new months out of
+# pmax, which is cheap while pmax is still empty. The partition column has
+# to be part of every unique key, hence the (id, <column>) primary keys of
+# the archive tables.
+
+
+def ensure_month_partitions(conn: Connection, table: str, column: str, first: date, months_ahead: int) -> int:
+    if conn.dialect.name != "mysql":
+        return 0
+    existing = _partition_names(conn, table)
+    today = date.today()
+    last = _add_months(date(today.year, today.month, 1), months_ahead)
+    months = []
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        if f"p{month:%Y%m}" not in existing:
+            months.append(month)
+        month = _add_months(month, 1)
+    if not months:
+        return 0
+    if not existing:
+        conn.execute(text(
+            f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS({column})) ({_definitions(months)})"
+        ))
+        return len(months)
+    # Only months after the newest partition can come out of pmax
+    newest = max(name for name in existing if name != "pmax")
+    months = [m for m in months if f"p{m:%Y%m}" > newest]
+    if months:
+        conn.execute(text(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({_definitions(months)})"))
+    return len(months)
+
+
+def _partition_names(conn: Connection, table: str) -> Set[str]:
+    rows = conn.execute(
+        text(
+            "SELECT partition_name FROM information_schema.partitions "
+            "WHERE table_schema = DATABASE() AND table_name = :table AND partition_name IS NOT NULL"
+        ),
+        {"table": table},
+    )
+    return {name for (name,) in rows}
+
+
+def _definitions(months: List[date]) -> str:
+    parts = [
+        f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_add_months(month, 1).isoformat()}'))"
+        for month in months
+    ]
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return ", ".join(parts)
+
+
+def _add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
@@ -0,0 +1,166 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ScheduleUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # closed -> open after `failure_threshold` consecutive failures; after
+    # `reset_timeout` one trial call is let through (half-open) and its outcome
+    # decides whether the circuit closes again.
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class ScheduleClient:
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = 20,
+        connect_timeout: float = 1.0,
+        read_timeout: float = 5.0,
+        retries: int = 2,
+        backoff: float = 0.1,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+        # observer(method, path, status, seconds), e.g. Metrics.observe_outbound
+        self.observer: Optional[Callable[[str, str, int, float], None]] = None
+        # Connect errors are always safe to retry; read errors only for GETs,
+        # since allocate/release are not idempotent.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=0,
+            backoff_factor=backoff,
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ScheduleClient":
+        return cls(
+            config["SCHEDULE_SERVICE_URL"],
+            pool_size=config["SCHEDULE_POOL_SIZE"],
+            connect_timeout=config["SCHEDULE_CONNECT_TIMEOUT"],
+            read_timeout=config["SCHEDULE_READ_TIMEOUT"],
+            retries=config["SCHEDULE_RETRIES"],
+            breaker=CircuitBreaker(config["SCHEDULE_BREAKER_THRESHOLD"], config["SCHEDULE_BREAKER_RESET"]),
+        )
+
+    def request(self, method: str, path: str, **kwargs: Any) -> requests.Response:
+        if not self.breaker.allow():
+            raise ScheduleUnavailable("circuit open")
+        started = time.perf_counter()
+        try:
+            resp = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as exc:
+            self.breaker.record_failure()
+            if self.observer is not None:
+                self.observer(method, path, 0, time.perf_counter() - started)
+            raise ScheduleUnavailable(str(exc)) from exc
+        if self.observer is not None:
+            self.observer(method, path, resp.status_code, time.perf_counter() - started)
+        if resp.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return resp
+
+    def search(self, origin: str, destination: str, date: str) -> requests.Response:
+        return self.request("GET", "/trips/search", params={"origin": origin, "destination": destination, "date": date})
+
+    def get_trips(self, trip_ids: List[int]) -> requests.Response:
+        return self.request("GET", "/trips", params={"ids": ",".join(str(t) for t in trip_ids)})
+
+    def allocate(
+        self, trip_id: int, count: int, seats: Optional[List[int]] = None, adjacent: bool = False
+    ) -> requests.Response:
+        payload: Dict[str, Any] = {"count": count}
+        if seats:
+            payload["seats"] = seats
+        if adjacent:
+            payload["adjacent"] = True
+        return self.request("POST", f"/trips/{trip_id}/allocate", json=payload)
+
+    def release(self, trip_id: int, count: int, seats: Optional[List[int]] = None) -> requests.Response:
+        payload: Dict[str, Any] = {"count": count}
+        if seats:
+            payload["seats"] = seats
+        return self.request("POST", f"/trips/{trip_id}/release", json=payload)
+
+    def hold(
+        self, trip_id: int, count: int, ttl_seconds: Optional[int] = None, owner: Optional[str] = None
+    ) -> requests.Response:
+        payload: Dict[str, Any] = {"count": count}
+        if ttl_seconds is not None:
+            payload["ttl_seconds"] = ttl_seconds
+        if owner is not None:
+            payload["owner"] = owner
+        return self.request("POST", f"/trips/{trip_id}/hold", json=payload)
+
+    def confirm_hold(self, hold_id: str, owner: Optional[str] = None) -> requests.Response:
+        return self.request("POST", f"/holds/{hold_id}/confirm", json={"owner": owner} if owner else None)
+
+    def release_hold(self, hold_id: str, owner: Optional[str] = None) -> requests.Response:
+        return self.request("POST", f"/holds/{hold_id}/release", json={"owner": owner} if owner else None)
+
+    def allocate_batch(self, items: List[Dict[str, Any]]) -> requests.Response:
+        return self.request("POST", "/trips/allocate-batch", json={"items": items})
+
+    def release_batch(self, items: List[Dict[str, Any]]) -> requests.Response:
+        return self.request("POST", "/trips/release-batch", json={"items": items})
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,86 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import Flask
+from sqlalchemy import text
+
+from models import db
+
+# Non-blocking startup. The schedule and reservation services carry identical
+# copies of this module.
+#
+# create_app never waits for the database: the engine connects lazily and
+# everything that needs a connection at startup (a first ping, recovering
+# in-memory state, starting background jobs) is queued here and run by one
+# thread, in order, retrying each step with exponential backoff and jitter
+# until it succeeds. /health/live only says the process is up;
+# /health/ready turns 200 once every step has run and the database answers.
+# Schema migrations and seeding are not startup steps: they run once per
+# deploy through `python manage.py migrate seed`.
+
+logger = logging.getLogger(__name__)
+
+
+def ping() -> None:
+    db.session.execute(text("SELECT 1"))
+
+
+class Startup:
+    def __init__(self, base_delay: float = 0.1, max_delay: float = 10.0) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.started = time.monotonic()
+        self.ready_after: Optional[float] = None
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        self._steps: List[Tuple[str, Callable[[], None]]] = [("database", ping)]
+        self._done: List[str] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, name: str, step: Callable[[], None]) -> None:
+        self._steps.append((name, step))
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+
+    def start(self, app: Flask) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,), name="startup", daemon=True)
+        self._thread.start()
+
+    def _run(self, app: Flask) -> None:
+        for name, step in self._steps:
+            delay = self.base_delay
+            while True:
+                self.attempts += 1
+                try:
+                    with app.app_context():
+                        try:
+                            step()
+                        finally:
+                            db.session.remove()
+                    break
+                except Exception as exc:
+                    self.last_error = f"{name}: {exc}"[:500]
+                    logger.warning("startup step %s failed, retrying in %.1fs: %s", name, delay, exc)
+                    time.sleep(delay * random.uniform(0.5, 1.0))
+                    delay = min(self.max_delay, delay * 2)
+            self._done.append(name)
+        self.ready_after = time.monotonic() - self.started
+        self.last_error = None
+        logger.info("ready in %.3fs", self.ready_after)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "ready": self.ready,
+            "startup_seconds": round(self.ready_after, 3) if self.ready_after is not None else None,
+            "uptime_seconds": round(time.monotonic() - self.started, 3),
+            "pending": [name for name, _step in self._steps if name not in self._done],
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,26 @@
+import os
+import sys
+from typing import Any, Dict, Tuple
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from loadtest import load_service  # noqa: E402
+
+# Services run in-process on throwaway SQLite files, without background jobs
+
+BASE_ENV = {"ARCHIVER": "0", "OUTBOX_DISPATCHER": "0", "STATS_COMPACTOR": "0"}
+
+
+def start_service(monkeypatch: Any, tmp_path: Any, service: str, env: Dict[str, str]) -> Tuple[Any, Any]:
+    for name, value in {**BASE_ENV, **env}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / (service + '.db')}?timeout=30")
+    module = load_service(service, {})
+    return module, module.create_app()
+
+
+@pytest.fixture
+def schedule(monkeypatch: Any, tmp_path: Any) -> Tuple[Any, Any]:
+    return start_service(monkeypatch, tmp_path, "bus_schedule_service", {})
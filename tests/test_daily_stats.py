@@ -0,0 +1,71 @@
+import threading
+
+from sqlalchemy import event
+
+
+def stats_row(module, app, route_id, day):
+    with app.app_context():
+        row = module.db.session.get(module.RouteDayStats, (route_id, day))
+        values = (row.trip_count, row.seats_total, row.seats_available, row.min_seats_available)
+        module.db.session.remove()
+    return values
+
+
+def create_route(client):
+    return client.post("/routes", json={"origin": "Goa", "destination": "Pune"}).get_json()["id"]
+
+
+def test_concurrent_first_trips_of_a_day(schedule):
+    module, app = schedule
+    client = app.test_client()
+    route_id = create_route(client)
+    barrier = threading.Barrier(2)
+    statuses = []
+
+    def create(hour, seats):
+        barrier.wait()
+        resp = app.test_client().post(
+            "/trips",
+            json={"route_id": route_id, "departure_time": f"2030-01-01T{hour:02d}:00:00", "seats_total": seats},
+        )
+        statuses.append(resp.status_code)
+
+    threads = [threading.Thread(target=create, args=(8, 10)), threading.Thread(target=create, args=(9, 20))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert statuses == [201, 201]
+    day = module.datetime(2030, 1, 1).date()
+    assert stats_row(module, app, route_id, day) == (2, 30, 30, 10)
+
+
+def test_day_row_inserted_by_another_writer_meanwhile(schedule):
+    # The other writer commits the day's row after ours found it missing
+    module, app = schedule
+    client = app.test_client()
+    route_id = create_route(client)
+    with app.app_context():
+        engine = module.db.engine
+    injected = []
+
+    def other_writer(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO route_day_stats") and not injected:
+            injected.append(statement)
+            cursor.execute(
+                "INSERT INTO route_day_stats (route_id, day, trip_count, seats_total, seats_available,"
+                " min_seats_available, version) VALUES (?, '2030-01-01', 1, 10, 4, 4, 0)",
+                (route_id,),
+            )
+
+    event.listen(engine, "before_cursor_execute", other_writer)
+    try:
+        resp = client.post(
+            "/trips", json={"route_id": route_id, "departure_time": "2030-01-01T09:00:00", "seats_total": 20}
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", other_writer)
+    assert injected
+    assert resp.status_code == 201
+    day = module.datetime(2030, 1, 1).date()
+    assert stats_row(module, app, route_id, day) == (2, 30, 24, 4)
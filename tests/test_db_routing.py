@@ -0,0 +1,30 @@
+import shutil
+
+from conftest import start_service
+
+
+def route_names(resp):
+    return {route["origin"] for route in resp.get_json()}
+
+
+def test_pin_reaches_other_workers_through_header(monkeypatch, tmp_path):
+    # Two workers share the primary; the replica is a copy that never catches up
+    _module, first = start_service(monkeypatch, tmp_path, "bus_schedule_service", {})
+    replica = tmp_path / "replica.db"
+    shutil.copy(tmp_path / "bus_schedule_service.db", replica)
+    env = {"DATABASE_REPLICA_URLS": f"sqlite:///{replica}", "SKIP_BOOTSTRAP": "1"}
+    _module, writer = start_service(monkeypatch, tmp_path, "bus_schedule_service", env)
+    _module, reader = start_service(monkeypatch, tmp_path, "bus_schedule_service", env)
+
+    resp = writer.test_client().post("/routes", json={"origin": "Lagpur", "destination": "Pune"})
+    assert resp.status_code == 201
+    pin = resp.headers.get("X-DB-Primary-Until")
+    assert pin
+    assert "X-DB-Primary-Until" in resp.headers.get("Access-Control-Expose-Headers", "")
+
+    # A cross-origin client sends no cookies, only the echoed header
+    client = reader.test_client(use_cookies=False)
+    assert "Lagpur" not in route_names(client.get("/routes"))
+    assert "Lagpur" in route_names(client.get("/routes", headers={"X-DB-Primary-Until": pin}))
+    # A made-up far-future value does not pin the client
+    assert "Lagpur" not in route_names(client.get("/routes", headers={"X-DB-Primary-Until": str(10**12)}))
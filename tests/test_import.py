@@ -0,0 +1,32 @@
+import json
+
+
+def import_ndjson(client, entity, records):
+    body = "\n".join(json.dumps(record) for record in records)
+    return client.post(f"/import?entity={entity}", data=body, content_type="application/x-ndjson")
+
+
+def test_trip_import_rejects_non_string_origin(schedule):
+    module, app = schedule
+    client = app.test_client()
+    resp = import_ndjson(client, "trips", [
+        {"origin": ["x"], "destination": "Pune", "departure_time": "2030-01-01T08:00:00", "seats_total": 10},
+        {"origin": "Goa", "destination": {"a": 1}, "departure_time": "2030-01-01T09:00:00", "seats_total": 10},
+        {"origin": "Goa", "destination": "Pune", "departure_time": "2030-01-01T10:00:00", "seats_total": 10},
+    ])
+    result = resp.get_json()
+    assert result["created"] == 1
+    assert [error["line"] for error in result["errors"]] == [1, 2]
+    with app.app_context():
+        assert [(r.origin, r.destination) for r in module.Route.query.filter(module.Route.origin.in_(["['x']", "Goa"]))] == [
+            ("Goa", "Pune")
+        ]
+
+
+def test_route_import_rejects_non_string_origin(schedule):
+    module, app = schedule
+    client = app.test_client()
+    result = import_ndjson(client, "routes", [{"origin": 7, "destination": "Pune"}]).get_json()
+    assert result["error_count"] == 1
+    with app.app_context():
+        assert module.Route.query.filter_by(origin="7").count() == 0